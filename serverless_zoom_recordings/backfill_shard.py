@@ -0,0 +1,226 @@
+"""
+Work through one shard of a historical backfill: start an ingest for each of
+a Zoom user's recordings in one month.
+
+Progress is checkpointed in S3 so a shard that runs low on time can return
+and be invoked again by the step function where it left off.
+"""
+import os
+import time
+from datetime import date
+
+import boto3
+import structlog
+from zoomus import ZoomClient
+
+from .util.backfill import (
+    Pacer,
+    checkpoint_key,
+    count_done,
+    job_progress,
+    mark_done,
+    month_ranges,
+    read_json,
+    shard_id,
+    write_json,
+)
+from .util.catalog import RecordingCatalog
+from .util.codec import dumps, loads
+from .util.identifiers import base64_to_uuid, parse_organization
+from .util.log_config import setup_logging
+from .util.profiling import profiled
+
+DEPLOYMENT_STAGE = os.environ["DEPLOYMENT_STAGE"]
+RECORDINGS_BUCKET = os.environ["RECORDINGS_BUCKET"]
+ZOOM_API_KEY = os.environ["ZOOM_API_KEY"]
+ZOOM_API_SECRET = os.environ["ZOOM_API_SECRET"]
+ZOOM_ACCOUNT_ID = os.environ["ZOOM_ACCOUNT_ID"]
+INVOKE_STEPFUNCTION_ARN = os.environ["INVOKE_STEPFUNCTION_ARN"]
+MEETINGS_DYNAMODB_TABLE = os.environ["MEETINGS_DYNAMODB_TABLE"]
+# Stop and checkpoint when less than this much of the Lambda timeout is left
+BACKFILL_TIME_MARGIN = int(os.environ.get("BACKFILL_TIME_MARGIN", "60"))
+
+s3_client = boto3.client("s3")
+lambda_client = boto3.client("lambda")
+dynamodb = boto3.resource("dynamodb")
+meetings_table = dynamodb.Table(MEETINGS_DYNAMODB_TABLE)
+catalog = RecordingCatalog(meetings_table)
+zoom_client = ZoomClient(ZOOM_API_KEY, ZOOM_API_SECRET, ZOOM_ACCOUNT_ID)
+
+
+@profiled
+def handler(sf_input, context):
+    """
+    Expected keys in the sf_input dictionary:
+        * job: the job parameters output by plan_backfill
+        * shard: a shard output by plan_backfill, with `user_id` and `month`
+    """
+    setup_logging()
+    log = structlog.get_logger()
+    aws_request_id = context.aws_request_id if context is not None else "*NO CONTEXT*"
+
+    log = structlog.get_logger()
+    log = log.bind(aws_request_id=aws_request_id)
+
+    if "job" in sf_input and "shard" in sf_input:
+        job, shard = sf_input["job"], sf_input["shard"]
+        shard_name = shard_id(shard["user_id"], shard["month"])
+        log = log.bind(job_id=job["job_id"], shard_id=shard_name)
+        log.info("STARTED", reason=shard_name, stepfunction_input=sf_input)
+    else:
+        log.error(
+            "STARTUP FAILED PRECONDITION",
+            reason="job or shard not found in step function input",
+            stepfunction_input=sf_input,
+        )
+        raise RuntimeError("job or shard not found in step function input")
+    sf_output = {"job": job, "shard": shard, "complete": False}
+
+    ##STAGE Read checkpoint
+    stage = "Read checkpoint"
+    key = checkpoint_key(job["job_id"], shard_name)
+    checkpoint = read_json(s3_client, RECORDINGS_BUCKET, key) or {
+        "page_token": "",
+        "page_offset": 0,
+        "meetings_seen": 0,
+        "executions_started": 0,
+        "meetings_skipped": 0,
+        "invocations": 0,
+        "complete": False,
+    }
+    if checkpoint["complete"]:
+        log.info(stage, reason="Shard already complete", checkpoint=checkpoint)
+        sf_output["complete"] = True
+        return sf_output
+    checkpoint["invocations"] += 1
+    log.info(stage, reason="Resuming shard", checkpoint=checkpoint)
+
+    ##STAGE Start ingests
+    stage = "Start ingests"
+    _, first_day, last_day = next(
+        month_range
+        for month_range in month_ranges(
+            date.fromisoformat(job["from"]), date.fromisoformat(job["to"])
+        )
+        if month_range[0] == shard["month"]
+    )
+    zoom_client.refresh_token()
+    pacer = Pacer(job["start_interval"])
+    started = time.monotonic()
+    started_before = checkpoint["executions_started"]
+    paced = 0.0
+
+    def time_is_short():
+        return (
+            context is not None
+            and context.get_remaining_time_in_millis() < BACKFILL_TIME_MARGIN * 1000
+        )
+
+    try:
+        while not checkpoint["complete"] and not time_is_short():
+            meetings, next_page_token = list_recordings(
+                stage, shard["user_id"], first_day, last_day, checkpoint, log
+            )
+            for meeting in meetings[checkpoint["page_offset"] :]:
+                if time_is_short():
+                    break
+                if want_meeting(meeting, job):
+                    paced += pacer.wait()
+                    start_ingest(stage, meeting, log)
+                    checkpoint["executions_started"] += 1
+                else:
+                    checkpoint["meetings_skipped"] += 1
+                checkpoint["meetings_seen"] += 1
+                checkpoint["page_offset"] += 1
+            if checkpoint["page_offset"] < len(meetings):
+                # Out of time part-way through the page
+                break
+            checkpoint["page_token"] = next_page_token
+            checkpoint["page_offset"] = 0
+            checkpoint["complete"] = not next_page_token
+            write_json(s3_client, RECORDINGS_BUCKET, key, checkpoint)
+    finally:
+        write_json(s3_client, RECORDINGS_BUCKET, key, checkpoint)
+
+    ##STAGE Report progress
+    stage = "Report progress"
+    elapsed = time.monotonic() - started
+    executions = checkpoint["executions_started"] - started_before
+    if checkpoint["complete"]:
+        mark_done(s3_client, RECORDINGS_BUCKET, job["job_id"], shard_name)
+    progress = job_progress(
+        job, count_done(s3_client, RECORDINGS_BUCKET, job["job_id"])
+    )
+    log.info(
+        stage,
+        reason="Shard complete" if checkpoint["complete"] else "Shard checkpointed",
+        checkpoint=checkpoint,
+        executions_started=executions,
+        executions_per_second=round(executions / elapsed, 3) if elapsed else 0.0,
+        seconds_paced=round(paced, 1),
+        **progress,
+    )
+
+    sf_output["complete"] = checkpoint["complete"]
+    return sf_output
+
+
+def list_recordings(stage, user_id, first_day, last_day, checkpoint, log):
+    """Fetch the page of a user's recordings the checkpoint points at."""
+    api_params = {
+        "user_id": user_id,
+        "page_size": 300,
+        "from": first_day.isoformat(),
+        "to": last_day.isoformat(),
+    }
+    if checkpoint["page_token"]:
+        api_params["next_page_token"] = checkpoint["page_token"]
+    log.debug(stage, reason="Calling Zoom list recordings API", api_params=api_params)
+    api_params["access_token"] = zoom_client.config["token"]
+    api_response = zoom_client.recording.list(**api_params)
+    api_content = loads(api_response.content)
+    if not api_response.ok:
+        reason = api_content["message"] if "message" in api_content else "unknown"
+        log.error(stage, reason=reason, response=api_response.content)
+        raise RuntimeError(f"Retrieve Zoom recordings failed: {reason}")
+    return api_content.get("meetings", []), api_content.get("next_page_token", "")
+
+
+def want_meeting(meeting, job):
+    """Should the backfill ingest this meeting's recordings?"""
+    if job.get("organization") and (
+        parse_organization(meeting["topic"]) != job["organization"]
+    ):
+        return False
+    recording_id = base64_to_uuid(meeting["uuid"])
+    return catalog.get(recording_id, attributes=["recording_id"]) is None
+
+
+def start_ingest(stage, meeting, log):
+    """Hand a meeting to `invoke_stepfunction`, as a webhook would."""
+    meeting_uuid = base64_to_uuid(meeting["uuid"])
+    body = {
+        "payload": {
+            "object": meeting,
+        },
+        "_recording_id": meeting_uuid,
+        "download_token": zoom_client.config["token"],
+    }
+    log.debug(
+        stage,
+        reason="Calling lambda",
+        detail={"FunctionName": INVOKE_STEPFUNCTION_ARN},
+        body=body,
+    )
+    lambda_response = lambda_client.invoke(
+        FunctionName=INVOKE_STEPFUNCTION_ARN,
+        InvocationType="RequestResponse",
+        Payload=dumps(body),
+    )
+    result = loads(lambda_response["Payload"].read() or b"null")
+    if lambda_response.get("FunctionError") or (
+        isinstance(result, dict) and int(result.get("statusCode", 200)) >= 300
+    ):
+        log.error(stage, reason="Ingest not started", detail=result)
+        raise RuntimeError(f"Ingest of {meeting_uuid} not started: {result}")
+    log.info(stage, reason="Ingest started", recording_id=meeting_uuid)
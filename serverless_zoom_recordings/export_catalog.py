@@ -0,0 +1,84 @@
+"""
+Merge the recording change log into the catalog snapshot.
+
+Runs on a schedule.  Invoke with `{"rebuild": true}` to rebuild the snapshot
+from a full scan of the meetings table.
+"""
+import os
+from datetime import datetime, timezone
+
+import boto3
+import structlog
+
+from .util.catalog_snapshot import (
+    delete_changes,
+    list_changes,
+    merge_changes,
+    read_snapshot,
+    scan_recordings,
+    write_snapshot,
+)
+from .util.log_config import setup_logging
+from .util.profiling import profiled
+
+DEPLOYMENT_STAGE = os.environ["DEPLOYMENT_STAGE"]
+RECORDINGS_BUCKET = os.environ["RECORDINGS_BUCKET"]
+MEETINGS_DYNAMODB_TABLE = os.environ["MEETINGS_DYNAMODB_TABLE"]
+
+s3_client = boto3.client("s3")
+dynamodb = boto3.resource("dynamodb")
+meetings_table = dynamodb.Table(MEETINGS_DYNAMODB_TABLE)
+
+
+@profiled
+def handler(event, context):
+    """Handle scheduled event"""
+    setup_logging()
+    log = structlog.get_logger()
+    aws_request_id = context.aws_request_id if context is not None else "*NO CONTEXT*"
+    log = log.bind(aws_request_id=aws_request_id)
+    rebuild = isinstance(event, dict) and bool(event.get("rebuild"))
+    log.info("STARTED", reason="Rebuild" if rebuild else "Merge", detail=event)
+
+    ##STAGE Load snapshot
+    stage = "Load snapshot"
+    # Changes are listed first: anything written after the listing is in
+    # the scan or waits for the next export, and is never deleted unmerged.
+    change_keys = list_changes(s3_client, RECORDINGS_BUCKET)
+    recordings = None if rebuild else read_snapshot(s3_client, RECORDINGS_BUCKET)
+    source = "snapshot"
+    if recordings is None:
+        source = "scan"
+        recordings = scan_recordings(meetings_table)
+    log.info(stage, reason=f"Loaded from {source}", recordings=len(recordings))
+
+    ##STAGE Merge changes
+    stage = "Merge changes"
+    if not change_keys and source == "snapshot":
+        log.info(stage, reason="No changes since the last export")
+        return {"source": source, "changes": 0}
+    replaced = merge_changes(recordings, s3_client, RECORDINGS_BUCKET, change_keys)
+    log.info(
+        stage, reason="Changes merged", changes=len(change_keys), replaced=replaced
+    )
+
+    ##STAGE Write snapshot
+    stage = "Write snapshot"
+    state = write_snapshot(
+        s3_client,
+        RECORDINGS_BUCKET,
+        recordings,
+        {
+            "exported_at": datetime.now(timezone.utc).isoformat(),
+            "source": source,
+            "changes": len(change_keys),
+        },
+    )
+    log.info(stage, reason="Snapshot written", state=state)
+
+    ##STAGE Delete merged changes
+    stage = "Delete merged changes"
+    delete_changes(s3_client, RECORDINGS_BUCKET, change_keys)
+    log.debug(stage, reason="Changes deleted", changes=len(change_keys))
+
+    return {"source": source, "changes": len(change_keys), "rows": state["rows"]}
@@ -0,0 +1,101 @@
+"""
+Rewrite a retrieved MP4 or M4A recording so playback can start before the
+whole file is downloaded.
+
+Runs after `retrieve_recording` for each file, taking its output as input.
+"""
+import os
+
+import boto3
+import structlog
+
+from .util.codec import document_args
+from .util.log_config import setup_logging
+from .util.mp4_faststart import write_faststart
+from .util.profiling import profiled
+from .util.tracing import traced
+
+DEPLOYMENT_STAGE = os.environ["DEPLOYMENT_STAGE"]
+RECORDINGS_BUCKET = os.environ["RECORDINGS_BUCKET"]
+FASTSTART_ENABLED = os.environ.get("FASTSTART_ENABLED", "false").lower() == "true"
+FASTSTART_MIME_TYPES = ("video/mp4", "audio/m4a")
+
+s3 = boto3.resource("s3")
+s3_client = boto3.client("s3")
+
+
+@profiled
+@traced
+def handler(sf_input, context):
+    """
+    Expected keys in the sf_input dictionary, as output by retrieve_recording:
+        * _recording_id
+        * recording_type
+        * extension
+        * mime_type
+        * eTag
+    """
+    setup_logging()
+    log = structlog.get_logger()
+    aws_request_id = context.aws_request_id if context is not None else "*NO CONTEXT*"
+
+    log = structlog.get_logger()
+    log = log.bind(aws_request_id=aws_request_id)
+
+    if "_recording_id" in sf_input and "recording_type" in sf_input:
+        recording_id = sf_input["_recording_id"]
+        log = log.bind(recording_id=recording_id)
+        log = log.bind(recording_type=sf_input["recording_type"])
+        log.info("STARTED", reason=recording_id, stepfunction_input=sf_input)
+    else:
+        log.error(
+            "STARTUP FAILED PRECONDITION",
+            reason="_recording_id not found in step function input",
+            stepfunction_input=sf_input,
+        )
+        raise RuntimeError("_recording_id not found in step function input")
+    sf_output = dict(sf_input)
+
+    ##STAGE Relocate moov atom
+    stage = "Relocate moov atom"
+    if not FASTSTART_ENABLED:
+        log.info(stage, reason="Faststart not enabled in this deployment")
+        return sf_output
+    if sf_input["mime_type"] not in FASTSTART_MIME_TYPES:
+        log.info(stage, reason="Not an MP4 file", mime_type=sf_input["mime_type"])
+        return sf_output
+    if "faststart" in sf_input:
+        log.info(stage, reason="Already rewritten", faststart=sf_input["faststart"])
+        return sf_output
+
+    s3_key = f"{recording_id}/{sf_input['recording_type']}.{sf_input['extension']}"
+    head = s3_client.head_object(Bucket=RECORDINGS_BUCKET, Key=s3_key)
+    result = write_faststart(
+        s3_client,
+        RECORDINGS_BUCKET,
+        s3_key,
+        etag=head["ETag"],
+        file_size=head["ContentLength"],
+        extra_args={"ContentType": sf_input["mime_type"]},
+    )
+    if result is None:
+        sf_output["faststart"] = {"relocated": False}
+        log.info(stage, reason="moov atom already at the front")
+    else:
+        sf_output["faststart"] = {
+            "relocated": True,
+            "moov_size": result["MoovSize"],
+            "original_eTag": sf_input["eTag"],
+        }
+        sf_output["eTag"] = result["ETag"].strip('"')
+        sf_output["s3_file_size"] = result["Size"]
+        log.info(stage, reason="moov atom relocated", faststart=sf_output["faststart"])
+
+    ##STAGE Update file metadata
+    stage = "Update file metadata"
+    metadata_key = f"{recording_id}/{sf_input['recording_type']}.json"
+    s3_object = s3.Object(RECORDINGS_BUCKET, metadata_key)
+    response = s3_object.put(**document_args(sf_output))
+    log.debug(stage, reason="Put file metadata", response=response)
+
+    return sf_output
@@ -2,16 +2,23 @@
 Perform the final actions of the ingestion step function.
 
 """
-import json
 import os
 
 import boto3
 import structlog
+from botocore.exceptions import ClientError
 from zoomus import ZoomClient
 
+from .util.catalog_snapshot import record_change
+from .util.codec import document_args, dumps_str, loads
+from .util.document_update import update_recording_document
 from .util.identifiers import parse_organization
 from .util.log_config import setup_logging
+from .util.manifests import update_manifests
+from .util.metadata_store import bundle_key, make_bundle, put_tagged_documents
+from .util.profiling import profiled
 from .util.recording_path import recording_path
+from .util.tracing import message_attributes, traced
 
 DEPLOYMENT_STAGE = os.environ["DEPLOYMENT_STAGE"]
 RECORDINGS_BUCKET = os.environ["RECORDINGS_BUCKET"]
@@ -21,7 +28,6 @@ ZOOM_ACCOUNT_ID = os.environ["ZOOM_ACCOUNT_ID"]
 MEETINGS_DYNAMODB_TABLE = os.environ["MEETINGS_DYNAMODB_TABLE"]
 NOTIFY_WEB_BUILDER_QUEUE = os.environ["NOTIFY_WEB_BUILDER_QUEUE"]
 
-s3 = boto3.resource("s3")
 s3_client = boto3.client("s3")
 dynamodb = boto3.resource("dynamodb")
 meetings_table = dynamodb.Table(MEETINGS_DYNAMODB_TABLE)
@@ -31,6 +37,8 @@ web_builder_notify = sqs.Queue(NOTIFY_WEB_BUILDER_QUEUE)
 zoom_client = ZoomClient(ZOOM_API_KEY, ZOOM_API_SECRET, ZOOM_ACCOUNT_ID)
 
 
+@profiled
+@traced
 def handler(sf_input, context):
     """Handle Step Function"""
     setup_logging()
@@ -85,17 +93,83 @@ def handler(sf_input, context):
             "zoom_file_size": file["zoom_file_size"],
             "mime_type": file["mime_type"],
         }
+        if "faststart" in file:
+            file_data["faststart"] = file["faststart"]
         recording_document["files"].append(file_data)
+    recording_document["skipped_files"] = sf_input.get("skipped_recordings", [])
     log.info(stage, reason="Recording document", recording_document=recording_document)
-    recording_json_key = f"{recording_id}/recording_document.json"
-    s3_object = s3.Object(RECORDINGS_BUCKET, recording_json_key)
-    response = s3_object.put(
-        Body=json.dumps(recording_document), ContentType="application/json"
-    )
-    log.debug(stage, reason="Put recording document to S3", response=response)
 
-    response = meetings_table.put_item(Item=recording_document)
-    log.debug(stage, reason="Put recording document to DB", response=response)
+    # Only the fields that differ from the stored document are written, so a
+    # re-ingest keeps fields added to the document since.
+    update = update_recording_document(
+        meetings_table, s3_client, RECORDINGS_BUCKET, recording_document, log=log
+    )
+    previous_document = update["previous"]
+    recording_document = update["document"]
+    log.debug(stage, reason="Updated recording document", changed=update["changed"])
+
+    # The metadata bundle gathers every document of the recording.
+    bundle_documents = {
+        "recording.json": sf_input["recording_metadata"],
+        "past_meeting.json": sf_input["past_meeting_metadata"],
+        "meeting.json": sf_input["parent_meeting_metadata"],
+        "recording_document.json": recording_document,
+    }
+    # Retrieval starts before the parent meeting is known, so the file
+    # documents get its details here, in the bundle and in their own objects.
+    parent_meeting = {
+        "zoom_parent_meeting_id": sf_input["parent_meeting_metadata"]["id"],
+        "zoom_parent_meeting_topic": sf_input["parent_meeting_metadata"]["topic"],
+        "zoom_parent_meeting_password": sf_input["parent_meeting_metadata"].get(
+            "password", ""
+        ),
+    }
+    file_documents = {
+        f"{file['recording_type']}.json": dict(file, **parent_meeting)
+        for file in sf_input["recordings_map_results"]
+    }
+    bundle_documents.update(file_documents)
+    response = s3_client.put_object(
+        Bucket=RECORDINGS_BUCKET,
+        Key=bundle_key(recording_id),
+        **document_args(make_bundle(recording_id, bundle_documents)),
+    )
+    log.debug(stage, reason="Put metadata bundle to S3", response=response)
+
+    ##STAGE Record catalog change
+    stage = "Record catalog change"
+    if update["changed"] or update["removed"]:
+        try:
+            change = record_change(s3_client, RECORDINGS_BUCKET, recording_document)
+        except ClientError as error:
+            # The document is stored; a catalog rebuild picks it up
+            log.warning(stage, reason="Change not recorded", error=repr(error))
+        else:
+            log.debug(stage, reason="Change recorded", key=change)
+
+    ##STAGE Complete and tag file metadata
+    stage = "Complete and tag file metadata"
+    responses = put_tagged_documents(
+        s3_client,
+        RECORDINGS_BUCKET,
+        {
+            f"{recording_id}/{name}": document
+            for name, document in file_documents.items()
+        },
+        {"Purpose": f"recording-site-{organization}"},
+    )
+    log.debug(stage, reason="Put tagged file metadata", responses=responses)
+
+    ##STAGE Update listing manifests
+    stage = "Update listing manifests"
+    manifests = update_manifests(
+        s3_client,
+        RECORDINGS_BUCKET,
+        recording_document,
+        previous_document=previous_document,
+        log=log,
+    )
+    log.debug(stage, reason="Manifests updated", manifests=manifests)
 
     ##STAGE Delete recording from Zoom
     stage = "Delete recording from Zoom"
@@ -103,7 +177,7 @@ def handler(sf_input, context):
         api_response = zoom_client.recording.delete(
             meeting_id=sf_input["recording_metadata"]["payload"]["object"]["uuid"]
         )
-        api_content = json.loads(api_response.content) if api_response.content else {}
+        api_content = loads(api_response.content) if api_response.content else {}
         if not api_response.ok:
             reason = api_content["message"] if "message" in api_content else "unknown"
             log.warning(
@@ -125,7 +199,8 @@ def handler(sf_input, context):
     ##STAGE Send message to website builder routine
     stage = "Notify web-builder"
     response = web_builder_notify.send_message(
-        MessageBody=json.dumps(recording_document)
+        MessageBody=dumps_str(recording_document),
+        MessageAttributes=message_attributes(),
     )
     log.info(stage, reason="Complete", response=response, body=recording_document)
 
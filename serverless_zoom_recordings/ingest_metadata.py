@@ -1,14 +1,17 @@
 """
 Ingest metadata into S3 and DynamoDB
 """
-import json
 import os
+import time
 
 import boto3
 import structlog
 from zoomus import ZoomClient
 
+from .util.codec import document_args, loads
 from .util.log_config import setup_logging
+from .util.profiling import profiled
+from .util.tracing import TRACE_FIELD, trace_context, traced
 
 DEPLOYMENT_STAGE = os.environ["DEPLOYMENT_STAGE"]
 RECORDINGS_BUCKET = os.environ["RECORDINGS_BUCKET"]
@@ -16,11 +19,18 @@ ZOOM_API_KEY = os.environ["ZOOM_API_KEY"]
 ZOOM_API_SECRET = os.environ["ZOOM_API_SECRET"]
 ZOOM_ACCOUNT_ID = os.environ["ZOOM_ACCOUNT_ID"]
 
+# Throttled (429) and failed (5xx) Zoom API calls are retried, waiting as
+# long as Zoom's Retry-After header asks, up to ZOOM_API_MAX_WAIT seconds
+ZOOM_API_ATTEMPTS = 5
+ZOOM_API_MAX_WAIT = 60
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
 
 s3 = boto3.resource("s3")
 zoom_client = ZoomClient(ZOOM_API_KEY, ZOOM_API_SECRET, ZOOM_ACCOUNT_ID)
 
 
+@profiled
+@traced
 def handler(sf_input, context):
     """Handle event"""
     setup_logging()
@@ -42,14 +52,28 @@ def handler(sf_input, context):
         )
         raise RuntimeError("_recording_id not found in step function input")
     sf_output = {"_recording_id": recording_id}
-
+    if "_profile" in sf_input:
+        sf_output["_profile"] = sf_input["_profile"]
+    sf_output[TRACE_FIELD] = trace_context()
+
+    # `invoke_stepfunction` adds the retrieval input to the webhook; the
+    # retrieval branch of the step function handles it.
+    sf_output["recording_metadata"] = {
+        key: value
+        for key, value in sf_input.items()
+        if key not in ("recordings_map_input", "skipped_recordings", TRACE_FIELD)
+    }
+    sf_output["skipped_recordings"] = sf_input.get("skipped_recordings", [])
+
+    # The per-document keys are kept for readers outside this stack, such as
+    # the web builder; finish_ingest adds these documents to the metadata
+    # bundle.
     ##STAGE Store recording details in S3
     stage = "Store recording details"
     recording_json_key = f"{recording_id}/recording.json"
     s3_object = s3.Object(RECORDINGS_BUCKET, recording_json_key)
-    response = s3_object.put(Body=json.dumps(sf_input), ContentType="application/json")
+    response = s3_object.put(**document_args(sf_output["recording_metadata"]))
     log.debug(stage, reason="Put recording event details", response=response)
-    sf_output["recording_metadata"] = sf_input
 
     ##STAGE Get past meeting metadata from Zoom, store in S3 folder
     sf_output["past_meeting_metadata"] = retrieve_zoom_metadata(
@@ -69,54 +93,6 @@ def handler(sf_input, context):
         log=log,
     )
 
-    ##STAGE Prepare parallel recording retrieval
-    stage = "Prepare recordings array"
-    download_token = sf_input["download_token"]
-    sf_output["recordings_map_input"] = []
-    for recording in sf_input["payload"]["object"]["recording_files"]:
-        recording_metadata = {
-            "recording_type": recording["recording_type"],
-            "download_url": recording["download_url"],
-            "zoom_file_id": recording["id"],
-            "zoom_meeting_id": recording["meeting_id"],
-            "zoom_parent_meeting_id": sf_output["parent_meeting_metadata"]["id"],
-            "zoom_parent_meeting_topic": sf_output["parent_meeting_metadata"]["topic"],
-            "zoom_parent_meeting_password": sf_output["parent_meeting_metadata"][
-                "password"
-            ],
-            "zoom_file_size": recording["file_size"],
-            "recording_start": recording["recording_start"],
-            "recording_end": recording["recording_end"],
-            "download_token": download_token,
-            "_recording_id": recording_id,
-        }
-        if recording["file_type"] == "M4A":
-            recording_metadata["mime_type"] = "audio/m4a"
-            recording_metadata["extension"] = "m4a"
-        elif recording["file_type"] == "MP4":
-            recording_metadata["mime_type"] = "video/mp4"
-            recording_metadata["extension"] = "mp4"
-        elif recording["file_type"] == "TIMELINE":
-            recording_metadata["mime_type"] = "text/vtt"
-            recording_metadata["extension"] = "vtt"
-        elif recording["file_type"] == "TRANSCRIPT":
-            recording_metadata["mime_type"] = "text/vtt"
-            recording_metadata["extension"] = "vtt"
-        elif recording["file_type"] == "CHAT":
-            recording_metadata["mime_type"] = "text/plain"
-            recording_metadata["extension"] = "txt"
-        elif recording["file_type"] == "CC":
-            recording_metadata["mime_type"] = "text/vtt"
-            recording_metadata["extension"] = "vtt"
-        elif recording["file_type"] == "CSV":
-            recording_metadata["mime_type"] = "text/csv"
-            recording_metadata["extension"] = "csv"
-        else:
-            recording_metadata["mime_type"] = "application/octet-stream"
-        sf_output["recordings_map_input"].append(recording_metadata)
-        sf_output["recordings_map_results"] = []
-    log.info(stage, reason="Recordings", recordings=sf_output["recordings_map_input"])
-
     return sf_output
 
 
@@ -124,28 +100,62 @@ def retrieve_zoom_metadata(
     stage=None, zoom_api=None, file_key=None, log=None, **attributes
 ):
     """General function to retrieve metadata from various Zoom endpoints."""
-    if "id" in attributes:
-        api_response = zoom_api(id=attributes["id"])
-    elif "meeting_id" in attributes:
-        api_response = zoom_api(meeting_id=attributes["meeting_id"])
-    log.debug(
-        stage,
-        reason="Received Zoom",
-        response=api_response,
-        response_content=api_response.content,
-    )
-    api_content = json.loads(api_response.content)
+    for attempt in range(1, ZOOM_API_ATTEMPTS + 1):
+        if "id" in attributes:
+            api_response = zoom_api(id=attributes["id"])
+        elif "meeting_id" in attributes:
+            api_response = zoom_api(meeting_id=attributes["meeting_id"])
+        log.debug(
+            stage,
+            reason="Received Zoom",
+            response=api_response,
+            response_content=api_response.content,
+        )
+        if (
+            api_response.status_code not in RETRY_STATUS_CODES
+            or attempt == ZOOM_API_ATTEMPTS
+        ):
+            break
+        wait = retry_wait(api_response, attempt)
+        log.warning(
+            stage,
+            reason="Retrying Zoom",
+            status_code=api_response.status_code,
+            attempt=attempt,
+            wait=wait,
+        )
+        time.sleep(wait)
+
     if not api_response.ok:
-        reason = api_content["message"] if "message" in api_content else "unknown"
+        try:
+            reason = loads(api_response.content).get("message", "unknown")
+        except ValueError:
+            # Error pages from Zoom's front end aren't JSON
+            reason = f"HTTP {api_response.status_code}"
         log.error(stage, reason=reason, response=api_response.content)
         raise RuntimeError(f"Retrieve Zoom meeting details failed: {reason}")
+    api_content = loads(api_response.content)
 
     if file_key:
         s3_object = s3.Object(RECORDINGS_BUCKET, file_key)
-        response = s3_object.put(
-            Body=json.dumps(api_content), ContentType="application/json"
-        )
+        response = s3_object.put(**document_args(api_content))
         log.debug(stage, reason="Put meeting details", response=response)
         log.info(stage, reason="Meeting details", details=api_content)
 
     return api_content
+
+
+def retry_wait(api_response, attempt):
+    """Seconds to wait before retrying a throttled or failed Zoom API call.
+
+    :param api_response: `requests.Response`, The failed call
+    :param attempt: int, Number of the failed attempt, from 1
+
+    :returns: float, The Retry-After delay if Zoom gave one in seconds,
+        otherwise an exponential backoff, at most `ZOOM_API_MAX_WAIT`
+    """
+    try:
+        wait = float(api_response.headers.get("Retry-After", ""))
+    except ValueError:
+        wait = 2**attempt
+    return min(max(wait, 0.0), ZOOM_API_MAX_WAIT)
@@ -1,7 +1,6 @@
 """
 Given a Zoom recording event, start the Step Function
 """
-import json
 import os
 import time
 
@@ -10,9 +9,14 @@ import structlog
 from botocore.exceptions import ClientError
 from zoomus import ZoomClient
 
+from .util.codec import dumps_str
 from .util.httpapi_helpers import httpapi_response
-from .util.identifiers import base64_to_uuid
+from .util.identifiers import base64_to_uuid, parse_organization
 from .util.log_config import setup_logging
+from .util.profiling import profiled
+from .util.recording_files import recordings_map_input
+from .util.rendition_policy import load_policy, resolve_rule, select_renditions
+from .util.tracing import TRACE_FIELD, annotate, trace_context, trace_header, traced
 
 DEPLOYMENT_STAGE = os.environ["DEPLOYMENT_STAGE"]
 BASE_PATH = os.environ["BASE_PATH"]
@@ -21,11 +25,14 @@ ZOOM_API_KEY = os.environ["ZOOM_API_KEY"]
 ZOOM_API_SECRET = os.environ["ZOOM_API_SECRET"]
 ZOOM_ACCOUNT_ID = os.environ["ZOOM_ACCOUNT_ID"]
 STEP_FUNCTION = os.environ["INGEST_ZOOM_RECORDING_STEP_MACHINE"]
+RENDITION_POLICY = load_policy(os.environ.get("RENDITION_POLICY", ""))
 
 stepfunction_client = boto3.client("stepfunctions")
 zoom_client = ZoomClient(ZOOM_API_KEY, ZOOM_API_SECRET, ZOOM_ACCOUNT_ID)
 
 
+@profiled
+@traced
 def handler(event, context):
     """Handle Zoom recording completed webhook event"""
     setup_logging()
@@ -59,14 +66,39 @@ def handler(event, context):
     stage = "Invoke step function"
     meeting_uuid = base64_to_uuid(event["payload"]["object"]["uuid"])
     event["_recording_id"] = meeting_uuid
+    event[TRACE_FIELD] = trace_context()
+    annotate(recording_id=meeting_uuid)
+
+    # Retrieval starts from the webhook's file list while the metadata stage
+    # runs, so the rendition policy is applied to the webhook's topic.
+    meeting = event["payload"]["object"]
+    rendition_rule = resolve_rule(
+        RENDITION_POLICY, parse_organization(meeting["topic"]), meeting["topic"]
+    )
+    recording_files, event["skipped_recordings"] = select_renditions(
+        meeting["recording_files"], rendition_rule
+    )
+    log.info(
+        stage,
+        reason="Renditions selected",
+        rule=rendition_rule,
+        skipped=event["skipped_recordings"],
+    )
+    event["recordings_map_input"] = recordings_map_input(
+        recording_files,
+        meeting_uuid,
+        event["download_token"],
+        profile=event.get("_profile"),
+        trace=event[TRACE_FIELD],
+    )
     unique_invocation_name = f"{meeting_uuid}-{time.time()}"
 
     try:
         response = stepfunction_client.start_execution(
             stateMachineArn=STEP_FUNCTION,
             name=f"{DEPLOYMENT_STAGE}-{unique_invocation_name}",
-            input=json.dumps(event),
-            traceHeader=aws_request_id,
+            input=dumps_str(event),
+            traceHeader=trace_header(),
         )
     except ClientError as ex:
         log.error(stage, reason=ex.response["Error"]["Code"], response=ex.response)
@@ -0,0 +1,127 @@
+"""
+Plan a historical backfill: split a date range into per-user, per-month shards.
+
+Runs as the first state of the backfill step function; the shards are
+worked through in parallel by `backfill_shard`.
+"""
+import os
+from datetime import date, datetime, timezone
+
+import boto3
+import structlog
+from zoomus import ZoomClient
+
+from .util.backfill import job_key, month_ranges, read_json, write_json
+from .util.codec import loads
+from .util.log_config import setup_logging
+from .util.profiling import profiled
+
+DEPLOYMENT_STAGE = os.environ["DEPLOYMENT_STAGE"]
+RECORDINGS_BUCKET = os.environ["RECORDINGS_BUCKET"]
+ZOOM_API_KEY = os.environ["ZOOM_API_KEY"]
+ZOOM_API_SECRET = os.environ["ZOOM_API_SECRET"]
+ZOOM_ACCOUNT_ID = os.environ["ZOOM_ACCOUNT_ID"]
+BACKFILL_CONCURRENCY = int(os.environ.get("BACKFILL_CONCURRENCY", "4"))
+BACKFILL_START_RATE = float(os.environ.get("BACKFILL_START_RATE", "0.5"))
+
+s3_client = boto3.client("s3")
+zoom_client = ZoomClient(ZOOM_API_KEY, ZOOM_API_SECRET, ZOOM_ACCOUNT_ID)
+
+
+@profiled
+def handler(sf_input, context):
+    """
+    Expected keys in the sf_input dictionary:
+        * job_id: the step function execution name
+        * request: the step function input, with
+            * job_id: optional identifier of an earlier job to resume
+            * from: first day to backfill, `YYYY-MM-DD`
+            * to: last day to backfill, `YYYY-MM-DD` (default: today)
+            * users: optional list of Zoom user ids or emails
+            * organization: optional organization whose recordings to backfill
+            * start_rate: optional ingest executions started per second
+    """
+    setup_logging()
+    log = structlog.get_logger()
+    aws_request_id = context.aws_request_id if context is not None else "*NO CONTEXT*"
+
+    log = structlog.get_logger()
+    log = log.bind(aws_request_id=aws_request_id)
+
+    request = sf_input.get("request", {})
+    if "job_id" in sf_input and "from" in request:
+        job_id = request.get("job_id", sf_input["job_id"])
+        log = log.bind(job_id=job_id)
+        log.info("STARTED", reason=job_id, stepfunction_input=sf_input)
+    else:
+        log.error(
+            "STARTUP FAILED PRECONDITION",
+            reason="job_id or request.from not found in step function input",
+            stepfunction_input=sf_input,
+        )
+        raise RuntimeError("job_id or request.from not found in step function input")
+
+    start = date.fromisoformat(request["from"])
+    end = date.fromisoformat(request["to"]) if request.get("to") else date.today()
+    if end < start:
+        raise RuntimeError(f"Backfill range ends before it starts: {start} to {end}")
+
+    ##STAGE List users
+    stage = "List users"
+    users = list_users(stage, log)
+    wanted = set(request.get("users", []))
+    if wanted:
+        users = [u for u in users if u["id"] in wanted or u.get("email") in wanted]
+        missing = wanted - {u["id"] for u in users} - {u.get("email") for u in users}
+        if missing:
+            log.warning(stage, reason="Users not found", users=sorted(missing))
+    log.info(stage, reason="Users to backfill", users=len(users))
+
+    ##STAGE Plan shards
+    stage = "Plan shards"
+    months = month_ranges(start, end)
+    shards = [
+        {"user_id": user["id"], "month": month}
+        for user in users
+        for month, _, _ in months
+    ]
+    start_rate = float(request.get("start_rate", BACKFILL_START_RATE))
+    earlier_job = read_json(s3_client, RECORDINGS_BUCKET, job_key(job_id)) or {}
+    job = {
+        "job_id": job_id,
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "organization": request.get("organization"),
+        "start_rate": start_rate,
+        "concurrency": BACKFILL_CONCURRENCY,
+        "start_interval": BACKFILL_CONCURRENCY / start_rate,
+        "shard_count": len(shards),
+        "started": earlier_job.get("started", datetime.now(timezone.utc).isoformat()),
+    }
+    write_json(s3_client, RECORDINGS_BUCKET, job_key(job_id), job)
+    log.info(
+        stage,
+        reason="Resuming job" if earlier_job else "Shards planned",
+        job=job,
+        months=len(months),
+    )
+
+    return {"job": job, "shards": shards}
+
+
+def list_users(stage, log):
+    """List every active Zoom user, following `next_page_token`."""
+    users = []
+    api_params = {"status": "active", "page_size": 300}
+    while True:
+        log.debug(stage, reason="Calling Zoom list users API", api_params=api_params)
+        api_response = zoom_client.user.list(**api_params)
+        api_content = loads(api_response.content)
+        if not api_response.ok:
+            reason = api_content["message"] if "message" in api_content else "unknown"
+            log.error(stage, reason=reason, response=api_response.content)
+            raise RuntimeError(f"Retrieve Zoom users failed: {reason}")
+        users.extend(api_content["users"])
+        if not api_content.get("next_page_token"):
+            return users
+        api_params["next_page_token"] = api_content["next_page_token"]
@@ -2,20 +2,25 @@
 Perform the final actions of the ingestion step function.
 
 """
-import json
 import os
 
 import boto3
 import structlog
+from botocore.exceptions import ClientError
 
+from .util.catalog_snapshot import record_change
+from .util.codec import dumps_str
+from .util.document_update import update_recording_document
 from .util.log_config import setup_logging
+from .util.manifests import update_manifests
+from .util.profiling import profiled
+from .util.tracing import message_attributes, traced
 
 DEPLOYMENT_STAGE = os.environ["DEPLOYMENT_STAGE"]
 RECORDINGS_BUCKET = os.environ["RECORDINGS_BUCKET"]
 MEETINGS_DYNAMODB_TABLE = os.environ["MEETINGS_DYNAMODB_TABLE"]
 NOTIFY_WEB_BUILDER_QUEUE = os.environ["NOTIFY_WEB_BUILDER_QUEUE"]
 
-s3 = boto3.resource("s3")
 s3_client = boto3.client("s3")
 dynamodb = boto3.resource("dynamodb")
 meetings_table = dynamodb.Table(MEETINGS_DYNAMODB_TABLE)
@@ -23,6 +28,8 @@ sqs = boto3.resource("sqs")
 web_builder_notify = sqs.Queue(NOTIFY_WEB_BUILDER_QUEUE)
 
 
+@profiled
+@traced
 def handler(recording_document, context):
     """Handle Step Function"""
     setup_logging()
@@ -71,22 +78,54 @@ def handler(recording_document, context):
 
     ##STAGE Store document
     stage = "Store Document"
-    recording_json_key = f"{recording_id}/recording_document.json"
-    s3_object = s3.Object(RECORDINGS_BUCKET, recording_json_key)
-    response = s3_object.put(
-        Body=json.dumps(recording_document), ContentType="application/json"
+    # The document replaces the stored one: fields deleted from it are removed
+    update = update_recording_document(
+        meetings_table,
+        s3_client,
+        RECORDINGS_BUCKET,
+        recording_document,
+        remove_missing=True,
+        log=log,
     )
-    log.info(stage, reason="Put recording document to S3", response=response)
-    fn_output["s3_object_put_response"] = response
+    previous_document = update["previous"]
+    recording_document = update["document"]
+    log.info(
+        stage,
+        reason="Updated recording document",
+        changed=update["changed"],
+        removed=update["removed"],
+        attempts=update["attempts"],
+    )
+    fn_output["changed_fields"] = update["changed"]
+    fn_output["removed_fields"] = update["removed"]
+
+    ##STAGE Record catalog change
+    stage = "Record catalog change"
+    if update["changed"] or update["removed"]:
+        try:
+            change = record_change(s3_client, RECORDINGS_BUCKET, recording_document)
+        except ClientError as error:
+            # The document is stored; a catalog rebuild picks it up
+            log.warning(stage, reason="Change not recorded", error=repr(error))
+        else:
+            log.debug(stage, reason="Change recorded", key=change)
 
-    response = meetings_table.put_item(Item=recording_document)
-    log.info(stage, reason="Put recording document to DB", response=response)
-    fn_output["dyamodb_put_item_response"] = response
+    ##STAGE Update listing manifests
+    stage = "Update listing manifests"
+    fn_output["manifests"] = update_manifests(
+        s3_client,
+        RECORDINGS_BUCKET,
+        recording_document,
+        previous_document=previous_document,
+        log=log,
+    )
+    log.info(stage, reason="Manifests updated", manifests=fn_output["manifests"])
 
     ##STAGE Send message to website builder routine
     stage = "Notify web-builder"
     response = web_builder_notify.send_message(
-        MessageBody=json.dumps(recording_document)
+        MessageBody=dumps_str(recording_document),
+        MessageAttributes=message_attributes(),
     )
     log.info(stage, reason="Complete", response=response, body=recording_document)
     fn_output["sqs_send_message_response"] = response
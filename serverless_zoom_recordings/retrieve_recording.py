@@ -3,29 +3,45 @@ Copy recording from Zoom to S3 bucket.
 
 This work is based heavily on [Python program to stream data from a URL and write it to S3](https://amalgjose.com/2020/08/13/python-program-to-stream-data-from-a-url-and-write-it-to-s3/) from Amal G Jose.
 """
-import http.client as http_client
-import json
-import logging
 import os
 import urllib
+from contextlib import nullcontext
 
 import boto3
 import requests
 import structlog
 from botocore.exceptions import ClientError
-from requests.adapters import HTTPAdapter
 from requests.models import PreparedRequest
-from urllib3 import Retry
 
-from .util.identifiers import parse_organization
+from .util.codec import document_args, read_document
+from .util.download_governor import DownloadGovernor
 from .util.log_config import setup_logging
+from .util.profiling import profiled
+from .util.tracing import traced
+from .util.streaming import IncompleteTransfer, ThrottledReader, stream_to_s3
+from .util.transport import pooled_session, s3_transfer_config, wire_debug
 
 DEPLOYMENT_STAGE = os.environ["DEPLOYMENT_STAGE"]
 RECORDINGS_BUCKET = os.environ["RECORDINGS_BUCKET"]
-CHUNK_SIZE = 5 * 1024 * 1024
+TRANSFER_PART_SIZE = int(os.environ.get("TRANSFER_PART_SIZE_MB", "8")) * 1024 * 1024
+TRANSFER_BUFFER_COUNT = int(os.environ.get("TRANSFER_BUFFER_COUNT", "3"))
+DOWNLOAD_LEASE_TABLE = os.environ.get("DOWNLOAD_LEASE_TABLE", "")
+DOWNLOAD_CONCURRENCY = int(os.environ.get("DOWNLOAD_CONCURRENCY", "10"))
+DOWNLOAD_LEASE_MAX_WAIT = int(os.environ.get("DOWNLOAD_LEASE_MAX_WAIT", "240"))
+# Zoom download bandwidth shared by all concurrent downloads; 0 is unlimited
+DOWNLOAD_BANDWIDTH = (
+    float(os.environ.get("DOWNLOAD_BANDWIDTH_MB_PER_SECOND", "0")) * 1024 * 1024
+)
 
 s3 = boto3.resource("s3")
-s3_client = boto3.client("s3")
+s3_client = boto3.client("s3", config=s3_transfer_config(TRANSFER_BUFFER_COUNT))
+download_governor = None
+if DOWNLOAD_LEASE_TABLE:
+    download_governor = DownloadGovernor(
+        boto3.resource("dynamodb").Table(DOWNLOAD_LEASE_TABLE),
+        DOWNLOAD_CONCURRENCY,
+        max_wait=DOWNLOAD_LEASE_MAX_WAIT,
+    )
 
 
 def prepped_request_dict(prepped, encoding=None):
@@ -43,11 +59,12 @@ def prepped_request_dict(prepped, encoding=None):
     return request_dict
 
 
+@profiled
+@traced
 def handler(sf_input, context):
     """
     Expected keys in the sf_input dictionary to retrieve recording file. (Other
     keys may be present and are copied to the JSON metadata for each retrieved file.)
-        * zoom_parent_meeting_topic
         * recording_type
         * extension
         * download_url
@@ -76,13 +93,21 @@ def handler(sf_input, context):
         raise RuntimeError("_recording_id not found in step function input")
     sf_output = {"_recording_id": recording_id}
 
-    requests_log = logging.getLogger("requests.packages.urllib3")
-    requests_log.propagate = True
+    file_extension = f".{sf_input['extension']}" if "extension" in sf_input else ""
+    s3_key = f"{sf_input['_recording_id']}/{sf_input['recording_type']}{file_extension}"
+    metadata_key = f"{sf_input['_recording_id']}/{sf_input['recording_type']}.json"
+
+    ##STAGE Check for earlier transfer
+    stage = "Check for earlier transfer"
+    earlier_output = earlier_transfer(s3_key, metadata_key, sf_input)
+    if earlier_output:
+        earlier_output.update(sf_input)
+        log.info(stage, reason="File already in S3", details=earlier_output)
+        return earlier_output
+    log.debug(stage, reason="File not yet in S3", s3_key=s3_key)
 
     ##STAGE File transfer
     stage = "File transfer"
-    file_extension = f".{sf_input['extension']}" if "extension" in sf_input else ""
-    s3_key = f"{sf_input['_recording_id']}/{sf_input['recording_type']}{file_extension}"
     req = PreparedRequest()
     req.prepare_url(
         sf_input["download_url"], {"access_token": sf_input["download_token"]}
@@ -98,23 +123,16 @@ def handler(sf_input, context):
     )
 
     # url = f"{sf_input['download_url']}?access_token={sf_input['download_token']}"
-    zoom_session = requests.Session()
-    adapter = HTTPAdapter(
-        max_retries=Retry(
-            total=4,
-            backoff_factor=1,
-            allowed_methods=None,
-            status_forcelist=[429, 500, 502, 503, 504],
-        )
-    )
-    zoom_session.mount("http://", adapter)
-    zoom_session.mount("https://", adapter)
-    s3_object = s3.Object(RECORDINGS_BUCKET, s3_key)
-
-    # We're turning on some extra logging here because upload_fileobj() is an async function
-    requests_log.setLevel(logging.DEBUG)
-    http_client.HTTPConnection.debuglevel = 1
-    with zoom_session.get(req.url, stream=True, timeout=10) as zoom_response:
+    zoom_session = pooled_session()
+
+    # Wait for one of the download slots shared by every execution
+    download_slot = nullcontext()
+    if download_governor:
+        download_slot = download_governor.lease(aws_request_id, log=log)
+    # Wire logging is scoped to the transfer, which runs in worker threads
+    with download_slot, wire_debug(), zoom_session.get(
+        req.url, stream=True, timeout=10
+    ) as zoom_response:
         zoom_response.raise_for_status()
         log.debug(
             stage,
@@ -122,30 +140,34 @@ def handler(sf_input, context):
             response_headers=zoom_response.headers,
         )
 
-        with zoom_response as part:
-            part.raw.decode_content = True
-            s3_transfer_conf = boto3.s3.transfer.TransferConfig(
-                multipart_threshold=10000, max_concurrency=4
-            )
-            s3_client.upload_fileobj(
-                part.raw,
-                Bucket=RECORDINGS_BUCKET,
-                Key=s3_key,
-                Config=s3_transfer_conf,
-                ExtraArgs={"ContentType": sf_input["mime_type"]},
-            )
-
+        # Stream the body through a fixed pool of part buffers so memory use
+        # doesn't grow with the file size.
+        zoom_response.raw.decode_content = True
+        source = zoom_response.raw
+        if DOWNLOAD_BANDWIDTH:
+            source = ThrottledReader(source, DOWNLOAD_BANDWIDTH / DOWNLOAD_CONCURRENCY)
         try:
-            s3_object.wait_until_exists()
+            expected_size = expected_transfer_size(zoom_response.headers, sf_input)
+            transfer = stream_to_s3(
+                source,
+                s3_client,
+                RECORDINGS_BUCKET,
+                s3_key,
+                part_size=TRANSFER_PART_SIZE,
+                buffer_count=TRANSFER_BUFFER_COUNT,
+                extra_args={"ContentType": sf_input["mime_type"]},
+                expected_size=expected_size,
+                log=log,
+            )
         except ClientError as error:
-            log.error(stage, reason="AWS s3.upload_fileobj() error", details=error)
+            log.error(stage, reason="AWS S3 streaming upload error", details=error)
+            raise error
+        except IncompleteTransfer as error:
+            log.error(stage, reason="Incomplete download from Zoom", details=str(error))
             raise error
 
-        # Turning off extra logging
-        requests_log.setLevel(logging.WARN)
-        http_client.HTTPConnection.debuglevel = 0
-
-        sf_output["eTag"] = s3_object.e_tag.strip('"')
+        sf_output["eTag"] = transfer["ETag"].strip('"')
+        sf_output["s3_file_size"] = transfer["Size"]
         sf_output[
             "location"
         ] = f"""https://{RECORDINGS_BUCKET}.s3.amazonaws.com/{urllib.parse.quote(s3_key, safe="~()*!.'")}"""
@@ -153,13 +175,73 @@ def handler(sf_input, context):
     log.info(stage, reason="File uploaded", details=sf_output)
     sf_output.update(sf_input)
 
-    metadata_key = f"{sf_input['_recording_id']}/{sf_input['recording_type']}.json"
     s3_object = s3.Object(RECORDINGS_BUCKET, metadata_key)
-    response = s3_object.put(
-        Body=json.dumps(sf_output),
-        ContentType="application/json",
-        Tagging=f"Purpose=recording-site-{parse_organization(sf_input['zoom_parent_meeting_topic'])}",
-    )
+    response = s3_object.put(**document_args(sf_output))
     log.debug(stage, reason="Put file metadata", response=response)
 
     return sf_output
+
+
+def expected_transfer_size(response_headers, sf_input):
+    """Work out how long the Zoom download must be.
+
+    :param response_headers: Headers of the Zoom download response
+    :param sf_input: dict, Step function input for this file
+
+    :returns: int, Size in bytes, or None if neither Zoom's listing nor the
+        response says
+    :raises IncompleteTransfer: if the listing and the response disagree
+    """
+    expected_size = sf_input.get("zoom_file_size")
+    content_length = response_headers.get("Content-Length")
+    # With a Content-Encoding, Content-Length is the encoded size
+    if content_length is None or response_headers.get("Content-Encoding"):
+        return expected_size
+    if expected_size is None:
+        return int(content_length)
+    if int(content_length) != expected_size:
+        raise IncompleteTransfer(
+            f"Zoom is sending {content_length} bytes, but listed {expected_size}"
+        )
+    return expected_size
+
+
+def earlier_transfer(s3_key, metadata_key, sf_input):
+    """Find the output of an earlier, complete transfer of the same file.
+
+    A transfer is complete when its metadata document was written, the S3
+    object still has the ETag recorded there, and the object is as large as
+    Zoom lists the file (or, once rewritten by `faststart_recording`, as
+    its output).  The Zoom file ID and size must match the file being
+    requested.  The size the earlier run recorded isn't trusted on its own:
+    a download cut short used to be recorded with its short size.
+
+    :param s3_key: string, Key of the recording file
+    :param metadata_key: string, Key of the file's metadata document
+    :param sf_input: dict, Step function input for this file
+
+    :returns: dict, Earlier step function output, or None
+    """
+    try:
+        head = s3_client.head_object(Bucket=RECORDINGS_BUCKET, Key=s3_key)
+        metadata = s3_client.get_object(Bucket=RECORDINGS_BUCKET, Key=metadata_key)
+    except ClientError as error:
+        if error.response["Error"]["Code"] in ("404", "NoSuchKey"):
+            return None
+        raise
+    earlier_output = read_document(metadata)
+
+    if earlier_output.get("zoom_file_id") != sf_input.get("zoom_file_id"):
+        return None
+    if earlier_output.get("zoom_file_size") != sf_input.get("zoom_file_size"):
+        return None
+    expected_size = sf_input.get("zoom_file_size")
+    if (earlier_output.get("faststart") or {}).get("relocated"):
+        # The moov atom that faststart moved is at the end of a Zoom file, so
+        # the download it rewrote was complete.
+        expected_size = earlier_output.get("s3_file_size")
+    if expected_size is None or head["ContentLength"] != expected_size:
+        return None
+    if head["ETag"].strip('"') != earlier_output.get("eTag"):
+        return None
+    return earlier_output
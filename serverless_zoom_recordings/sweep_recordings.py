@@ -1,7 +1,6 @@
 """
 Ingest metadata into S3 and DynamoDB
 """
-import json
 import os
 from datetime import datetime
 
@@ -10,8 +9,10 @@ import structlog
 from dateutil.relativedelta import relativedelta
 from zoomus import ZoomClient
 
+from .util.codec import dumps, loads
 from .util.identifiers import base64_to_uuid
 from .util.log_config import setup_logging
+from .util.profiling import profiled
 
 DEPLOYMENT_STAGE = os.environ["DEPLOYMENT_STAGE"]
 ZOOM_API_KEY = os.environ["ZOOM_API_KEY"]
@@ -24,6 +25,7 @@ stepfunction_client = boto3.client("stepfunctions")
 zoom_client = ZoomClient(ZOOM_API_KEY, ZOOM_API_SECRET, ZOOM_ACCOUNT_ID)
 
 
+@profiled
 def handler(event, context):
     """Scan all Zoom accounts for stray recordings"""
     setup_logging()
@@ -47,7 +49,7 @@ def handler(event, context):
         response=api_response,
         response_content=api_response.content,
     )
-    api_content = json.loads(api_response.content)
+    api_content = loads(api_response.content)
     if not api_response.ok:
         reason = api_content["message"] if "message" in api_content else "unknown"
         log.error(stage, reason=reason, response=api_response.content)
@@ -76,7 +78,7 @@ def handler(event, context):
             response=api_response,
             response_content=api_response.content,
         )
-        api_content = json.loads(api_response.content)
+        api_content = loads(api_response.content)
         if not api_response.ok:
             reason = api_content["message"] if "message" in api_content else "unknown"
             log.error(stage, reason=reason, response=api_response.content)
@@ -105,6 +107,6 @@ def handler(event, context):
                 FunctionName=INVOKE_STEPFUNCTION_ARN,
                 InvocationType="RequestResponse",
                 LogType="Tail",
-                Payload=json.dumps(body),
+                Payload=dumps(body),
             )
             log.info(stage, reason="Call completed", detail=lambda_response)
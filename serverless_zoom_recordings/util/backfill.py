@@ -0,0 +1,153 @@
+"""
+Shards, checkpoints and pacing for historical backfill jobs.
+
+A backfill job covers a date range.  `plan_backfill` splits it into one
+shard per Zoom user per calendar month (the Zoom list-recordings API only
+accepts ranges of up to a month), and `backfill_shard` works through each
+shard's pages of recordings.  Progress is kept in S3 under
+`_backfill/{job_id}/`:
+
+* `job.json`: the job parameters and shard count
+* `shards/{shard_id}.json`: the shard checkpoint, updated as it progresses
+* `done/{shard_id}`: an empty marker written when the shard is complete
+
+A shard that runs out of time returns with `complete` unset and is invoked
+again by the state machine, resuming from its checkpoint.
+"""
+import time
+from datetime import date, datetime, timezone
+
+from botocore.exceptions import ClientError
+
+from .codec import document_args, read_document
+
+BACKFILL_PREFIX = "_backfill"
+
+
+def month_ranges(start, end):
+    """Split a date range into calendar-month ranges.
+
+    :param start: date, First day of the range
+    :param end: date, Last day of the range (inclusive)
+
+    :returns: list, `(month, first_day, last_day)` tuples, where `month` is
+        a `YYYY-MM` string and the days are clipped to the range
+    """
+    ranges = []
+    month_start = date(start.year, start.month, 1)
+    while month_start <= end:
+        if month_start.month == 12:
+            next_month = date(month_start.year + 1, 1, 1)
+        else:
+            next_month = date(month_start.year, month_start.month + 1, 1)
+        ranges.append(
+            (
+                month_start.strftime("%Y-%m"),
+                max(start, month_start),
+                min(end, date.fromordinal(next_month.toordinal() - 1)),
+            )
+        )
+        month_start = next_month
+    return ranges
+
+
+def shard_id(user_id, month):
+    """Construct the identifier of a shard.
+
+    :param user_id: string, Zoom user identifier
+    :param month: string, `YYYY-MM`
+
+    :returns: string, Shard identifier
+    """
+    return f"{user_id}-{month}"
+
+
+def job_key(job_id):
+    return f"{BACKFILL_PREFIX}/{job_id}/job.json"
+
+
+def checkpoint_key(job_id, shard):
+    return f"{BACKFILL_PREFIX}/{job_id}/shards/{shard}.json"
+
+
+def done_prefix(job_id):
+    return f"{BACKFILL_PREFIX}/{job_id}/done/"
+
+
+def read_json(s3_client, bucket, key):
+    """Read a JSON document, or ``None`` if it doesn't exist."""
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=key)
+    except ClientError as error:
+        if error.response["Error"]["Code"] == "NoSuchKey":
+            return None
+        raise
+    return read_document(response)
+
+
+def write_json(s3_client, bucket, key, document):
+    return s3_client.put_object(Bucket=bucket, Key=key, **document_args(document))
+
+
+def mark_done(s3_client, bucket, job_id, shard):
+    return s3_client.put_object(Bucket=bucket, Key=f"{done_prefix(job_id)}{shard}")
+
+
+def count_done(s3_client, bucket, job_id):
+    """Count the completed shards of a job.
+
+    :returns: integer, Number of `done/` markers
+    """
+    paginator = s3_client.get_paginator("list_objects_v2")
+    return sum(
+        page.get("KeyCount", 0)
+        for page in paginator.paginate(Bucket=bucket, Prefix=done_prefix(job_id))
+    )
+
+
+def job_progress(job, shards_done, now=None):
+    """Summarize how far a job has got and how long the rest will take.
+
+    :param job: dict, Job parameters as written to `job.json`
+    :param shards_done: integer, Completed shards
+    :param now: datetime, Current time (default: now)
+
+    :returns: dict, Progress summary
+    """
+    now = now or datetime.now(timezone.utc)
+    elapsed = (now - datetime.fromisoformat(job["started"])).total_seconds()
+    remaining = max(0, job["shard_count"] - shards_done)
+    rate = shards_done / elapsed if elapsed > 0 else 0.0
+    return {
+        "shards_done": shards_done,
+        "shards_remaining": remaining,
+        "shards_per_hour": round(rate * 3600, 1),
+        "eta_seconds": round(remaining / rate) if rate else None,
+    }
+
+
+class Pacer:
+    """
+    Space out calls to keep under a start rate.
+
+    Every concurrent shard worker paces itself to the job's start rate
+    divided by the Map state's concurrency, which keeps the job as a whole
+    under the start rate.
+
+    :param interval: Minimum seconds between calls
+    """
+
+    def __init__(self, interval):
+        self._interval = interval
+        self._next = time.monotonic()
+
+    def wait(self):
+        """Sleep until the next call is allowed.
+
+        :returns: float, Seconds slept
+        """
+        delay = max(0.0, self._next - time.monotonic())
+        if delay:
+            time.sleep(delay)
+        self._next = max(self._next, time.monotonic()) + self._interval
+        return delay
@@ -0,0 +1,213 @@
+"""
+Read recording documents from the meetings table.
+
+The secondary indexes of the meetings table each project a different set of
+attributes (see `serverless.yml`).  `RecordingCatalog` queries the cheapest
+index for a question, paginates through the results, and fetches any
+requested attributes the index doesn't project with a follow-up
+`BatchGetItem`.  Results can be kept in an in-container cache so warm
+invocations don't repeat identical queries.
+"""
+import random
+import time
+
+from boto3.dynamodb.conditions import Attr, Key
+
+TABLE_KEY = "recording_id"
+BATCH_GET_LIMIT = 100
+
+# Attributes available from each index: the table key, the index key, and
+# the index's NonKeyAttributes.
+INDEX_PROJECTIONS = {
+    "organization-index": {
+        "recording_id",
+        "organization",
+        "meeting_id",
+        "meeting_topic",
+    },
+    "meeting-index": {"recording_id", "meeting_topic", "recording_path", "start_time"},
+    "path-index": {"recording_id", "recording_path", "password"},
+}
+
+
+class RecordingCatalog:
+    """
+    Query access to recording documents in the meetings table.
+
+    Every query returns a generator of recording documents.  With
+    ``attributes`` unset, the documents are complete; otherwise they contain
+    (at most) the named attributes plus ``recording_id``.
+
+    :param table: boto3 DynamoDB ``Table`` resource for the meetings table
+    :param cache_ttl: Seconds to keep query results in memory; ``None``
+        disables the cache.
+    """
+
+    def __init__(self, table, cache_ttl=None):
+        self._table = table
+        self._cache_ttl = cache_ttl
+        self._cache = {}
+
+    def get(self, recording_id, attributes=None):
+        """Retrieve one recording document, or ``None`` if it doesn't exist."""
+        response = self._table.get_item(
+            Key={TABLE_KEY: recording_id}, **_projection(attributes)
+        )
+        return response.get("Item")
+
+    def scan(self, attributes=None):
+        """Every recording in the table, in no particular order."""
+        return self._scan(None, attributes)
+
+    def by_organization(self, organization, attributes=None):
+        """Recordings of an organization, e.g. ``"FOLIO"``."""
+        return self._cached(
+            ("organization", organization),
+            attributes,
+            lambda: self._query(
+                "organization-index",
+                Key("organization").eq(organization),
+                attributes,
+            ),
+        )
+
+    def by_topic(self, meeting_topic, attributes=None):
+        """Recordings of a meeting topic, as spelled by Zoom."""
+        return self._cached(
+            ("topic", meeting_topic),
+            attributes,
+            lambda: self._query(
+                "meeting-index", Key("meeting_topic").eq(meeting_topic), attributes
+            ),
+        )
+
+    def by_path(self, recording_path, attributes=None):
+        """Recordings at a full `recording_path`."""
+        return self._cached(
+            ("path", recording_path),
+            attributes,
+            lambda: self._query(
+                "path-index", Key("recording_path").eq(recording_path), attributes
+            ),
+        )
+
+    def by_time_range(self, start, end, organization=None, attributes=None):
+        """Recordings that started between two ISO timestamps (inclusive).
+
+        With an organization, the organization index is queried and the
+        start times are filtered after the follow-up fetch; without one,
+        the table is scanned with a server-side filter.
+        """
+
+        def in_range(item):
+            return start <= item.get("start_time", "") <= end
+
+        if organization:
+            wanted = None if attributes is None else set(attributes) | {"start_time"}
+
+            def fetch():
+                for item in self._query(
+                    "organization-index", Key("organization").eq(organization), wanted
+                ):
+                    if in_range(item):
+                        yield _select(item, attributes)
+
+        else:
+
+            def fetch():
+                yield from self._scan(
+                    Attr("start_time").between(start, end), attributes
+                )
+
+        return self._cached(("time", start, end, organization), attributes, fetch)
+
+    def clear_cache(self):
+        """Forget all cached query results."""
+        self._cache.clear()
+
+    def _cached(self, cache_key, attributes, fetch):
+        if not self._cache_ttl:
+            return fetch()
+        cache_key = cache_key + (
+            None if attributes is None else tuple(sorted(attributes)),
+        )
+        now = time.monotonic()
+        hit = self._cache.get(cache_key)
+        if hit and hit[0] > now:
+            return iter(hit[1])
+        items = list(fetch())
+        self._cache[cache_key] = (now + self._cache_ttl, items)
+        return iter(items)
+
+    def _query(self, index_name, key_condition, attributes):
+        projected = INDEX_PROJECTIONS[index_name]
+        query_args = {"IndexName": index_name, "KeyConditionExpression": key_condition}
+        if attributes is not None and set(attributes) <= projected:
+            yield from (
+                _select(item, attributes)
+                for item in _paginate(self._table.query, **query_args)
+            )
+            return
+
+        # The index doesn't carry everything asked for; collect keys a page
+        # at a time and fetch the documents from the table.
+        query_args["ProjectionExpression"] = TABLE_KEY
+        keys = []
+        for item in _paginate(self._table.query, **query_args):
+            keys.append({TABLE_KEY: item[TABLE_KEY]})
+            if len(keys) == BATCH_GET_LIMIT:
+                yield from self._batch_get(keys, attributes)
+                keys = []
+        if keys:
+            yield from self._batch_get(keys, attributes)
+
+    def _scan(self, filter_expression, attributes):
+        scan_args = {}
+        if filter_expression is not None:
+            scan_args["FilterExpression"] = filter_expression
+        scan_args.update(_projection(attributes))
+        yield from _paginate(self._table.scan, **scan_args)
+
+    def _batch_get(self, keys, attributes):
+        client = self._table.meta.client
+        table_name = self._table.name
+        for offset in range(0, len(keys), BATCH_GET_LIMIT):
+            request = {table_name: {"Keys": keys[offset : offset + BATCH_GET_LIMIT]}}
+            request[table_name].update(_projection(attributes))
+            attempt = 0
+            while request:
+                response = client.batch_get_item(RequestItems=request)
+                yield from response["Responses"].get(table_name, [])
+                request = response.get("UnprocessedKeys")
+                if request:
+                    attempt += 1
+                    time.sleep(random.uniform(0, min(2.0, 0.05 * 2**attempt)))
+
+
+def _paginate(operation, **kwargs):
+    """Yield every item of a `query` or `scan`, following LastEvaluatedKey."""
+    while True:
+        response = operation(**kwargs)
+        yield from response.get("Items", [])
+        if "LastEvaluatedKey" not in response:
+            return
+        kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def _projection(attributes):
+    """Build ProjectionExpression arguments; attribute names are aliased so
+    reserved words don't need special handling."""
+    if attributes is None:
+        return {}
+    names = sorted(set(attributes) | {TABLE_KEY})
+    return {
+        "ProjectionExpression": ", ".join(f"#a{i}" for i in range(len(names))),
+        "ExpressionAttributeNames": {f"#a{i}": name for i, name in enumerate(names)},
+    }
+
+
+def _select(item, attributes):
+    if attributes is None:
+        return item
+    wanted = set(attributes) | {TABLE_KEY}
+    return {name: value for name, value in item.items() if name in wanted}
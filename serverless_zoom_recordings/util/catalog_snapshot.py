@@ -0,0 +1,226 @@
+"""
+Keep a compact snapshot of the recording catalog in S3 for analytics.
+
+Questions like "hours recorded per organization per month" would otherwise
+need a `Scan` of the meetings table.  The snapshot is a gzip-compressed
+newline-delimited JSON file with one row per recording file: the recording's
+fields repeated on each of its files (a recording without files has one row
+with empty file columns).  Meeting passwords are left out.
+
+`finish_ingest` and `reindex_recording` append each recording document they
+change to a change log, one object per change under `_catalog/changes/`.
+`export_catalog` merges the change log into the snapshot, keeping the
+highest `document_version` of each recording, and then deletes the merged
+changes.  The first export, or one asked to rebuild, starts from a full
+scan of the table instead of the previous snapshot.
+"""
+import gzip
+import io
+from datetime import datetime, timezone
+
+from botocore.exceptions import ClientError
+
+from .catalog import RecordingCatalog
+from .codec import document_args, dumps, loads, read_document
+
+CATALOG_PREFIX = "_catalog"
+CHANGES_PREFIX = f"{CATALOG_PREFIX}/changes/"
+SNAPSHOT_KEY = f"{CATALOG_PREFIX}/recordings.ndjson.gz"
+SNAPSHOT_STATE_KEY = f"{CATALOG_PREFIX}/snapshot.json"
+DELETE_BATCH = 1000
+
+RECORDING_COLUMNS = (
+    "recording_id",
+    "organization",
+    "meeting_id",
+    "meeting_topic",
+    "recording_path",
+    "host_id",
+    "start_time",
+    "end_time",
+    "document_version",
+)
+FILE_COLUMNS = ("recording_type", "mime_type", "file_size", "faststart_relocated")
+
+
+def change_key(document, now=None):
+    """Construct the change log key of a recording document.
+
+    Keys sort in the order the changes were made.
+
+    :param document: dict, Recording document as stored
+    :param now: datetime, Time of the change (default: now)
+
+    :returns: string, S3 key
+    """
+    now = now or datetime.now(timezone.utc)
+    version = document.get("document_version", 0)
+    return (
+        f"{CHANGES_PREFIX}{now:%Y%m%dT%H%M%S.%fZ}-"
+        f"{document['recording_id']}-{version}.json"
+    )
+
+
+def record_change(s3_client, bucket, document):
+    """Append a changed recording document to the change log.
+
+    :param s3_client: boto3 S3 client
+    :param bucket: string, Recordings bucket
+    :param document: dict, Recording document as stored
+
+    :returns: string, S3 key of the change
+    """
+    key = change_key(document)
+    s3_client.put_object(Bucket=bucket, Key=key, **document_args(document))
+    return key
+
+
+def _duration_seconds(document):
+    try:
+        start = datetime.fromisoformat(document["start_time"].replace("Z", "+00:00"))
+        end = datetime.fromisoformat(document["end_time"].replace("Z", "+00:00"))
+    except (KeyError, AttributeError, ValueError):
+        return None
+    return int((end - start).total_seconds())
+
+
+def catalog_rows(document):
+    """Flatten a recording document into snapshot rows, one per file.
+
+    :param document: dict, Recording document
+
+    :returns: list, Rows (dicts)
+    """
+    recording = {column: document.get(column) for column in RECORDING_COLUMNS}
+    start_time = document.get("start_time") or ""
+    recording["month"] = start_time[:7] or None
+    recording["duration_seconds"] = _duration_seconds(document)
+
+    rows = []
+    for file in document.get("files") or []:
+        row = dict(recording)
+        row["recording_type"] = file.get("recording_type")
+        row["mime_type"] = file.get("mime_type")
+        row["file_size"] = file.get("zoom_file_size")
+        row["faststart_relocated"] = (file.get("faststart") or {}).get("relocated")
+        rows.append(row)
+    if not rows:
+        rows.append(dict(recording, **{column: None for column in FILE_COLUMNS}))
+    return rows
+
+
+def read_snapshot(s3_client, bucket):
+    """Read the snapshot rows, grouped by recording.
+
+    :returns: dict, Rows of each `recording_id`, or None if there is no
+        snapshot
+    """
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=SNAPSHOT_KEY)
+    except ClientError as error:
+        if error.response["Error"]["Code"] == "NoSuchKey":
+            return None
+        raise
+    recordings = {}
+    with gzip.GzipFile(fileobj=response["Body"]) as lines:
+        for line in lines:
+            if line.strip():
+                row = loads(line)
+                recordings.setdefault(row["recording_id"], []).append(row)
+    return recordings
+
+
+def scan_recordings(table):
+    """Build snapshot rows from a full scan of the meetings table.
+
+    :param table: boto3 DynamoDB `Table` resource
+
+    :returns: dict, Rows of each `recording_id`
+    """
+    return {
+        item["recording_id"]: catalog_rows(loads(dumps(item)))
+        for item in RecordingCatalog(table).scan()
+    }
+
+
+def list_changes(s3_client, bucket):
+    """List the keys in the change log, oldest first."""
+    keys = []
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=CHANGES_PREFIX):
+        keys.extend(entry["Key"] for entry in page.get("Contents", []))
+    return sorted(keys)
+
+
+def merge_changes(recordings, s3_client, bucket, keys):
+    """Merge change log entries into the snapshot rows.
+
+    A change replaces a recording's rows unless the rows are from a later
+    `document_version`.
+
+    :param recordings: dict, Rows of each `recording_id`; updated in place
+    :param keys: list, Change log keys
+
+    :returns: int, Recordings whose rows were replaced
+    """
+    replaced = set()
+    for key in keys:
+        document = read_document(s3_client.get_object(Bucket=bucket, Key=key))
+        recording_id = document["recording_id"]
+        current = recordings.get(recording_id)
+        if current and (current[0].get("document_version") or 0) > document.get(
+            "document_version", 0
+        ):
+            continue
+        recordings[recording_id] = catalog_rows(document)
+        replaced.add(recording_id)
+    return len(replaced)
+
+
+def write_snapshot(s3_client, bucket, recordings, state):
+    """Write the snapshot rows, newest recordings first, and its state.
+
+    :param recordings: dict, Rows of each `recording_id`
+    :param state: dict, Details of the export for `snapshot.json`
+
+    :returns: dict, State as written, with row and recording counts
+    """
+    ordered = sorted(
+        recordings.values(),
+        key=lambda rows: (rows[0].get("start_time") or "", rows[0]["recording_id"]),
+        reverse=True,
+    )
+    body = io.BytesIO()
+    rows = 0
+    with gzip.GzipFile(fileobj=body, mode="wb", compresslevel=6, mtime=0) as out:
+        for recording_rows in ordered:
+            for row in recording_rows:
+                out.write(dumps(row) + b"\n")
+                rows += 1
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=SNAPSHOT_KEY,
+        Body=body.getvalue(),
+        ContentType="application/gzip",
+    )
+    state = dict(
+        state,
+        key=SNAPSHOT_KEY,
+        recordings=len(recordings),
+        rows=rows,
+        columns=list(RECORDING_COLUMNS)
+        + ["month", "duration_seconds"]
+        + list(FILE_COLUMNS),
+    )
+    s3_client.put_object(Bucket=bucket, Key=SNAPSHOT_STATE_KEY, **document_args(state))
+    return state
+
+
+def delete_changes(s3_client, bucket, keys):
+    """Delete merged change log entries."""
+    for start in range(0, len(keys), DELETE_BATCH):
+        batch = keys[start : start + DELETE_BATCH]
+        s3_client.delete_objects(
+            Bucket=bucket,
+            Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True},
+        )
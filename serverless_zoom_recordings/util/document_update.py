@@ -0,0 +1,211 @@
+"""
+Update recording documents field by field.
+
+`update_recording_document` compares a recording document with the item
+stored in the meetings table and writes only the top-level fields that
+differ, with an `UpdateItem` conditioned on the item's `document_version`.
+If another writer got in first, the condition fails and the update is
+re-read, re-compared and retried, so concurrent changes to other fields
+are kept rather than overwritten by a whole-item `PutItem`.  A document
+that hasn't changed isn't written at all.
+
+The `{recording_id}/recording_document.json` copy in S3 is then replaced
+with the updated item, unless the copy there is already a newer version.
+The copy is checked even when the document hasn't changed, so a copy that
+failed to write after the table was updated is repaired by the next run.
+"""
+import random
+import time
+
+from botocore.exceptions import ClientError
+
+from .codec import document_args, dumps, loads, read_document
+
+VERSION_ATTRIBUTE = "document_version"
+TABLE_KEY = "recording_id"
+MAX_ATTEMPTS = 8
+
+_CONFLICT_ERRORS = (
+    "ConditionalCheckFailedException",
+    "PreconditionFailed",
+    "ConditionalRequestConflict",
+)
+
+
+class DocumentConflict(Exception):
+    """The document kept changing underneath the update."""
+
+
+def _plain(value):
+    """Convert DynamoDB `Decimal` values to plain numbers for comparison."""
+    return loads(dumps(value))
+
+
+def diff_document(stored, document, remove_missing=False):
+    """Work out which top-level fields of a document have changed.
+
+    :param stored: dict, Stored item
+    :param document: dict, Updated document
+    :param remove_missing: bool, Treat fields missing from `document` as
+        removed
+
+    :returns: tuple, Changed fields and their new values (dict), and the
+        names of removed fields (list)
+    """
+    ignored = (TABLE_KEY, VERSION_ATTRIBUTE)
+    stored_plain = _plain(stored)
+    changed = {
+        field: value
+        for field, value in document.items()
+        if field not in ignored
+        and (field not in stored_plain or stored_plain[field] != _plain(value))
+    }
+    removed = []
+    if remove_missing:
+        removed = sorted(
+            field for field in stored if field not in ignored and field not in document
+        )
+    return changed, removed
+
+
+def update_recording_document(
+    table, s3_client, bucket, document, remove_missing=False, log=None
+):
+    """Apply the changes in a recording document to the table and S3.
+
+    :param table: boto3 DynamoDB `Table` resource for the meetings table
+    :param s3_client: boto3 S3 client
+    :param bucket: string, Recordings bucket
+    :param document: dict, Recording document with `recording_id`
+    :param remove_missing: bool, Remove stored fields missing from `document`
+    :param log: structlog logger
+
+    :returns: dict, `document` (the stored item after the update, with
+        plain numbers), `previous` (the item before it, or ``None``),
+        `changed` and `removed` field names, and `attempts`
+    :raises DocumentConflict: if every attempt conflicted
+    """
+    key = {TABLE_KEY: document[TABLE_KEY]}
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        stored = table.get_item(Key=key, ConsistentRead=True).get("Item")
+        try:
+            if stored is None:
+                changed, removed = diff_document({}, document)
+                item = dict(document, **{VERSION_ATTRIBUTE: 1})
+                table.put_item(
+                    Item=item,
+                    ConditionExpression="attribute_not_exists(#key)",
+                    ExpressionAttributeNames={"#key": TABLE_KEY},
+                )
+            else:
+                changed, removed = diff_document(stored, document, remove_missing)
+                if not changed and not removed:
+                    if VERSION_ATTRIBUTE in stored:
+                        _store_copy(s3_client, bucket, _plain(stored))
+                    if log:
+                        log.debug(
+                            "Update recording document", reason="Document unchanged"
+                        )
+                    return {
+                        "document": _plain(stored),
+                        "previous": stored,
+                        "changed": [],
+                        "removed": [],
+                        "attempts": attempt,
+                    }
+                item = _update_item(table, key, stored, changed, removed)
+        except ClientError as error:
+            if error.response["Error"]["Code"] not in _CONFLICT_ERRORS:
+                raise
+            if log:
+                log.debug(
+                    "Update recording document",
+                    reason="Concurrent update, retrying",
+                    attempt=attempt,
+                )
+            time.sleep(random.uniform(0, 0.1 * 2**attempt))
+            continue
+
+        updated = _plain(item)
+        _store_copy(s3_client, bucket, updated)
+        if log:
+            log.info(
+                "Update recording document",
+                reason="Document updated",
+                changed=sorted(changed),
+                removed=removed,
+                document_version=updated[VERSION_ATTRIBUTE],
+                attempts=attempt,
+            )
+        return {
+            "document": updated,
+            "previous": stored,
+            "changed": sorted(changed),
+            "removed": removed,
+            "attempts": attempt,
+        }
+    raise DocumentConflict(
+        f"Recording document {document[TABLE_KEY]} still changing after "
+        f"{MAX_ATTEMPTS} attempts"
+    )
+
+
+def _update_item(table, key, stored, changed, removed):
+    """Write the changed fields, conditional on the stored version."""
+    names = {"#version": VERSION_ATTRIBUTE}
+    values = {":zero": 0, ":one": 1}
+    assignments = ["#version = if_not_exists(#version, :zero) + :one"]
+    for n, (field, value) in enumerate(sorted(changed.items())):
+        names[f"#f{n}"] = field
+        values[f":v{n}"] = value
+        assignments.append(f"#f{n} = :v{n}")
+    expression = "SET " + ", ".join(assignments)
+    if removed:
+        for n, field in enumerate(removed):
+            names[f"#r{n}"] = field
+        expression += " REMOVE " + ", ".join(f"#r{n}" for n in range(len(removed)))
+
+    if VERSION_ATTRIBUTE in stored:
+        condition = "#version = :version"
+        values[":version"] = stored[VERSION_ATTRIBUTE]
+    else:
+        # Stored before documents were versioned
+        condition = "attribute_exists(#key) AND attribute_not_exists(#version)"
+        names["#key"] = TABLE_KEY
+
+    response = table.update_item(
+        Key=key,
+        UpdateExpression=expression,
+        ConditionExpression=condition,
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=values,
+        ReturnValues="ALL_NEW",
+    )
+    return response["Attributes"]
+
+
+def _store_copy(s3_client, bucket, document):
+    """Replace the S3 copy of a document unless it holds a newer version."""
+    key = f"{document[TABLE_KEY]}/recording_document.json"
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            response = s3_client.get_object(Bucket=bucket, Key=key)
+        except ClientError as error:
+            if error.response["Error"]["Code"] != "NoSuchKey":
+                raise
+            conditions = {"IfNoneMatch": "*"}
+        else:
+            existing = read_document(response)
+            if existing.get(VERSION_ATTRIBUTE, 0) >= document[VERSION_ATTRIBUTE]:
+                return
+            conditions = {"IfMatch": response["ETag"]}
+        try:
+            s3_client.put_object(
+                Bucket=bucket, Key=key, **document_args(document), **conditions
+            )
+            return
+        except ClientError as error:
+            if error.response["Error"]["Code"] not in _CONFLICT_ERRORS:
+                raise
+            time.sleep(random.uniform(0, 0.1 * 2**attempt))
+    raise DocumentConflict(f"{key} still changing after {MAX_ATTEMPTS} attempts")
@@ -0,0 +1,249 @@
+"""
+Limit concurrent Zoom downloads across every running execution.
+
+`MaxConcurrency` on the retrieval Map state only limits transfers within one
+execution; when many meetings end together, their executions all download
+at once and Zoom answers with 429s.  `DownloadGovernor` is a counting
+semaphore kept in a DynamoDB table: each of `capacity` slots is an item that
+a download holds with a lease.  A lease is taken with a conditional
+`UpdateItem` that only succeeds if the slot is free or its lease has
+expired, is kept alive by a heartbeat thread while the download runs, and is
+released when it finishes.  A worker that crashes without releasing its
+slot only blocks it until the lease expires.  A heartbeat that fails, e.g.
+because the request is throttled, is retried with backoff until the lease
+is renewed or found taken by another holder.
+
+When every slot is taken, `acquire` retries with jittered exponential
+backoff until `max_wait` has passed and then raises `LeaseUnavailable`,
+which the state machine retries later.
+"""
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+
+class LeaseUnavailable(Exception):
+    """No download slot became free in time."""
+
+
+class Lease:
+    """
+    A held download slot.
+
+    :param governor: `DownloadGovernor` that granted the lease
+    :param slot: string, Key of the slot item
+    :param holder: string, Identifier of the lease holder
+    :param waited: float, Seconds spent waiting for the lease
+    :param attempts: int, Acquisition attempts made
+    :param log: structlog logger for heartbeat failures
+    """
+
+    def __init__(self, governor, slot, holder, waited, attempts, log=None):
+        self.governor = governor
+        self.slot = slot
+        self.holder = holder
+        self.waited = waited
+        self.attempts = attempts
+        self.lost = False
+        self._log = log
+        self._stopped = threading.Event()
+        self._heartbeat = threading.Thread(target=self._beat, daemon=True)
+        self._heartbeat.start()
+
+    def _beat(self):
+        stage = "Renew download lease"
+        interval = self.governor.heartbeat_interval
+        failures = 0
+        while not self._stopped.wait(interval):
+            try:
+                renewed = self.governor.renew(self)
+            except (BotoCoreError, ClientError) as error:
+                # Retry well before the lease runs out
+                failures += 1
+                interval = min(
+                    self.governor.heartbeat_interval,
+                    self.governor.base_delay * 2**failures,
+                )
+                if self._log:
+                    self._log.warning(
+                        stage,
+                        reason="Heartbeat failed",
+                        slot=self.slot,
+                        failures=failures,
+                        error=repr(error),
+                    )
+                continue
+            failures = 0
+            interval = self.governor.heartbeat_interval
+            if not renewed:
+                # Someone else took the slot after our lease expired
+                self.lost = True
+                if self._log:
+                    self._log.warning(stage, reason="Lease lost", slot=self.slot)
+                return
+
+    def stop_heartbeat(self):
+        """Stop renewing the lease, which then expires unless released."""
+        self._stopped.set()
+        self._heartbeat.join()
+
+    def release(self):
+        """Stop the heartbeat and free the slot."""
+        self.stop_heartbeat()
+        if not self.lost:
+            self.governor.release(self)
+
+
+class DownloadGovernor:
+    """
+    Lease-based counting semaphore in a DynamoDB table keyed on `lease_id`.
+
+    :param table: boto3 DynamoDB `Table` resource
+    :param capacity: int, Number of concurrent leases
+    :param name: string, Semaphore name; slots are `{name}#{n}`
+    :param lease_seconds: int, Lease lifetime without a heartbeat
+    :param max_wait: float, Seconds to wait for a free slot
+    :param base_delay: float, First backoff delay in seconds
+    :param max_delay: float, Longest backoff delay in seconds
+    """
+
+    def __init__(
+        self,
+        table,
+        capacity,
+        name="zoom-download",
+        lease_seconds=60,
+        max_wait=240,
+        base_delay=0.5,
+        max_delay=15,
+    ):
+        self.table = table
+        self.capacity = capacity
+        self.name = name
+        self.lease_seconds = lease_seconds
+        self.heartbeat_interval = lease_seconds / 3
+        self.max_wait = max_wait
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def slots(self):
+        return [f"{self.name}#{n}" for n in range(self.capacity)]
+
+    def _try_slot(self, slot, holder):
+        now = time.time()
+        try:
+            self.table.update_item(
+                Key={"lease_id": slot},
+                UpdateExpression="SET holder = :holder, expires = :expires",
+                ConditionExpression="attribute_not_exists(holder) OR expires < :now",
+                ExpressionAttributeValues={
+                    ":holder": holder,
+                    ":expires": int(now + self.lease_seconds),
+                    ":now": int(now),
+                },
+            )
+        except ClientError as error:
+            if error.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                return False
+            raise
+        return True
+
+    def acquire(self, holder, log=None):
+        """Wait for a free slot and lease it.
+
+        :param holder: string, Identifier of the lease holder, e.g. the
+            Lambda request id
+        :param log: structlog logger for the lease's heartbeat failures
+
+        :returns: `Lease`
+        :raises LeaseUnavailable: if no slot is free within `max_wait`
+        """
+        started = time.monotonic()
+        attempts = 0
+        while True:
+            attempts += 1
+            slots = self.slots()
+            random.shuffle(slots)
+            for slot in slots:
+                if self._try_slot(slot, holder):
+                    waited = time.monotonic() - started
+                    return Lease(self, slot, holder, waited, attempts, log=log)
+            waited = time.monotonic() - started
+            if waited >= self.max_wait:
+                raise LeaseUnavailable(
+                    f"No {self.name} slot free after {waited:.0f}s and {attempts} attempts"
+                )
+            # "Full jitter" backoff
+            delay = random.uniform(
+                0, min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+            )
+            time.sleep(min(delay, self.max_wait - waited))
+
+    def renew(self, lease):
+        """Extend a lease; returns False if it is no longer held."""
+        try:
+            self.table.update_item(
+                Key={"lease_id": lease.slot},
+                UpdateExpression="SET expires = :expires",
+                ConditionExpression="holder = :holder",
+                ExpressionAttributeValues={
+                    ":holder": lease.holder,
+                    ":expires": int(time.time() + self.lease_seconds),
+                },
+            )
+        except ClientError as error:
+            if error.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                return False
+            raise
+        return True
+
+    def release(self, lease):
+        """Free a leased slot, unless another holder has since taken it."""
+        try:
+            self.table.update_item(
+                Key={"lease_id": lease.slot},
+                UpdateExpression="REMOVE holder, expires",
+                ConditionExpression="holder = :holder",
+                ExpressionAttributeValues={":holder": lease.holder},
+            )
+        except ClientError as error:
+            if error.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+
+    @contextmanager
+    def lease(self, holder, log=None):
+        """Hold a slot for the duration of a `with` block.
+
+        :param holder: string, Identifier of the lease holder
+        :param log: structlog logger for the wait metrics and heartbeat
+        """
+        stage = "Acquire download lease"
+        try:
+            lease = self.acquire(holder, log=log)
+        except LeaseUnavailable as error:
+            if log:
+                log.warning(stage, reason="No lease available", detail=str(error))
+            raise
+        if log:
+            log.info(
+                stage,
+                reason="Lease acquired",
+                slot=lease.slot,
+                queue_wait_seconds=round(lease.waited, 3),
+                attempts=lease.attempts,
+            )
+        held = time.monotonic()
+        try:
+            yield lease
+        finally:
+            lease.release()
+            if log:
+                log.info(
+                    stage,
+                    reason="Lease lost" if lease.lost else "Lease released",
+                    slot=lease.slot,
+                    held_seconds=round(time.monotonic() - held, 3),
+                )
@@ -14,6 +14,8 @@ import structlog
 from structlog.processors import _json_fallback_handler
 from structlog.types import Any, Callable, EventDict, Union
 
+from .codec import dumps_str
+
 _NOISY_LOG_SOURCES = (
     "boto",
     "boto3",
@@ -77,6 +79,18 @@ class AWSCloudWatchLogs:
         )
 
 
+def _serialize(event_dict: EventDict, **dumps_kw: Any) -> str:
+    """
+    Serialize a log line with the shared `orjson` codec, falling back to
+    :func:`json.dumps` for values it refuses, such as integers wider than
+    64 bits.
+    """
+    try:
+        return dumps_str(event_dict, default=dumps_kw.get("default"))
+    except TypeError:
+        return json.dumps(event_dict, **dumps_kw)
+
+
 _PROCESSORS = (
     structlog.stdlib.filter_by_level,
     structlog.stdlib.add_logger_name,
@@ -87,7 +101,7 @@ _PROCESSORS = (
     structlog.processors.format_exc_info,
     structlog.processors.UnicodeDecoder(),
     structlog.threadlocal.merge_threadlocal,
-    AWSCloudWatchLogs(callouts=["event", "reason"]),
+    AWSCloudWatchLogs(callouts=["event", "reason"], serializer=_serialize),
 )
 
 
@@ -0,0 +1,177 @@
+"""
+Maintain precomputed listing manifests of recordings in S3.
+
+The web builder renders organization and topic pages from these manifests
+rather than querying the meetings table.  Each manifest is a sorted JSON
+document that is updated with an optimistic-concurrency read-modify-write
+cycle: the object is read along with its ETag, modified, and written back
+conditionally on the ETag being unchanged.  A concurrent writer causes the
+conditional write to fail, and the cycle is retried.
+"""
+import random
+import time
+from datetime import datetime, timezone
+
+from botocore.exceptions import ClientError
+
+from .codec import document_args, read_document
+from .recording_path import recording_path
+
+MANIFEST_PREFIX = "_manifests"
+MANIFEST_FIELDS = (
+    "recording_id",
+    "recording_path",
+    "meeting_id",
+    "meeting_topic",
+    "start_time",
+    "end_time",
+    "password",
+)
+MAX_ATTEMPTS = 8
+_CONFLICT_ERRORS = ("PreconditionFailed", "ConditionalRequestConflict")
+
+
+def organization_manifest_key(organization):
+    """Construct the S3 key of an organization's manifest.
+
+    :param organization: string, Organization name
+
+    :returns: string, S3 key
+    """
+    return f"{MANIFEST_PREFIX}/organizations/{organization.lower()}.json"
+
+
+def topic_manifest_key(organization, meeting_topic):
+    """Construct the S3 key of a topic's manifest.
+
+    :param organization: string, Organization name
+    :param meeting_topic: string, Meeting topic
+
+    :returns: string, S3 key
+    """
+    topic_path = recording_path(organization=organization, meeting_topic=meeting_topic)
+    return f"{MANIFEST_PREFIX}/topics/{topic_path}.json"
+
+
+def manifest_keys(recording_document):
+    """List the manifest keys that a recording document belongs in.
+
+    :param recording_document: dict, Recording document
+
+    :returns: list, S3 keys
+    """
+    return [
+        organization_manifest_key(recording_document["organization"]),
+        topic_manifest_key(
+            recording_document["organization"], recording_document["meeting_topic"]
+        ),
+    ]
+
+
+def manifest_entry(recording_document):
+    """Reduce a recording document to the fields listed in a manifest.
+
+    :param recording_document: dict, Recording document
+
+    :returns: dict, Manifest entry
+    """
+    return {
+        field: recording_document[field]
+        for field in MANIFEST_FIELDS
+        if field in recording_document
+    }
+
+
+def update_manifests(
+    s3_client, bucket, recording_document, previous_document=None, log=None
+):
+    """Add or refresh a recording in its manifests.
+
+    If the previous version of the document was listed under a different
+    organization or topic, the recording is removed from those manifests.
+
+    :param s3_client: boto3 S3 client
+    :param bucket: string, Recordings bucket name
+    :param recording_document: dict, Recording document as stored
+    :param previous_document: dict, Recording document it replaced, if any
+    :param log: structlog logger
+
+    :returns: list, S3 keys of the manifests that were written
+    """
+    recording_id = recording_document["recording_id"]
+    entry = manifest_entry(recording_document)
+    current_keys = manifest_keys(recording_document)
+    stale_keys = []
+    if previous_document and all(
+        field in previous_document for field in ("organization", "meeting_topic")
+    ):
+        stale_keys = [
+            key for key in manifest_keys(previous_document) if key not in current_keys
+        ]
+
+    def upsert(recordings):
+        recordings = [r for r in recordings if r["recording_id"] != recording_id]
+        recordings.append(entry)
+        return recordings
+
+    def remove(recordings):
+        return [r for r in recordings if r["recording_id"] != recording_id]
+
+    for key in current_keys:
+        _modify_manifest(s3_client, bucket, key, upsert, log=log)
+    for key in stale_keys:
+        _modify_manifest(s3_client, bucket, key, remove, log=log)
+    return current_keys + stale_keys
+
+
+def _read_manifest(s3_client, bucket, key):
+    """Read a manifest and its ETag; a missing manifest has no ETag."""
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=key)
+    except ClientError as error:
+        if error.response["Error"]["Code"] == "NoSuchKey":
+            return {"recordings": []}, None
+        raise
+    return read_document(response), response["ETag"]
+
+
+def _modify_manifest(s3_client, bucket, key, modify, log=None):
+    """Apply `modify` to a manifest's recording list, retrying on conflict."""
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        manifest, etag = _read_manifest(s3_client, bucket, key)
+        recordings = modify(manifest.get("recordings", []))
+        recordings.sort(
+            key=lambda r: (r.get("start_time", ""), r["recording_id"]), reverse=True
+        )
+        manifest["recordings"] = recordings
+        manifest["updated"] = datetime.now(timezone.utc).isoformat()
+
+        conditions = {"IfMatch": etag} if etag else {"IfNoneMatch": "*"}
+        try:
+            s3_client.put_object(
+                Bucket=bucket,
+                Key=key,
+                **document_args(manifest),
+                **conditions,
+            )
+        except ClientError as error:
+            if error.response["Error"]["Code"] not in _CONFLICT_ERRORS:
+                raise
+            if log:
+                log.debug(
+                    "Update manifest",
+                    reason="Concurrent update, retrying",
+                    key=key,
+                    attempt=attempt,
+                )
+            time.sleep(random.uniform(0, 0.1 * 2**attempt))
+            continue
+        if log:
+            log.debug(
+                "Update manifest",
+                reason="Manifest written",
+                key=key,
+                recordings=len(recordings),
+            )
+        return manifest
+    raise RuntimeError(f"Manifest {key} not updated after {MAX_ATTEMPTS} attempts")
@@ -0,0 +1,115 @@
+"""
+Store and read the metadata documents of a recording.
+
+The JSON documents of a recording (the Zoom webhook, the past-meeting and
+meeting details, the per-file transfer metadata, and the recording document)
+are collected by finish_ingest into one versioned bundle object,
+`{recording_id}/metadata.json`, so that they can be read with one GET.  The
+per-document keys (`{recording_id}/meeting.json` and so on) are still
+written for readers outside this stack.  `MetadataReader` reads a document
+from the bundle, falling back to the per-document keys for recordings
+ingested before the bundle existed or not yet finished.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from botocore.exceptions import ClientError
+
+from .codec import document_args, read_document
+
+BUNDLE_VERSION = 1
+BUNDLE_NAME = "metadata.json"
+
+
+def bundle_key(recording_id):
+    """Construct the S3 key of a recording's metadata bundle.
+
+    :param recording_id: string, Recording identifier
+
+    :returns: string, S3 key
+    """
+    return f"{recording_id}/{BUNDLE_NAME}"
+
+
+def make_bundle(recording_id, documents):
+    """Build a metadata bundle.
+
+    :param recording_id: string, Recording identifier
+    :param documents: dict, Documents keyed by their per-document file name,
+        e.g. `meeting.json`
+
+    :returns: dict, Metadata bundle
+    """
+    return {
+        "bundle_version": BUNDLE_VERSION,
+        "recording_id": recording_id,
+        "documents": documents,
+    }
+
+
+def put_tagged_documents(s3_client, bucket, documents, tags):
+    """Write several JSON documents to S3 at once, with the same tags.
+
+    :param s3_client: boto3 S3 client
+    :param bucket: string, Bucket name
+    :param documents: dict, Documents keyed by S3 key
+    :param tags: dict, Tag values keyed by tag name
+
+    :returns: dict, `PutObject` responses keyed by S3 key
+    """
+    tagging = urlencode(tags)
+
+    def put(key):
+        return s3_client.put_object(
+            Bucket=bucket, Key=key, Tagging=tagging, **document_args(documents[key])
+        )
+
+    with ThreadPoolExecutor(max_workers=max(1, len(documents))) as executor:
+        return dict(zip(documents, executor.map(put, documents)))
+
+
+class MetadataReader:
+    """
+    Lazily read the metadata documents of one recording.
+
+    The bundle is fetched on first use; documents it doesn't contain are
+    read from their per-document keys.
+
+    :param s3_client: boto3 S3 client
+    :param bucket: string, Recordings bucket name
+    :param recording_id: string, Recording identifier
+    """
+
+    def __init__(self, s3_client, bucket, recording_id):
+        self._s3_client = s3_client
+        self._bucket = bucket
+        self._recording_id = recording_id
+        self._bundle = None
+
+    def get(self, name):
+        """Read one document, e.g. `meeting.json`.
+
+        :param name: string, Per-document file name
+
+        :returns: dict, Document, or ``None`` if the recording doesn't have it
+        """
+        if self._bundle is None:
+            self._bundle = self._read(bundle_key(self._recording_id)) or {}
+            if self._bundle.get("bundle_version", BUNDLE_VERSION) > BUNDLE_VERSION:
+                raise RuntimeError(
+                    f"Metadata bundle version {self._bundle['bundle_version']} "
+                    f"of {self._recording_id} is newer than this code"
+                )
+        documents = self._bundle.get("documents", {})
+        if name in documents:
+            return documents[name]
+        return self._read(f"{self._recording_id}/{name}")
+
+    def _read(self, key):
+        try:
+            response = self._s3_client.get_object(Bucket=self._bucket, Key=key)
+        except ClientError as error:
+            if error.response["Error"]["Code"] == "NoSuchKey":
+                return None
+            raise
+        return read_document(response)
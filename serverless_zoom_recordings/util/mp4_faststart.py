@@ -0,0 +1,303 @@
+"""
+Move the `moov` atom of an MP4 in S3 to the front of the file ("faststart").
+
+Zoom writes the `moov` atom (the index of the media) after the `mdat` atom
+(the media itself), so a player must fetch the end of the file before it
+can start playback.  Relocating `moov` in front of `mdat` shifts every media
+sample, so the chunk offset tables (`stco`/`co64`) inside `moov` are
+rewritten to match.
+
+Only the top-level atom headers and `moov` are read into memory.  The new
+object is assembled with a multipart upload in which the media is copied
+server-side with ranged `UploadPartCopy` requests.
+
+See ISO/IEC 14496-12 for the atom ("box") layout.
+"""
+import struct
+
+MIN_PART_SIZE = 5 * 1024 * 1024
+COPY_PART_SIZE = 512 * 1024 * 1024
+CONTAINER_ATOMS = {b"moov", b"trak", b"mdia", b"minf", b"stbl"}
+UINT32_MAX = 2**32 - 1
+
+
+def read_top_level_atoms(read_range, file_size):
+    """List the top-level atoms of an MP4 file.
+
+    :param read_range: callable, `read_range(start, end)` returns the bytes
+        from `start` up to (not including) `end`
+    :param file_size: int, Size of the file
+
+    :returns: list, (atom type, offset, size) tuples
+    """
+    atoms = []
+    offset = 0
+    while offset + 8 <= file_size:
+        header = read_range(offset, min(offset + 16, file_size))
+        size, atom_type = struct.unpack(">I4s", header[:8])
+        if size == 1:
+            if len(header) < 16:
+                raise ValueError(f"Truncated 64-bit atom header at {offset}")
+            size = struct.unpack(">Q", header[8:16])[0]
+        elif size == 0:
+            size = file_size - offset
+        if size < 8 or offset + size > file_size:
+            raise ValueError(f"Invalid {atom_type!r} atom size {size} at {offset}")
+        atoms.append((atom_type, offset, size))
+        offset += size
+    return atoms
+
+
+def parse_atoms(data):
+    """Parse atoms into a tree, descending into the containers on the way to
+    the sample tables.  Other atoms are kept as opaque payloads.
+
+    :param data: bytes, Concatenated atoms
+
+    :returns: list, [atom type, payload bytes or list of child atoms] pairs
+    """
+    atoms = []
+    offset = 0
+    while offset < len(data):
+        size, atom_type = struct.unpack_from(">I4s", data, offset)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", data, offset + 8)[0]
+            header_size = 16
+        elif size == 0:
+            size = len(data) - offset
+        if size < header_size or offset + size > len(data):
+            raise ValueError(f"Invalid {atom_type!r} atom size {size} at {offset}")
+        payload = data[offset + header_size : offset + size]
+        if atom_type in CONTAINER_ATOMS:
+            payload = parse_atoms(payload)
+        atoms.append([atom_type, payload])
+        offset += size
+    return atoms
+
+
+def serialize_atoms(atoms):
+    """Serialize an atom tree produced by `parse_atoms`.
+
+    :param atoms: list, Atom tree
+
+    :returns: bytes, Concatenated atoms
+    """
+    output = bytearray()
+    for atom_type, payload in atoms:
+        if isinstance(payload, list):
+            payload = serialize_atoms(payload)
+        if len(payload) + 8 <= UINT32_MAX:
+            output += struct.pack(">I4s", len(payload) + 8, atom_type)
+        else:
+            output += struct.pack(">I4sQ", 1, atom_type, len(payload) + 16)
+        output += payload
+    return bytes(output)
+
+
+def _chunk_offset_atoms(atoms):
+    """Yield every `stco` and `co64` atom in a tree."""
+    for atom in atoms:
+        if isinstance(atom[1], list):
+            yield from _chunk_offset_atoms(atom[1])
+        elif atom[0] in (b"stco", b"co64"):
+            yield atom
+
+
+def _read_chunk_offsets(atom):
+    atom_type, payload = atom
+    count = struct.unpack_from(">I", payload, 4)[0]
+    entry_format = "I" if atom_type == b"stco" else "Q"
+    return list(struct.unpack_from(f">{count}{entry_format}", payload, 8))
+
+
+def _write_chunk_offsets(atom, offsets, wide):
+    version_and_flags = atom[1][:4]
+    if wide:
+        atom[0] = b"co64"
+        entries = struct.pack(f">{len(offsets)}Q", *offsets)
+    else:
+        entries = struct.pack(f">{len(offsets)}I", *offsets)
+    atom[1] = version_and_flags + struct.pack(">I", len(offsets)) + entries
+
+
+def relocate_moov(moov_atom, relocate_offset):
+    """Rewrite the chunk offsets of a `moov` atom for its new position.
+
+    :param moov_atom: bytes, The complete `moov` atom
+    :param relocate_offset: callable, `relocate_offset(offset, moov_size)`
+        maps an offset in the original file to the output file, given the
+        size of the rewritten `moov`
+
+    :returns: bytes, The rewritten `moov` atom
+    """
+    tree = parse_atoms(moov_atom)
+    tables = [(atom, _read_chunk_offsets(atom)) for atom in _chunk_offset_atoms(tree)]
+    wide = any(atom[0] == b"co64" for atom, _ in tables)
+    while True:
+        # The size of `moov` depends only on the table widths, not the values
+        for atom, offsets in tables:
+            _write_chunk_offsets(atom, offsets, wide)
+        moov_size = len(serialize_atoms(tree))
+        relocated = [
+            [relocate_offset(offset, moov_size) for offset in offsets]
+            for _, offsets in tables
+        ]
+        if not wide and any(max(o, default=0) > UINT32_MAX for o in relocated):
+            # Some offsets no longer fit in 32 bits: switch to `co64` tables,
+            # which changes the size of `moov`, and compute the offsets again.
+            wide = True
+            continue
+        for (atom, _), offsets in zip(tables, relocated):
+            _write_chunk_offsets(atom, offsets, wide)
+        return serialize_atoms(tree)
+
+
+def plan_faststart(read_range, file_size):
+    """Work out the layout of the faststart version of an MP4 file.
+
+    :param read_range: callable, `read_range(start, end)` returns the bytes
+        from `start` up to (not including) `end`
+    :param file_size: int, Size of the file
+
+    :returns: list, Output segments in order, each either `("bytes", data)`
+        or `("range", start, end)` of the original file; ``None`` if the file
+        is already faststart or has no `moov` and `mdat`
+    """
+    atoms = read_top_level_atoms(read_range, file_size)
+    moov = next((a for a in atoms if a[0] == b"moov"), None)
+    mdat = next((a for a in atoms if a[0] == b"mdat"), None)
+    if moov is None or mdat is None or moov[1] < mdat[1]:
+        return None
+    _, moov_start, moov_size = moov
+    moov_end = moov_start + moov_size
+    insert_at = mdat[1]
+
+    def relocate_offset(offset, new_moov_size):
+        if offset < insert_at:
+            return offset
+        if offset < moov_start:
+            return offset + new_moov_size
+        return offset + new_moov_size - moov_size
+
+    new_moov = relocate_moov(read_range(moov_start, moov_end), relocate_offset)
+    segments = [
+        ("range", 0, insert_at),
+        ("bytes", new_moov),
+        ("range", insert_at, moov_start),
+        ("range", moov_end, file_size),
+    ]
+    return [s for s in segments if s[0] == "bytes" or s[2] > s[1]]
+
+
+def write_faststart(s3_client, bucket, key, etag, file_size, extra_args=None):
+    """Replace an MP4 object in S3 with its faststart version.
+
+    :param s3_client: boto3 S3 client
+    :param bucket: string, Bucket of the object
+    :param key: string, Key of the object
+    :param etag: string, ETag of the object; the copy fails if it changes
+    :param file_size: int, Size of the object
+    :param extra_args: dict, Extra arguments such as `ContentType` for the
+        new object
+
+    :returns: dict, `ETag`, `Size` and `MoovSize` of the new object, or
+        ``None`` if the object was left as it was
+    """
+    extra_args = extra_args or {}
+
+    def read_range(start, end):
+        response = s3_client.get_object(
+            Bucket=bucket, Key=key, Range=f"bytes={start}-{end - 1}", IfMatch=etag
+        )
+        return response["Body"].read()
+
+    segments = plan_faststart(read_range, file_size)
+    if segments is None:
+        return None
+    moov_size = next(len(s[1]) for s in segments if s[0] == "bytes")
+    output_size = sum(len(s[1]) if s[0] == "bytes" else s[2] - s[1] for s in segments)
+
+    upload_id = None
+    parts = []
+    pending = bytearray()
+
+    def upload_pending():
+        parts.append(
+            s3_client.upload_part(
+                Bucket=bucket,
+                Key=key,
+                UploadId=upload_id,
+                PartNumber=len(parts) + 1,
+                Body=bytes(pending),
+            )["ETag"]
+        )
+        pending.clear()
+
+    def copy_part(start, end):
+        response = s3_client.upload_part_copy(
+            Bucket=bucket,
+            Key=key,
+            UploadId=upload_id,
+            PartNumber=len(parts) + 1,
+            CopySource={"Bucket": bucket, "Key": key},
+            CopySourceIfMatch=etag,
+            CopySourceRange=f"bytes={start}-{end - 1}",
+        )
+        parts.append(response["CopyPartResult"]["ETag"])
+
+    if output_size < MIN_PART_SIZE:
+        for segment in segments:
+            pending += segment[1] if segment[0] == "bytes" else read_range(*segment[1:])
+        response = s3_client.put_object(
+            Bucket=bucket, Key=key, Body=bytes(pending), **extra_args
+        )
+        return {"ETag": response["ETag"], "Size": output_size, "MoovSize": moov_size}
+
+    upload_id = s3_client.create_multipart_upload(Bucket=bucket, Key=key, **extra_args)[
+        "UploadId"
+    ]
+    try:
+        written = 0
+        for segment in segments:
+            if segment[0] == "bytes":
+                pending += segment[1]
+                written += len(segment[1])
+                continue
+            start, end = segment[1:]
+            while start < end:
+                if len(pending) >= MIN_PART_SIZE:
+                    upload_pending()
+                    continue
+                if pending:
+                    # Top up the buffered bytes to a valid part size
+                    length = min(end - start, MIN_PART_SIZE - len(pending))
+                    pending += read_range(start, start + length)
+                else:
+                    length = min(COPY_PART_SIZE, end - start)
+                    if end - start - length < MIN_PART_SIZE:
+                        length = end - start
+                    is_last = written + length == output_size
+                    if length < MIN_PART_SIZE and not is_last:
+                        pending += read_range(start, start + length)
+                    else:
+                        copy_part(start, start + length)
+                start += length
+                written += length
+        if pending:
+            upload_pending()
+        response = s3_client.complete_multipart_upload(
+            Bucket=bucket,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={
+                "Parts": [
+                    {"PartNumber": number, "ETag": part_etag}
+                    for number, part_etag in enumerate(parts, start=1)
+                ]
+            },
+        )
+    except BaseException:
+        s3_client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
+    return {"ETag": response["ETag"], "Size": output_size, "MoovSize": moov_size}
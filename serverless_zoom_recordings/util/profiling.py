@@ -0,0 +1,198 @@
+"""
+Opt-in profiling of Lambda handler invocations.
+
+Decorate a handler with `@profiled`.  Profiling is off unless it is asked
+for, either for every invocation with the `PROFILE_HANDLER` environment
+variable or for one invocation with a `_profile` field in the input
+payload.  Either one is a comma-separated list (or, for `_profile`, a
+list) of:
+
+* `cprofile`: deterministic profile with `cProfile`
+* `tracemalloc`: memory allocations by source line
+* `sample`: stack samples of the handler thread from a background thread,
+  in "folded" form for flame graphs
+
+`_profile: true` means `cprofile`.  A top-N summary of each profile is
+logged, and the compressed profile is written to
+`{recording_id}/_profiles/` in the recordings bucket when the payload names
+a recording.
+"""
+import cProfile
+import functools
+import gzip
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+import boto3
+import structlog
+
+PROFILE_HANDLER = os.environ.get("PROFILE_HANDLER", "")
+PROFILE_TOP_N = int(os.environ.get("PROFILE_TOP_N", "25"))
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get("PROFILE_SAMPLE_INTERVAL", "0.01"))
+PROFILE_MODES = ("cprofile", "tracemalloc", "sample")
+
+
+def profiled(handler):
+    """Decorate a Lambda handler so it can be profiled on request."""
+
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        if not PROFILE_HANDLER and not (
+            isinstance(event, dict) and "_profile" in event
+        ):
+            return handler(event, context)
+        modes = requested_modes(event)
+        if not modes:
+            return handler(event, context)
+        return _profile_invocation(handler, event, context, modes)
+
+    return wrapper
+
+
+def requested_modes(event):
+    """Work out which profilers an invocation asked for.
+
+    :param event: Lambda handler input
+
+    :returns: list, Profiling modes
+    """
+    requested = PROFILE_HANDLER
+    if isinstance(event, dict) and event.get("_profile"):
+        requested = event["_profile"]
+        if requested is True:
+            requested = "cprofile"
+    if isinstance(requested, str):
+        requested = requested.split(",")
+    modes = [mode.strip().lower() for mode in requested]
+    return [mode for mode in PROFILE_MODES if mode in modes]
+
+
+class StackSampler(threading.Thread):
+    """
+    Sample the stack of another thread at a fixed interval.
+
+    :param thread_id: Identifier of the thread to sample
+    :param interval: Seconds between samples
+    """
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self._thread_id = thread_id
+        self._interval = interval
+        self._stopped = threading.Event()
+        self.samples = Counter()
+
+    def run(self):
+        # pylint: disable=protected-access
+        while not self._stopped.wait(self._interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+                )
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+    def folded(self):
+        """Samples in the "folded stacks" format read by flame graph tools."""
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self.samples.most_common()
+        )
+
+
+def _profile_invocation(handler, event, context, modes):
+    profiler = cProfile.Profile() if "cprofile" in modes else None
+    sampler = None
+    if "sample" in modes:
+        sampler = StackSampler(threading.get_ident(), PROFILE_SAMPLE_INTERVAL)
+        sampler.start()
+    if "tracemalloc" in modes:
+        tracemalloc.start()
+    started = time.perf_counter()
+    if profiler:
+        profiler.enable()
+    try:
+        return handler(event, context)
+    finally:
+        if profiler:
+            profiler.disable()
+        elapsed = time.perf_counter() - started
+        outputs = {}
+        if "tracemalloc" in modes:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            outputs["tracemalloc"] = _tracemalloc_report(snapshot, peak)
+        if sampler:
+            sampler.stop()
+            outputs["sample"] = sampler.folded()
+        if profiler:
+            outputs["cprofile"] = profiler
+        try:
+            _report(handler, event, context, elapsed, outputs)
+        except Exception as error:  # pylint: disable=broad-except
+            # A failure to report must not mask the handler's own outcome
+            structlog.get_logger().warning(
+                "Profile handler", reason="Profile not reported", error=repr(error)
+            )
+
+
+def _tracemalloc_report(snapshot, peak):
+    lines = [f"Peak traced memory: {peak / 1024 / 1024:.1f} MiB"]
+    for statistic in snapshot.statistics("lineno")[:PROFILE_TOP_N]:
+        lines.append(str(statistic))
+    return "\n".join(lines) + "\n"
+
+
+def _report(handler, event, context, elapsed, outputs):
+    """Log a summary of each profile and store the profiles in S3."""
+    log = structlog.get_logger()
+    aws_request_id = context.aws_request_id if context is not None else "no-context"
+    log = log.bind(aws_request_id=aws_request_id)
+    stage = "Profile handler"
+
+    files = {}
+    for mode, output in outputs.items():
+        if mode == "cprofile":
+            summary = io.StringIO()
+            stats = pstats.Stats(output, stream=summary)
+            stats.sort_stats("cumulative").print_stats(PROFILE_TOP_N)
+            log.info(stage, reason=mode, elapsed=elapsed, summary=summary.getvalue())
+            output.create_stats()
+            files["prof.gz"] = gzip.compress(marshal.dumps(output.stats))
+        elif mode == "sample":
+            top = "".join(output.splitlines(keepends=True)[:PROFILE_TOP_N])
+            log.info(stage, reason=mode, elapsed=elapsed, summary=top)
+            files["folded.gz"] = gzip.compress(output.encode("utf-8"))
+        else:
+            log.info(stage, reason=mode, elapsed=elapsed, summary=output)
+            files["tracemalloc.txt.gz"] = gzip.compress(output.encode("utf-8"))
+
+    bucket = os.environ.get("RECORDINGS_BUCKET")
+    recording_id = None
+    if isinstance(event, dict):
+        recording_id = event.get("_recording_id") or event.get("recording_id")
+    if not bucket or not recording_id:
+        log.debug(stage, reason="Profiles not stored; no recording or bucket")
+        return
+
+    s3_client = boto3.client("s3")
+    name = f"{handler.__module__.rsplit('.', 1)[-1]}-{aws_request_id}"
+    for suffix, body in files.items():
+        key = f"{recording_id}/_profiles/{name}.{suffix}"
+        s3_client.put_object(Bucket=bucket, Key=key, Body=body)
+        log.info(stage, reason="Profile stored", key=key)
@@ -0,0 +1,58 @@
+"""
+Build the per-file input of the recording retrieval Map state.
+
+Everything retrieval needs is in the webhook's `recording_files`, so the
+input is built when the step function is started and retrieval runs in
+parallel with the metadata stage.
+"""
+
+# Zoom file_type: (MIME type, file extension)
+FILE_TYPES = {
+    "M4A": ("audio/m4a", "m4a"),
+    "MP4": ("video/mp4", "mp4"),
+    "TIMELINE": ("text/vtt", "vtt"),
+    "TRANSCRIPT": ("text/vtt", "vtt"),
+    "CHAT": ("text/plain", "txt"),
+    "CC": ("text/vtt", "vtt"),
+    "CSV": ("text/csv", "csv"),
+}
+
+
+def recordings_map_input(
+    recording_files, recording_id, download_token, profile=None, trace=None
+):
+    """Describe each recording file for `retrieve_recording`.
+
+    :param recording_files: list, `recording_files` of the Zoom webhook
+    :param recording_id: string, Recording identifier
+    :param download_token: string, Zoom download token
+    :param profile: Profiling modes to pass on (see `util.profiling`)
+    :param trace: dict, Trace context to pass on (see `util.tracing`)
+
+    :returns: list, One retrieval input per recording file
+    """
+    map_input = []
+    for recording in recording_files:
+        recording_metadata = {
+            "recording_type": recording["recording_type"],
+            "download_url": recording["download_url"],
+            "zoom_file_id": recording["id"],
+            "zoom_meeting_id": recording["meeting_id"],
+            "zoom_file_size": recording["file_size"],
+            "recording_start": recording["recording_start"],
+            "recording_end": recording["recording_end"],
+            "download_token": download_token,
+            "_recording_id": recording_id,
+        }
+        if profile is not None:
+            recording_metadata["_profile"] = profile
+        if trace is not None:
+            recording_metadata["_trace"] = trace
+        if recording["file_type"] in FILE_TYPES:
+            mime_type, extension = FILE_TYPES[recording["file_type"]]
+            recording_metadata["mime_type"] = mime_type
+            recording_metadata["extension"] = extension
+        else:
+            recording_metadata["mime_type"] = "application/octet-stream"
+        map_input.append(recording_metadata)
+    return map_input
@@ -0,0 +1,112 @@
+"""
+Decide which of a meeting's recording files are worth transferring.
+
+Zoom can deliver several renditions of the same meeting (for instance
+`shared_screen_with_speaker_view`, `active_speaker` and `gallery_view` MP4s
+plus an `audio_only` M4A).  A rendition policy names the `recording_type`s
+to transfer.  It is a JSON document of the form::
+
+    {
+      "default": {"drop": ["gallery_view"]},
+      "organizations": {
+        "FOLIO": {"prefer_one_of": [["shared_screen_with_speaker_view", "active_speaker"]]}
+      },
+      "topics": [
+        {"pattern": "Board", "keep": ["shared_screen_with_speaker_view", "chat_file"]}
+      ]
+    }
+
+A rule may contain:
+
+* `keep`: only these recording types are transferred
+* `drop`: these recording types are not transferred
+* `prefer_one_of`: groups of interchangeable recording types; only the
+  first one of each group that Zoom delivered is transferred
+
+The default rule is overlaid by the organization's rule, and that by the
+rule of the first topic pattern (a regular expression) matching the meeting
+topic.  An empty policy transfers everything.
+"""
+import json
+import re
+
+RULE_KEYS = ("keep", "drop", "prefer_one_of")
+
+
+def load_policy(policy_json):
+    """Parse and check a rendition policy.
+
+    :param policy_json: string, JSON rendition policy (may be empty)
+
+    :returns: dict, Rendition policy
+    """
+    policy = json.loads(policy_json) if policy_json else {}
+    rules = [policy.get("default", {})]
+    rules.extend(policy.get("organizations", {}).values())
+    for topic_rule in policy.get("topics", []):
+        if "pattern" not in topic_rule:
+            raise ValueError("Rendition policy topic rule without a pattern")
+        re.compile(topic_rule["pattern"])
+        rules.append(topic_rule)
+    for rule in rules:
+        unknown = set(rule) - set(RULE_KEYS) - {"pattern"}
+        if unknown:
+            raise ValueError(f"Unknown rendition policy keys: {sorted(unknown)}")
+    return policy
+
+
+def resolve_rule(policy, organization, meeting_topic):
+    """Combine the policy rules that apply to a meeting.
+
+    :param policy: dict, Rendition policy
+    :param organization: string, Organization name
+    :param meeting_topic: string, Meeting topic
+
+    :returns: dict, Rendition rule
+    """
+    rule = {}
+    rule.update(policy.get("default", {}))
+    rule.update(policy.get("organizations", {}).get(organization, {}))
+    for topic_rule in policy.get("topics", []):
+        if re.search(topic_rule["pattern"], meeting_topic or ""):
+            rule.update(topic_rule)
+            break
+    rule.pop("pattern", None)
+    return rule
+
+
+def select_renditions(recording_files, rule):
+    """Split Zoom recording files into those to transfer and those to skip.
+
+    :param recording_files: list, `recording_files` from a Zoom recording
+    :param rule: dict, Rendition rule from `resolve_rule`
+
+    :returns: tuple, (files to transfer, skipped-file summaries)
+    """
+    present = {recording["recording_type"] for recording in recording_files}
+    reasons = {}
+    if "keep" in rule:
+        for recording_type in present - set(rule["keep"]):
+            reasons[recording_type] = "not in keep list"
+    for recording_type in present & set(rule.get("drop", [])):
+        reasons[recording_type] = "in drop list"
+    for group in rule.get("prefer_one_of", []):
+        delivered = [t for t in group if t in present and t not in reasons]
+        for recording_type in delivered[1:]:
+            reasons[recording_type] = f"{delivered[0]} preferred"
+
+    kept, skipped = [], []
+    for recording in recording_files:
+        reason = reasons.get(recording["recording_type"])
+        if reason is None:
+            kept.append(recording)
+        else:
+            skipped.append(
+                {
+                    "recording_type": recording["recording_type"],
+                    "zoom_file_id": recording["id"],
+                    "zoom_file_size": recording.get("file_size", 0),
+                    "reason": reason,
+                }
+            )
+    return kept, skipped
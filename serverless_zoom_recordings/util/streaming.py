@@ -0,0 +1,237 @@
+"""
+Stream an HTTP response body into S3 with a fixed memory footprint.
+
+The body is read with `readinto` directly into a small pool of
+preallocated buffers.  Each full buffer is uploaded as one part of a
+multipart upload and returned to the pool when the part is stored.  When
+every buffer is in flight, reading pauses until one comes back, so memory
+use is `buffer_count * part_size` no matter how large the file is.
+
+`urllib3` doesn't check a streamed body against its `Content-Length`, so a
+connection that closes early looks like the end of the file.  Given the
+expected size, `stream_to_s3` raises `IncompleteTransfer` instead of
+storing a short object.
+"""
+import io
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+class IncompleteTransfer(Exception):
+    """The stream ended before (or after) the expected number of bytes."""
+
+
+class BufferPool:
+    """
+    A fixed set of reusable `bytearray` buffers.
+
+    :param count: Number of buffers
+    :param size: Size of each buffer in bytes
+    """
+
+    def __init__(self, count, size):
+        self.size = size
+        self._free = queue.Queue()
+        for _ in range(count):
+            self._free.put(bytearray(size))
+
+    def acquire(self):
+        """Take a buffer, blocking until one is free."""
+        return self._free.get()
+
+    def release(self, buffer):
+        """Return a buffer to the pool."""
+        self._free.put(buffer)
+
+
+class BufferReader(io.RawIOBase):
+    """
+    Seekable, read-only file object over a `memoryview`, so a filled buffer
+    can be handed to boto3 (which may re-read it to compute checksums or to
+    retry) without copying it.
+    """
+
+    def __init__(self, view):
+        super().__init__()
+        self._view = view
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        count = min(len(b), len(self._view) - self._position)
+        b[:count] = self._view[self._position : self._position + count]
+        self._position += count
+        return count
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._position = max(0, min(offset, len(self._view)))
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def __len__(self):
+        return len(self._view)
+
+
+class ThrottledReader:
+    """
+    Wrap a readable stream so it is read no faster than a set rate.
+
+    :param source: file-like object with `readinto`
+    :param bytes_per_second: float, Average read rate limit
+    """
+
+    def __init__(self, source, bytes_per_second):
+        self._source = source
+        self._rate = bytes_per_second
+        self._started = time.monotonic()
+        self._count = 0
+
+    def readinto(self, b):
+        count = self._source.readinto(b)
+        if count:
+            self._count += count
+            ahead = self._count / self._rate - (time.monotonic() - self._started)
+            if ahead > 0:
+                time.sleep(ahead)
+        return count
+
+
+def fill_buffer(source, buffer):
+    """Read from `source` until `buffer` is full or the source is exhausted.
+
+    :param source: file-like object with `readinto`
+    :param buffer: bytearray to fill
+
+    :returns: int, Number of bytes read
+    """
+    view = memoryview(buffer)
+    filled = 0
+    while filled < len(buffer):
+        count = source.readinto(view[filled:])
+        if not count:
+            break
+        filled += count
+    return filled
+
+
+def stream_to_s3(
+    source,
+    s3_client,
+    bucket,
+    key,
+    part_size=8 * 1024 * 1024,
+    buffer_count=3,
+    extra_args=None,
+    expected_size=None,
+    log=None,
+):
+    """Copy a readable stream to an S3 object.
+
+    Objects smaller than one part are stored with a single `PutObject`;
+    larger ones with a multipart upload that is aborted if anything fails.
+    Nothing is stored if the stream's length isn't `expected_size`.
+
+    :param source: file-like object with `readinto`, e.g. `urllib3` response
+    :param s3_client: boto3 S3 client
+    :param bucket: string, Destination bucket
+    :param key: string, Destination key
+    :param part_size: int, Bytes per part (and per buffer)
+    :param buffer_count: int, Number of buffers, which is also the number of
+        parts uploading at once
+    :param extra_args: dict, Extra arguments such as `ContentType` for the
+        `PutObject` or `CreateMultipartUpload` call
+    :param expected_size: int, Length the stream must have
+    :param log: structlog logger
+
+    :returns: dict, `ETag` and `Size` of the stored object
+    :raises IncompleteTransfer: if the stream isn't `expected_size` long
+    """
+    if part_size < MIN_PART_SIZE:
+        raise ValueError(f"part_size must be at least {MIN_PART_SIZE} bytes")
+    extra_args = extra_args or {}
+    pool = BufferPool(buffer_count, part_size)
+
+    buffer = pool.acquire()
+    filled = fill_buffer(source, buffer)
+    if filled < part_size:
+        _check_size(filled, expected_size, key)
+        response = s3_client.put_object(
+            Bucket=bucket,
+            Key=key,
+            Body=BufferReader(memoryview(buffer)[:filled]),
+            **extra_args,
+        )
+        return {"ETag": response["ETag"], "Size": filled}
+
+    response = s3_client.create_multipart_upload(Bucket=bucket, Key=key, **extra_args)
+    upload_id = response["UploadId"]
+
+    def upload_part(part_number, buffer, length):
+        try:
+            response = s3_client.upload_part(
+                Bucket=bucket,
+                Key=key,
+                UploadId=upload_id,
+                PartNumber=part_number,
+                Body=BufferReader(memoryview(buffer)[:length]),
+            )
+        finally:
+            pool.release(buffer)
+        if log:
+            log.debug(
+                "Stream to S3", reason="Part uploaded", part=part_number, size=length
+            )
+        return {"PartNumber": part_number, "ETag": response["ETag"]}
+
+    futures = []
+    size = 0
+    try:
+        with ThreadPoolExecutor(max_workers=buffer_count) as executor:
+            part_number = 0
+            while filled:
+                part_number += 1
+                size += filled
+                futures.append(
+                    executor.submit(upload_part, part_number, buffer, filled)
+                )
+                # Blocks while every buffer is uploading
+                buffer = pool.acquire()
+                if any(future.done() and future.exception() for future in futures):
+                    pool.release(buffer)
+                    break
+                filled = fill_buffer(source, buffer)
+            else:
+                pool.release(buffer)
+        parts = [future.result() for future in futures]
+        _check_size(size, expected_size, key)
+        response = s3_client.complete_multipart_upload(
+            Bucket=bucket,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": parts},
+        )
+    except BaseException:
+        s3_client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
+    return {"ETag": response["ETag"], "Size": size}
+
+
+def _check_size(size, expected_size, key):
+    if expected_size is not None and size != expected_size:
+        raise IncompleteTransfer(
+            f"Read {size} bytes for {key}, expected {expected_size}"
+        )
@@ -0,0 +1,165 @@
+"""
+Trace an ingest across the chain of Lambda functions.
+
+A trace starts when `zoom_webhook` receives a webhook and follows the
+recording through `invoke_stepfunction`, the step function's tasks and the
+web builder message.  Decorate a handler with `@traced`: each invocation is
+a span, logged as one "Trace span" line with its start and end times when
+the handler returns or raises, and `trace_id` is added to every other log
+line of the invocation.  Requests a handler rejects with one of
+`UNTRACED_STATUS_CODES` (forged, oversized or rate-limited webhooks) are not
+part of any ingest and leave no span line.
+
+The context travels in a `_trace` field of Lambda and step function
+payloads (see `trace_context`), in SQS message attributes (see
+`message_attributes`), and as the X-Ray trace header of the step function
+execution (see `trace_header`).  An invocation without a `_trace` field
+starts a new trace.  `tools/trace_report.py` rebuilds each recording's
+critical path from the span log lines.
+"""
+import functools
+import secrets
+import threading
+import time
+
+import structlog
+
+TRACE_FIELD = "_trace"
+UNTRACED_STATUS_CODES = frozenset({401, 413, 429})
+
+_local = threading.local()
+
+
+class Span:
+    """
+    One handler invocation within a trace.
+
+    :param hop: string, Name of the handler
+    :param parent: dict, Trace context of the caller, or None to start a
+        new trace
+    """
+
+    def __init__(self, hop, parent=None):
+        self.hop = hop
+        if parent and parent.get("trace_id"):
+            self.trace_id = parent["trace_id"]
+            self.parent_span_id = parent.get("parent_span_id")
+        else:
+            # X-Ray trace id format, so it can double as the trace header
+            self.trace_id = f"1-{int(time.time()):08x}-{secrets.token_hex(12)}"
+            self.parent_span_id = None
+        self.span_id = secrets.token_hex(8)
+        self.start = time.time()
+        self.end = None
+        self.annotations = {}
+
+    def finish(self, outcome, log):
+        self.end = time.time()
+        log.info(
+            "Trace span",
+            reason=self.hop,
+            trace_id=self.trace_id,
+            span_id=self.span_id,
+            parent_span_id=self.parent_span_id,
+            start=round(self.start, 6),
+            end=round(self.end, 6),
+            duration_ms=round((self.end - self.start) * 1000, 3),
+            outcome=outcome,
+            **self.annotations,
+        )
+
+
+def _rejected(result):
+    """Whether a handler result is an HTTP response rejecting the request."""
+    if not isinstance(result, dict):
+        return False
+    try:
+        return int(result.get("statusCode", 0)) in UNTRACED_STATUS_CODES
+    except (TypeError, ValueError):
+        return False
+
+
+def traced(handler):
+    """Decorate a Lambda handler so each invocation is logged as a span."""
+    hop = handler.__module__.rsplit(".", 1)[-1]
+
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        parent = event.get(TRACE_FIELD) if isinstance(event, dict) else None
+        span = Span(hop, parent)
+        if isinstance(event, dict):
+            recording_id = event.get("_recording_id") or event.get("recording_id")
+            if recording_id:
+                span.annotations["recording_id"] = recording_id
+        if context is not None:
+            span.annotations["aws_request_id"] = context.aws_request_id
+
+        # Handlers invoked in-process (as in the load test) nest their spans
+        outer = getattr(_local, "span", None)
+        _local.span = span
+        structlog.threadlocal.bind_threadlocal(trace_id=span.trace_id)
+        outcome = "error"
+        try:
+            result = handler(event, context)
+            outcome = None if _rejected(result) else "ok"
+            return result
+        finally:
+            try:
+                if outcome is not None:
+                    span.finish(outcome, structlog.get_logger())
+            finally:
+                _local.span = outer
+                if outer is not None:
+                    structlog.threadlocal.bind_threadlocal(trace_id=outer.trace_id)
+                else:
+                    structlog.threadlocal.unbind_threadlocal("trace_id")
+
+    return wrapper
+
+
+def current_span():
+    """The span of the running invocation, or None outside `@traced`."""
+    return getattr(_local, "span", None)
+
+
+def annotate(**fields):
+    """Add fields to the span log line of the running invocation."""
+    span = current_span()
+    if span is not None:
+        span.annotations.update(fields)
+
+
+def trace_context():
+    """Trace context to pass on in the `_trace` field of a payload.
+
+    :returns: dict, or None outside `@traced`
+    """
+    span = current_span()
+    if span is None:
+        return None
+    return {"trace_id": span.trace_id, "parent_span_id": span.span_id}
+
+
+def trace_header():
+    """X-Ray trace header continuing the running trace.
+
+    :returns: string, or None outside `@traced`
+    """
+    span = current_span()
+    if span is None:
+        return None
+    return f"Root={span.trace_id};Parent={span.span_id}"
+
+
+def message_attributes():
+    """SQS message attributes carrying the trace context.
+
+    :returns: dict, Empty outside `@traced`
+    """
+    context = trace_context()
+    if context is None:
+        return {}
+    return {
+        name: {"DataType": "String", "StringValue": value}
+        for name, value in context.items()
+    }
@@ -0,0 +1,85 @@
+"""
+HTTP connections that last across warm Lambda invocations.
+
+A `requests.Session` built inside a handler is thrown away at the end of the
+invocation, along with its open connections, so every invocation pays for a
+new TCP and TLS handshake with Zoom.  `pooled_session` keeps one session per
+configuration for the life of the container.  `s3_transfer_config` sizes the
+botocore connection pool to the number of parts uploaded at once, since the
+default of 10 connections queues larger transfers.
+"""
+import http.client as http_client
+import logging
+from contextlib import contextmanager
+
+import requests
+from botocore.config import Config
+from requests.adapters import HTTPAdapter
+from urllib3 import Retry
+
+_SESSIONS = {}
+
+
+def pooled_session(pool_size=1, retries=4, backoff_factor=1):
+    """Get the container's keep-alive session for a pool size and retry policy.
+
+    :param pool_size: int, Connections kept open per host
+    :param retries: int, Retries of failed requests, including 429 and 5xx
+        responses
+    :param backoff_factor: float, `urllib3.Retry` backoff factor
+
+    :returns: `requests.Session`
+    """
+    key = (pool_size, retries, backoff_factor)
+    if key not in _SESSIONS:
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=Retry(
+                total=retries,
+                backoff_factor=backoff_factor,
+                allowed_methods=None,
+                status_forcelist=[429, 500, 502, 503, 504],
+            ),
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _SESSIONS[key] = session
+    return _SESSIONS[key]
+
+
+def s3_transfer_config(concurrency):
+    """botocore configuration for a client uploading `concurrency` parts at once.
+
+    :param concurrency: int, Parts uploaded at once
+
+    :returns: `botocore.config.Config`
+    """
+    # A few spare connections for the create, complete and metadata calls
+    return Config(max_pool_connections=max(10, concurrency + 2))
+
+
+@contextmanager
+def wire_debug(logger_name="urllib3"):
+    """Log HTTP traffic on the wire for the duration of a `with` block.
+
+    Turns on `http.client` debug output and debug logging from `urllib3`,
+    and puts both back as they were on the way out, even if the block
+    raises, so a failed invocation doesn't leave them on for the next one.
+
+    :param logger_name: string, Logger to set to DEBUG
+    """
+    logger = logging.getLogger(logger_name)
+    debuglevel = http_client.HTTPConnection.debuglevel
+    level = logger.level
+    propagate = logger.propagate
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = True
+    http_client.HTTPConnection.debuglevel = 1
+    try:
+        yield
+    finally:
+        http_client.HTTPConnection.debuglevel = debuglevel
+        logger.setLevel(level)
+        logger.propagate = propagate
@@ -5,24 +5,35 @@ If the webhook has the correct metadata, call the `invoke_stepfunction` lambda.
 """
 import hashlib
 import hmac
-import json
 import os
-from base64 import b64decode
 
 import boto3
 import structlog
 
+from .util.codec import dumps, dumps_str, loads
 from .util.httpapi_helpers import httpapi_response
 from .util.log_config import setup_logging
+from .util.profiling import profiled
+from .util.tracing import TRACE_FIELD, trace_context, traced
+from .util.webhook_validation import RateLimiter, WebhookRejected, validate_webhook
 
 DEPLOYMENT_STAGE = os.environ["DEPLOYMENT_STAGE"]
 BASE_PATH = os.environ["BASE_PATH"]
 ZOOM_WEBHOOK_SECRET_TOKEN = os.environ["ZOOM_WEBHOOK_SECRET_TOKEN"]
 INVOKE_STEPFUNCTION_ARN = os.environ["INVOKE_STEPFUNCTION_ARN"]
+ZOOM_WEBHOOK_MAX_AGE = int(os.environ.get("ZOOM_WEBHOOK_MAX_AGE", "300"))
+ZOOM_WEBHOOK_MAX_BODY_BYTES = int(
+    os.environ.get("ZOOM_WEBHOOK_MAX_BODY_BYTES", "262144")
+)
+ZOOM_WEBHOOK_RATE_LIMIT = float(os.environ.get("ZOOM_WEBHOOK_RATE_LIMIT", "10"))
+ZOOM_WEBHOOK_RATE_BURST = int(os.environ.get("ZOOM_WEBHOOK_RATE_BURST", "20"))
 
 lambda_client = boto3.client("lambda")
+rate_limiter = RateLimiter(rate=ZOOM_WEBHOOK_RATE_LIMIT, burst=ZOOM_WEBHOOK_RATE_BURST)
 
 
+@profiled
+@traced
 def handler(event, context):
     """Handle Zoom recording completed webhook event"""
     setup_logging()
@@ -34,50 +45,42 @@ def handler(event, context):
     log = structlog.get_logger()
     log = log.bind(aws_request_id=aws_request_id)
 
-    log.info("STARTED", httpapi_event=event)
-
     ##STAGE Validate webhook content
     stage = "Validate webhook content"
-
-    # Did we get the anticipated Zoom Webhook headers?
-    zm_request_timestamp = event["headers"].get("x-zm-request-timestamp", None)
-    if not zm_request_timestamp:
-        detail = "Required x-zm-request-timestamp HTTP header not received"
-        log.error(stage, reason="POST rejected", detail=detail)
-        return httpapi_response(statusCode="401", body=detail)
-
-    zm_signature = event["headers"].get("x-zm-signature", None)
-    if not zm_signature:
-        detail = "Required x-zm-signature HTTP header not received"
-        log.error(stage, reason="POST rejected", detail=detail)
-        return httpapi_response(statusCode="401", body=detail)
-
-    # Did we get POSTed content?
-    if "body" in event and "event" in event["body"]:
-        body = event["body"]
-    else:
-        detail = "Invalid Zoom POST content received"
-        log.error(stage, reason="POST rejected", detail=detail)
-        return httpapi_response(statusCode="400", body=detail)
-
-    # Un-Base64-Encode
-    if "isBase64Encoded" in event and event["isBase64Encoded"]:
-        body = b64decode(body)
-    body = json.loads(event["body"])
-    log.debug(stage, reason="Parsed Zoom webhook", body=body)
-
-    # Is this a valid webhook from Zoom?
-    zoom_message = f"v0:{zm_request_timestamp}:{event['body']}"
-    zoom_message_hash = hmac.new(
-        ZOOM_WEBHOOK_SECRET_TOKEN.encode("utf-8"),
-        zoom_message.encode("utf-8"),
-        hashlib.sha256,
+    source_ip = (
+        event.get("requestContext", {}).get("http", {}).get("sourceIp", "unknown")
     )
-    zoom_message_hex_digest = zoom_message_hash.hexdigest()
-    if zm_signature != f"v0={zoom_message_hex_digest}":
-        detail = f"Computed hash does not match: {zm_signature=} and {zoom_message_hex_digest=} for {zoom_message=}"
+    log = log.bind(source_ip=source_ip)
+
+    # Rejections are logged without the request body: a flood of forged
+    # requests should cost as little as possible.  Only rejected requests
+    # count against a source's rate limit, so authentic webhooks from Zoom's
+    # delivery addresses are never throttled.
+    if rate_limiter.exhausted(source_ip):
+        detail = "Too many rejected requests"
+        log.warning(stage, reason="POST rejected", detail=detail)
+        return httpapi_response(statusCode=429, body=detail)
+    try:
+        raw_body = validate_webhook(
+            event,
+            ZOOM_WEBHOOK_SECRET_TOKEN,
+            max_age=ZOOM_WEBHOOK_MAX_AGE,
+            max_body_bytes=ZOOM_WEBHOOK_MAX_BODY_BYTES,
+        )
+    except WebhookRejected as rejection:
+        rate_limiter.allow(source_ip)
+        log.warning(stage, reason="POST rejected", detail=rejection.detail)
+        return httpapi_response(statusCode=rejection.status_code, body=rejection.detail)
+
+    try:
+        body = loads(raw_body)
+    except ValueError:
+        body = None
+    if not isinstance(body, dict) or "event" not in body:
+        detail = "Invalid Zoom POST content received"
         log.error(stage, reason="POST rejected", detail=detail)
-        return httpapi_response(statusCode="401", body=detail)
+        return httpapi_response(statusCode=400, body=detail)
+    log.info("STARTED", reason=body["event"], body=body)
 
     # Did we get a Zoom webhook endpoint validation request?
     if body["event"] == "endpoint.url_validation":
@@ -92,7 +95,7 @@ def handler(event, context):
             "plainToken": zoom_plain_token,
             "encryptedToken": zoom_token_hex_digest,
         }
-        validation_response_json = json.dumps(validation_response)
+        validation_response_json = dumps_str(validation_response)
         detail = "Returning Webhook validation JSON"
         log.info(stage, reason="Validation sent", detail=validation_response_json)
         return httpapi_response(statusCode="200", body=validation_response_json)
@@ -106,6 +109,7 @@ def handler(event, context):
     ## STAGE Call invoke_stepfunction lambda
     stage = "Call invoke_stepfunction lambda"
 
+    body[TRACE_FIELD] = trace_context()
     log.debug(
         stage,
         reason="Calling lambda",
@@ -116,6 +120,6 @@ def handler(event, context):
         FunctionName=INVOKE_STEPFUNCTION_ARN,
         InvocationType="RequestResponse",
         LogType="Tail",
-        Payload=json.dumps(body),
+        Payload=dumps(body),
     )
     log.info(stage, reason="Call completed", detail=lambda_response)
@@ -0,0 +1,85 @@
+"""
+Helpers shared by the tools.
+
+Sample messages, percentiles, signed webhook events, and the set-up for
+running handlers in-process: a Lambda context, silenced handler logging and
+moto's in-process AWS.
+"""
+import hashlib
+import hmac
+import logging
+import math
+import os
+import time
+import uuid
+from pathlib import Path
+from types import SimpleNamespace
+
+SAMPLE_MESSAGES = Path(__file__).resolve().parent.parent / "sample-messages"
+SAMPLE_MESSAGE = SAMPLE_MESSAGES / "zoom-recording-complete.json"
+SECRET_TOKEN = "load-test-secret"
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return float("nan")
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def sign_event(raw_body, source_ip):
+    """Wrap a webhook body in an HTTP API event with fresh Zoom signature headers."""
+    timestamp = str(int(time.time()))
+    signature = hmac.new(
+        SECRET_TOKEN.encode("utf-8"),
+        f"v0:{timestamp}:{raw_body}".encode("utf-8"),
+        hashlib.sha256,
+    ).hexdigest()
+    return {
+        "headers": {
+            "x-zm-request-timestamp": timestamp,
+            "x-zm-signature": f"v0={signature}",
+        },
+        "body": raw_body,
+        "isBase64Encoded": False,
+        "requestContext": {"http": {"sourceIp": source_ip}},
+    }
+
+
+def lambda_context():
+    """A Lambda context for a handler invoked in-process."""
+    return SimpleNamespace(aws_request_id=str(uuid.uuid4()))
+
+
+def silence_logging(*modules):
+    """Configure the handlers' logging once, then silence it.
+
+    :param modules: Handler modules, whose per-invocation `setup_logging`
+        is disabled
+    """
+    # pylint: disable=import-outside-toplevel
+    from serverless_zoom_recordings.util.log_config import setup_logging
+
+    setup_logging()
+    logging.disable(logging.CRITICAL)
+    for module in modules:
+        module.setup_logging = lambda: None
+
+
+def in_process_aws(parser, message="install moto to run against an in-process AWS"):
+    """Start moto's in-process AWS, with stand-in credentials.
+
+    :param parser: argparse.ArgumentParser, Exits through it if moto is
+        not installed
+    :param message: string, Error message when moto is not installed
+
+    :returns: The `mock_aws` context manager
+    """
+    try:
+        from moto import mock_aws  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        parser.error(message)
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "tools")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "tools")
+    return mock_aws()
@@ -0,0 +1,257 @@
+"""
+Benchmark `RecordingCatalog` queries against a DynamoDB stand-in.
+
+Creates a meetings table with the secondary indexes of `serverless.yml` in
+DynamoDB Local or a moto server given with `--endpoint-url`, or moto
+in-process when no endpoint is given and moto is installed, fills it with
+synthetic recordings, and times each kind of catalog query.
+
+    python -m tools.catalog_benchmark --recordings 2000 --repeat 20
+    python -m tools.catalog_benchmark --endpoint-url http://localhost:8000
+
+For each query, reports the items returned, the DynamoDB requests made per
+query, and latency percentiles.  Two hand-written equivalents are timed for
+comparison: an index query followed by one `GetItem` per recording, and a
+full scan filtered client-side.  The cached rows repeat the query with the
+in-container cache enabled.
+"""
+import argparse
+import os
+import random
+import time
+import uuid
+from collections import Counter
+from contextlib import nullcontext
+from datetime import datetime, timedelta, timezone
+
+import boto3
+from boto3.dynamodb.conditions import Key
+
+from serverless_zoom_recordings.util.catalog import RecordingCatalog
+from serverless_zoom_recordings.util.recording_path import recording_path
+from tools._common import in_process_aws, percentile
+
+INDEXES = {
+    "organization-index": ("organization", ["meeting_id", "meeting_topic"]),
+    "meeting-index": ("meeting_topic", ["recording_path", "start_time"]),
+    "path-index": ("recording_path", ["password"]),
+}
+ORGANIZATIONS = ["FOLIO", "CORAL", "VuFind", "ArchivesSpace", "Fedora", "Samvera"]
+TOPIC_KINDS = ["Tech Council", "Product Council", "Sysops SIG", "Dev Meeting"]
+
+
+def meetings_table(endpoint_url):
+    """Create a meetings table with the deployed secondary indexes."""
+    dynamodb = boto3.resource(
+        "dynamodb",
+        endpoint_url=endpoint_url,
+        region_name=os.environ.get("AWS_DEFAULT_REGION", "us-east-1"),
+    )
+    key_attributes = ["recording_id"] + [key for key, _ in INDEXES.values()]
+    table = dynamodb.create_table(
+        TableName=f"meetings-benchmark-{uuid.uuid4().hex[:8]}",
+        KeySchema=[{"AttributeName": "recording_id", "KeyType": "HASH"}],
+        AttributeDefinitions=[
+            {"AttributeName": name, "AttributeType": "S"} for name in key_attributes
+        ],
+        GlobalSecondaryIndexes=[
+            {
+                "IndexName": index_name,
+                "KeySchema": [{"AttributeName": key, "KeyType": "HASH"}],
+                "Projection": {
+                    "ProjectionType": "INCLUDE",
+                    "NonKeyAttributes": attributes,
+                },
+            }
+            for index_name, (key, attributes) in INDEXES.items()
+        ],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    table.wait_until_exists()
+    return table
+
+
+def synthetic_recording(rng, start):
+    """A recording document shaped like the ones `finish_ingest` stores."""
+    organization = rng.choice(ORGANIZATIONS)
+    meeting_topic = f"{organization} {rng.choice(TOPIC_KINDS)}"
+    end = start + timedelta(minutes=rng.randint(20, 120))
+    start_time = start.strftime("%Y-%m-%dT%H:%M:%SZ")
+    end_time = end.strftime("%Y-%m-%dT%H:%M:%SZ")
+    document = {
+        "recording_id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "organization": organization,
+        "meeting_topic": meeting_topic,
+        "meeting_id": str(rng.randint(10**9, 10**10)),
+        "host_id": f"host{rng.randint(1, 20)}",
+        "start_time": start_time,
+        "end_time": end_time,
+        "password": f"{rng.getrandbits(32):08x}",
+        "files": [
+            {
+                "recording_type": recording_type,
+                "mime_type": mime_type,
+                "zoom_file_size": rng.randint(10**5, 10**9),
+                "recording_start": start_time,
+                "recording_end": end_time,
+            }
+            for recording_type, mime_type in (
+                ("shared_screen_with_speaker_view", "video/mp4"),
+                ("audio_only", "audio/m4a"),
+                ("chat_file", "text/plain"),
+            )
+        ],
+    }
+    document["recording_path"] = recording_path(
+        organization=organization,
+        meeting_topic=meeting_topic,
+        meeting_start=start_time,
+    )
+    return document
+
+
+def fill_table(table, recordings, seed):
+    """Write synthetic recordings, one every few hours back from 2026."""
+    rng = random.Random(seed)
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    documents = []
+    with table.batch_writer() as batch:
+        for _ in range(recordings):
+            start -= timedelta(hours=rng.randint(1, 12))
+            document = synthetic_recording(rng, start)
+            batch.put_item(Item=document)
+            documents.append(document)
+    return documents
+
+
+def count_requests(table):
+    """Count the DynamoDB requests made through the table's client."""
+    requests = Counter()
+
+    def count(model, **_):
+        requests[model.name] += 1
+
+    table.meta.client.meta.events.register("before-call.dynamodb", count)
+    return requests
+
+
+def query_then_get(table, organization):
+    """Hand-written equivalent of `by_organization` for full documents."""
+    query_args = {
+        "IndexName": "organization-index",
+        "KeyConditionExpression": Key("organization").eq(organization),
+    }
+    while True:
+        response = table.query(**query_args)
+        for item in response["Items"]:
+            yield table.get_item(Key={"recording_id": item["recording_id"]})["Item"]
+        if "LastEvaluatedKey" not in response:
+            return
+        query_args["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def scan_filtered(table, meeting_topic):
+    """Hand-written equivalent of `by_topic`: scan and filter client-side."""
+    scan_args = {}
+    while True:
+        response = table.scan(**scan_args)
+        for item in response["Items"]:
+            if item.get("meeting_topic") == meeting_topic:
+                yield item
+        if "LastEvaluatedKey" not in response:
+            return
+        scan_args["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def benchmarks(table, documents):
+    """Name and zero-argument callable of each timed query."""
+    catalog = RecordingCatalog(table)
+    cached = RecordingCatalog(table, cache_ttl=300)
+    sample = documents[len(documents) // 2]
+    organization = sample["organization"]
+    meeting_topic = sample["meeting_topic"]
+    times = sorted(document["start_time"] for document in documents)
+    start, end = times[len(times) // 4], times[len(times) // 2]
+    return [
+        ("get", lambda: [catalog.get(sample["recording_id"])]),
+        (
+            "by_organization, index attributes",
+            lambda: catalog.by_organization(organization, ["meeting_topic"]),
+        ),
+        (
+            "by_organization, full documents",
+            lambda: catalog.by_organization(organization),
+        ),
+        (
+            "  query + GetItem per recording",
+            lambda: query_then_get(table, organization),
+        ),
+        (
+            "by_topic, index attributes",
+            lambda: catalog.by_topic(meeting_topic, ["start_time"]),
+        ),
+        ("  scan + filter", lambda: scan_filtered(table, meeting_topic)),
+        ("by_path", lambda: catalog.by_path(sample["recording_path"], ["password"])),
+        (
+            "by_time_range, organization",
+            lambda: catalog.by_time_range(start, end, organization, ["start_time"]),
+        ),
+        ("by_time_range, scan", lambda: catalog.by_time_range(start, end)),
+        (
+            "by_organization, full, cached",
+            lambda: cached.by_organization(organization),
+        ),
+    ]
+
+
+def run(args):
+    table = meetings_table(args.endpoint_url)
+    started = time.perf_counter()
+    documents = fill_table(table, args.recordings, args.seed)
+    print(
+        f"{len(documents)} recordings written in {time.perf_counter() - started:.1f}s"
+    )
+    requests = count_requests(table)
+
+    print(f"{'query':<36}{'items':>7}{'requests':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for name, query in benchmarks(table, documents):
+        durations = []
+        items = 0
+        requests.clear()
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            items = sum(1 for _ in query())
+            durations.append((time.perf_counter() - started) * 1000)
+        durations.sort()
+        per_query = sum(requests.values()) / args.repeat
+        print(
+            f"{name:<36}{items:>7}{per_query:>10.1f}"
+            f"{percentile(durations, 0.50):>10.2f}{percentile(durations, 0.95):>10.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark recording catalog queries against a DynamoDB stand-in"
+    )
+    parser.add_argument(
+        "--recordings", type=int, default=2000, help="Recordings in the table"
+    )
+    parser.add_argument("--repeat", type=int, default=20, help="Runs of each query")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the recordings")
+    parser.add_argument(
+        "--endpoint-url", help="DynamoDB stand-in, e.g. http://localhost:8000"
+    )
+    args = parser.parse_args()
+
+    context = nullcontext()
+    if not args.endpoint_url:
+        context = in_process_aws(
+            parser, "give --endpoint-url, or install moto to run in-process"
+        )
+    with context:
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Aggregate the catalog snapshot written by `export_catalog`.
+
+Loads `_catalog/recordings.ndjson.gz` from the recordings bucket (or a
+downloaded copy) into a pandas DataFrame, one row per recording file, and
+prints a grouped sum.  Needs pandas, which the Lambda functions don't:
+`pip install pandas`.
+
+    python -m tools.catalog_query --profile olf --bucket BUCKET hours
+    python -m tools.catalog_query --file recordings.ndjson.gz bytes
+    python -m tools.catalog_query --file recordings.ndjson.gz \\
+        --group-by organization,recording_type --sum file_size
+
+Reports:
+
+* `hours`: hours recorded per organization per month
+* `bytes`: GiB stored per recording type
+* `recordings`: recordings per organization per month
+
+Durations and recording counts are taken once per recording, not once per
+file.
+"""
+import argparse
+import io
+import sys
+
+import boto3
+
+from serverless_zoom_recordings.util.catalog_snapshot import SNAPSHOT_KEY
+
+REPORTS = {
+    "hours": (["organization", "month"], "duration_seconds", 1 / 3600),
+    "bytes": (["recording_type"], "file_size", 1 / 2**30),
+    "recordings": (["organization", "month"], "recording_id", None),
+}
+# Columns with one value per recording, repeated on each of its files
+RECORDING_MEASURES = ("duration_seconds", "recording_id")
+
+
+def load_snapshot(pandas, source):
+    """Read snapshot rows into a DataFrame from a path or file object."""
+    return pandas.read_json(source, lines=True, compression="gzip", dtype=False)
+
+
+def aggregate(frame, group_by, measure, scale=None):
+    """Sum (or, for `recording_id`, count) a measure over groups.
+
+    :param frame: DataFrame of snapshot rows
+    :param group_by: list, Columns to group by
+    :param measure: string, Column to sum
+    :param scale: float, Factor to apply to the sums
+
+    :returns: pandas Series indexed by the group columns
+    """
+    if measure in RECORDING_MEASURES:
+        frame = frame.drop_duplicates("recording_id")
+    grouped = frame.groupby(group_by)[measure]
+    result = grouped.count() if measure == "recording_id" else grouped.sum()
+    if scale:
+        result = result * scale
+    return result.sort_index()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("report", nargs="?", choices=sorted(REPORTS))
+    parser.add_argument("--bucket", help="Recordings bucket")
+    parser.add_argument("--profile", help="AWS profile")
+    parser.add_argument("--file", help="Downloaded snapshot instead of the bucket")
+    parser.add_argument("--group-by", help="Comma-separated columns to group by")
+    parser.add_argument("--sum", help="Column to sum")
+    parser.add_argument("--csv", action="store_true", help="Print CSV")
+    args = parser.parse_args()
+    if not args.file and not args.bucket:
+        parser.error("give --bucket or --file")
+    if args.report:
+        group_by, measure, scale = REPORTS[args.report]
+    elif args.group_by and args.sum:
+        group_by, measure, scale = args.group_by.split(","), args.sum, None
+    else:
+        parser.error("give a report, or --group-by and --sum")
+
+    try:
+        import pandas  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        sys.exit("catalog_query needs pandas: pip install pandas")
+
+    source = args.file
+    if not source:
+        s3_client = boto3.Session(profile_name=args.profile).client("s3")
+        response = s3_client.get_object(Bucket=args.bucket, Key=SNAPSHOT_KEY)
+        source = io.BytesIO(response["Body"].read())
+    frame = load_snapshot(pandas, source)
+    missing = [column for column in group_by + [measure] if column not in frame]
+    if missing:
+        parser.error(f"unknown columns: {', '.join(missing)}")
+
+    result = aggregate(frame, group_by, measure, scale)
+    if args.csv:
+        print(result.to_csv(), end="")
+    else:
+        with pandas.option_context("display.max_rows", None):
+            print(result.round(2).to_string())
+
+
+if __name__ == "__main__":
+    main()
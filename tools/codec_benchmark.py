@@ -0,0 +1,137 @@
+"""
+Measure the JSON codec against the standard library on the stack's documents.
+
+Serializes and deserializes each document with `json` (as the handlers did
+before `util/codec.py`), with `codec.dumps` and `codec.loads`, and with the
+gzip compression that `document_args` applies to documents over
+`DOCUMENT_GZIP_MIN_BYTES`.  The documents are the sample messages in
+`sample-messages/`, and synthetic large ones: a recording document as read
+from DynamoDB (with `Decimal` numbers), a complete metadata bundle, and an
+organization listing manifest.
+
+    python -m tools.codec_benchmark --manifest-entries 5000
+
+Reports the size of each encoding, the bytes saved against `json`, and
+microseconds per encode and decode.
+"""
+import argparse
+import json
+import random
+import timeit
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from serverless_zoom_recordings.util.codec import document_args, dumps, loads
+from serverless_zoom_recordings.util.manifests import manifest_entry
+from serverless_zoom_recordings.util.metadata_store import make_bundle
+from tools._common import SAMPLE_MESSAGES
+from tools.catalog_benchmark import synthetic_recording
+
+
+def json_default(obj):
+    """What a `json.dumps` caller had to pass for DynamoDB items."""
+    if isinstance(obj, Decimal):
+        return int(obj) if obj == obj.to_integral_value() else float(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dynamodb_item(document):
+    """A document with its numbers as the `Decimal`s DynamoDB returns."""
+    if isinstance(document, dict):
+        return {key: dynamodb_item(value) for key, value in document.items()}
+    if isinstance(document, list):
+        return [dynamodb_item(value) for value in document]
+    if isinstance(document, (int, float)) and not isinstance(document, bool):
+        return Decimal(str(document))
+    return document
+
+
+def documents(args):
+    """The documents to measure, keyed by a short description."""
+    samples = {}
+    for path in sorted(SAMPLE_MESSAGES.glob("*.json")):
+        with open(path, encoding="utf-8") as sample:
+            samples[path.name] = json.load(sample)
+
+    rng = random.Random(args.seed)
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    recordings = []
+    for _ in range(args.manifest_entries):
+        start -= timedelta(hours=rng.randint(1, 12))
+        recordings.append(synthetic_recording(rng, start))
+    recording_document = recordings[0]
+    webhook = next(iter(samples.values()), {})
+    bundle = make_bundle(
+        recording_document["recording_id"],
+        {
+            "recording.json": webhook,
+            "recording_document.json": recording_document,
+            **{
+                f"{file['recording_type']}.json": dict(webhook, **file)
+                for file in recording_document["files"]
+            },
+        },
+    )
+    return {
+        **samples,
+        "recording document (DynamoDB)": dynamodb_item(recording_document),
+        "metadata bundle": bundle,
+        f"manifest, {len(recordings)} entries": {
+            "recordings": [manifest_entry(document) for document in recordings]
+        },
+    }
+
+
+def per_call(call):
+    """Microseconds per call, timed over at least 0.2 seconds."""
+    number, seconds = timeit.Timer(call).autorange()
+    return seconds / number * 1e6
+
+
+def run(args):
+    print(
+        f"{'document':<34}{'json B':>10}{'orjson B':>10}{'gzip B':>10}{'saved':>12}"
+        f"  {'encode µs json/orjson/gzip':>28}  {'decode µs json/orjson/gzip':>28}"
+    )
+    for name, document in documents(args).items():
+        standard = json.dumps(document, default=json_default).encode("utf-8")
+        compact = dumps(document)
+        compressed = document_args(document, min_gzip_bytes=1)["Body"]
+        assert json.loads(standard) == loads(compact) == loads(compressed)
+
+        encode = [
+            per_call(lambda: json.dumps(document, default=json_default).encode()),
+            per_call(lambda: dumps(document)),
+            per_call(lambda: document_args(document, min_gzip_bytes=1)),
+        ]
+        decode = [
+            per_call(lambda: json.loads(standard)),
+            per_call(lambda: loads(compact)),
+            per_call(lambda: loads(compressed)),
+        ]
+        saved = [1 - len(body) / len(standard) for body in (compact, compressed)]
+        print(
+            f"{name[:33]:<34}{len(standard):>10}{len(compact):>10}"
+            f"{len(compressed):>10}{saved[0]:>6.0%}{saved[1]:>6.0%}"
+            f"  {'/'.join(f'{t:.1f}' for t in encode):>28}"
+            f"  {'/'.join(f'{t:.1f}' for t in decode):>28}"
+        )
+    print("saved: bytes saved against json by orjson, and by orjson with gzip")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the JSON codec against the standard library"
+    )
+    parser.add_argument(
+        "--manifest-entries",
+        type=int,
+        default=5000,
+        help="Recordings in the synthetic manifest",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the recordings")
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
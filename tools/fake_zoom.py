@@ -0,0 +1,477 @@
+"""
+Local stand-in for the Zoom API and recording downloads, with fault injection.
+
+Serves the endpoints the handlers use, in the shape `zoomus` and the
+handlers expect:
+
+* `POST /oauth/token` (what `zoomus` calls to get a token)
+* `GET /v2/past_meetings/{uuid}` and `GET /v2/meetings/{id}`
+* `GET /v2/users` and `GET /v2/users/{user_id}/recordings`
+* `DELETE /v2/meetings/{uuid}/recordings`
+* `GET /rec/download/{file_id}`, with `Range` support
+
+Recordings are made from `sample-messages/zoom-recording-complete.json` by
+`FakeZoom.new_recording`, which returns a webhook body whose download URLs
+point at the server; file contents are deterministic pseudo-random bytes.
+
+A `FaultProfile` makes responses slow or unreliable: a latency
+distribution, bursts of 429 responses with `Retry-After`, and, for
+downloads, connection resets part-way through the body, bodies cut short of
+their `Content-Length`, slow-drip transfer and mid-body stalls.  Point a
+`ZoomClient` at it with `base_uri=fake.api_uri, oauth_uri=fake.oauth_uri`.
+
+    python -m tools.fake_zoom --profile throttle --port 8765
+
+See `tools/zoom_fault_report.py` for measurements of the handlers against
+each profile.
+"""
+import argparse
+import json
+import random
+import socket
+import struct
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+from tools._common import SAMPLE_MESSAGE
+
+ACCESS_TOKEN = "fake-zoom-token"
+CHUNK_SIZE = 64 * 1024
+
+
+class FaultProfile:
+    """
+    Faults injected into responses.
+
+    :param latency_median: Median delay in seconds before each response
+    :param latency_sigma: Spread of the log-normal delay; 0 for a fixed delay
+    :param throttle_every: Length of the throttling cycle in requests; 0 for
+        no throttling
+    :param throttle_burst: Requests answered with 429 at the start of each
+        cycle
+    :param retry_after: Seconds given in the `Retry-After` header of a 429
+    :param reset_rate: Fraction of downloads reset part-way through the body
+    :param truncate_rate: Fraction of downloads closed part-way through the
+        body, short of `Content-Length`
+    :param stall_rate: Fraction of downloads that pause part-way through
+    :param stall_seconds: Length of a pause
+    :param fault_at: Fraction of the body sent before a reset, truncation or
+        pause
+    :param drip_rate: Download bytes per second; 0 for unlimited
+    """
+
+    def __init__(
+        self,
+        latency_median=0.0,
+        latency_sigma=0.0,
+        throttle_every=0,
+        throttle_burst=0,
+        retry_after=1,
+        reset_rate=0.0,
+        truncate_rate=0.0,
+        stall_rate=0.0,
+        stall_seconds=0.0,
+        fault_at=0.5,
+        drip_rate=0,
+    ):
+        self.latency_median = latency_median
+        self.latency_sigma = latency_sigma
+        self.throttle_every = throttle_every
+        self.throttle_burst = throttle_burst
+        self.retry_after = retry_after
+        self.reset_rate = reset_rate
+        self.truncate_rate = truncate_rate
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+        self.fault_at = fault_at
+        self.drip_rate = drip_rate
+
+    def delay(self, rng):
+        if not self.latency_median:
+            return 0.0
+        if not self.latency_sigma:
+            return self.latency_median
+        return rng.lognormvariate(0, self.latency_sigma) * self.latency_median
+
+    def throttled(self, request_number):
+        if not self.throttle_every:
+            return False
+        return request_number % self.throttle_every < self.throttle_burst
+
+
+PROFILES = {
+    "clean": FaultProfile(),
+    "latency": FaultProfile(latency_median=0.15, latency_sigma=0.8),
+    "throttle": FaultProfile(throttle_every=10, throttle_burst=3, retry_after=1),
+    "reset": FaultProfile(reset_rate=0.5),
+    "truncate": FaultProfile(truncate_rate=0.5),
+    "drip": FaultProfile(drip_rate=512 * 1024),
+    # Longer than the 10 second read timeout of `retrieve_recording`
+    "stall": FaultProfile(stall_rate=0.5, stall_seconds=12),
+}
+
+
+class FakeZoom:
+    """
+    Zoom API and download server running in a background thread.
+
+    :param profile: `FaultProfile`; can be changed between runs
+    :param file_size: int, Serve every recording file with this size instead
+        of the sizes in the sample webhook
+    :param seed: int, Seed of the fault decisions
+    :param host: string, Address to listen on
+    :param port: int, Port to listen on; 0 picks a free port
+    """
+
+    def __init__(self, profile=None, file_size=None, seed=0, host="127.0.0.1", port=0):
+        self.profile = profile or FaultProfile()
+        self.file_size = file_size
+        self.rng = random.Random(seed)
+        with open(SAMPLE_MESSAGE, encoding="utf-8") as sample:
+            self.template = json.load(sample)
+        self.lock = threading.Lock()
+        self.meetings = {}
+        self.files = {}
+        self.deleted = set()
+        self.reset_stats()
+
+        handler = type("FakeZoomHandler", (FakeZoomHandler,), {"fake": self})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def api_uri(self):
+        return f"{self.url}/v2"
+
+    @property
+    def oauth_uri(self):
+        return f"{self.url}/oauth/token"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def reset_stats(self):
+        """Zero the request counters."""
+        with self.lock:
+            self.request_count = 0
+            self.stats = {
+                "requests": Counter(),
+                "statuses": Counter(),
+                "faults": Counter(),
+                "bytes_sent": Counter(),
+            }
+
+    def new_recording(self):
+        """Register a new recorded meeting and return its webhook body.
+
+        :returns: dict, `recording.completed` webhook with a fresh meeting
+            UUID and file ids, and download URLs on this server
+        """
+        body = json.loads(json.dumps(self.template))
+        meeting = body["payload"]["object"]
+        meeting["uuid"] = str(uuid.uuid4())
+        for recording in meeting["recording_files"]:
+            file_id = str(uuid.uuid4())
+            recording["id"] = file_id
+            recording["meeting_id"] = meeting["uuid"]
+            if self.file_size is not None:
+                recording["file_size"] = self.file_size
+            recording["download_url"] = f"{self.url}/rec/download/{file_id}"
+            self.files[file_id] = recording["file_size"]
+        body["download_token"] = ACCESS_TOKEN
+        self.meetings[meeting["uuid"]] = meeting
+        return body
+
+    def file_body(self, file_id):
+        """The contents of a recording file."""
+        return random.Random(file_id).randbytes(self.files[file_id])
+
+    def decide(self, rate):
+        """Make a fault decision that comes out true at `rate`."""
+        with self.lock:
+            return self.rng.random() < rate
+
+
+class FakeZoomHandler(BaseHTTPRequestHandler):
+    """Route requests to the fake endpoints, injecting the profile's faults."""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    fake = None
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        path = urlparse(self.path).path
+        if path == "/oauth/token":
+            self._drain_body()
+            return self._json(200, {"access_token": ACCESS_TOKEN, "expires_in": 3600})
+        return self._json(404, {"code": 404, "message": "Not found"})
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        self._route("GET")
+
+    def do_DELETE(self):  # pylint: disable=invalid-name
+        self._route("DELETE")
+
+    def _route(self, method):
+        url = urlparse(self.path)
+        parts = [unquote(unquote(part)) for part in url.path.strip("/").split("/")]
+        endpoint = "/".join(
+            part if index < 2 or part == "recordings" else "*"
+            for index, part in enumerate(parts)
+        )
+        fake = self.fake
+        with fake.lock:
+            request_number = fake.request_count
+            fake.request_count += 1
+            fake.stats["requests"][f"{method} /{endpoint}"] += 1
+            delay = fake.profile.delay(fake.rng)
+
+        if delay:
+            time.sleep(delay)
+        if not self._authorized(url):
+            return self._json(401, {"code": 124, "message": "Invalid access token."})
+        if fake.profile.throttled(request_number):
+            with fake.lock:
+                fake.stats["faults"]["429"] += 1
+            return self._json(
+                429,
+                {"code": 429, "message": "You have reached the maximum rate limit."},
+                {"Retry-After": str(fake.profile.retry_after)},
+            )
+
+        if method == "GET" and parts[:2] == ["rec", "download"] and len(parts) == 3:
+            return self._download(parts[2])
+        if parts[:1] != ["v2"]:
+            return self._json(404, {"code": 404, "message": "Not found"})
+        route = parts[1:]
+        if method == "GET" and route == ["users"]:
+            return self._json(200, self._users())
+        if (
+            method == "GET"
+            and len(route) == 3
+            and route[::2] == ["users", "recordings"]
+        ):
+            return self._json(200, self._recordings(route[1]))
+        if method == "GET" and len(route) == 2 and route[0] == "past_meetings":
+            return self._meeting(route[1], past=True)
+        if method == "GET" and len(route) == 2 and route[0] == "meetings":
+            return self._meeting(route[1], past=False)
+        if (
+            method == "DELETE"
+            and len(route) == 3
+            and route[::2]
+            == [
+                "meetings",
+                "recordings",
+            ]
+        ):
+            if route[1] not in fake.meetings:
+                return self._json(404, {"code": 3301, "message": "No recording."})
+            fake.deleted.add(route[1])
+            return self._empty(204)
+        return self._json(404, {"code": 404, "message": "Not found"})
+
+    def _authorized(self, url):
+        if self.headers.get("Authorization") == f"Bearer {ACCESS_TOKEN}":
+            return True
+        return parse_qs(url.query).get("access_token") == [ACCESS_TOKEN]
+
+    def _users(self):
+        meeting = self.fake.template["payload"]["object"]
+        return {
+            "page_count": 1,
+            "page_number": 1,
+            "page_size": 300,
+            "total_records": 1,
+            "next_page_token": "",
+            "users": [
+                {
+                    "id": meeting["host_id"],
+                    "email": meeting["host_email"],
+                    "status": "active",
+                }
+            ],
+        }
+
+    def _recordings(self, user_id):
+        meetings = [
+            meeting
+            for meeting_uuid, meeting in self.fake.meetings.items()
+            if meeting_uuid not in self.fake.deleted
+            and user_id in (meeting["host_id"], meeting["host_email"], "me")
+        ]
+        return {
+            "page_size": 300,
+            "total_records": len(meetings),
+            "next_page_token": "",
+            "meetings": meetings,
+        }
+
+    def _meeting(self, meeting_key, past):
+        template = self.fake.template["payload"]["object"]
+        meeting = self.fake.meetings.get(meeting_key)
+        if meeting is None and meeting_key != str(template["id"]):
+            return self._json(404, {"code": 3001, "message": "Meeting does not exist."})
+        meeting = meeting or template
+        start = datetime.strptime(meeting["start_time"], "%Y-%m-%dT%H:%M:%SZ")
+        document = {
+            "uuid": meeting["uuid"],
+            "id": meeting["id"],
+            "host_id": meeting["host_id"],
+            "topic": meeting["topic"],
+            "type": meeting["type"],
+            "start_time": meeting["start_time"],
+            "duration": meeting["duration"],
+        }
+        if past:
+            end = start + timedelta(minutes=meeting["duration"])
+            document["end_time"] = end.strftime("%Y-%m-%dT%H:%M:%SZ")
+            document["participants_count"] = 1
+        else:
+            document["password"] = meeting.get("password", "")
+            document["timezone"] = meeting.get("timezone", "UTC")
+        return self._json(200, document)
+
+    def _download(self, file_id):
+        fake = self.fake
+        if file_id not in fake.files:
+            return self._json(404, {"code": 404, "message": "File does not exist."})
+        body = fake.file_body(file_id)
+        size = len(body)
+        start, end = 0, size - 1
+        status = 200
+        headers = {"Content-Type": "application/octet-stream", "Accept-Ranges": "bytes"}
+        byte_range = self.headers.get("Range", "")
+        if byte_range.startswith("bytes="):
+            first, _, last = byte_range[len("bytes=") :].partition("-")
+            try:
+                start = int(first) if first else size - int(last)
+                end = int(last) if first and last else size - 1
+            except ValueError:
+                start = size
+            if not 0 <= start <= end < size:
+                return self._empty(416, {"Content-Range": f"bytes */{size}"})
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        body = body[start : end + 1]
+
+        profile = fake.profile
+        fault = None
+        for name, rate in (
+            ("reset", profile.reset_rate),
+            ("truncate", profile.truncate_rate),
+            ("stall", profile.stall_rate),
+        ):
+            if rate and fake.decide(rate):
+                fault = name
+                break
+        fault_offset = int(len(body) * profile.fault_at)
+
+        self._start(status, len(body), headers)
+        sent = 0
+        try:
+            while sent < len(body):
+                if fault and sent >= fault_offset:
+                    with fake.lock:
+                        fake.stats["faults"][fault] += 1
+                    if fault == "stall":
+                        time.sleep(profile.stall_seconds)
+                        fault = None
+                        continue
+                    if fault == "reset":
+                        # Close with RST instead of FIN
+                        self.connection.setsockopt(
+                            socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0)
+                        )
+                    self.close_connection = True
+                    return
+                limit = fault_offset if fault and sent < fault_offset else len(body)
+                chunk = body[sent : min(sent + CHUNK_SIZE, limit)]
+                self.wfile.write(chunk)
+                sent += len(chunk)
+                with fake.lock:
+                    fake.stats["bytes_sent"][file_id] += len(chunk)
+                if profile.drip_rate:
+                    time.sleep(len(chunk) / profile.drip_rate)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def _drain_body(self):
+        length = int(self.headers.get("Content-Length", "0") or 0)
+        if length:
+            self.rfile.read(length)
+
+    def _start(self, status, length, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(length))
+        self.end_headers()
+        with self.fake.lock:
+            self.fake.stats["statuses"][status] += 1
+
+    def _json(self, status, document, headers=None):
+        body = json.dumps(document).encode("utf-8")
+        self._start(
+            status,
+            len(body),
+            dict(headers or {}, **{"Content-Type": "application/json"}),
+        )
+        self.wfile.write(body)
+
+    def _empty(self, status, headers=None):
+        self._start(status, 0, headers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="clean")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on")
+    parser.add_argument("--file-size", type=int, help="Recording file size in bytes")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the faults")
+    args = parser.parse_args()
+
+    fake = FakeZoom(
+        PROFILES[args.profile], file_size=args.file_size, seed=args.seed, port=args.port
+    )
+    with fake:
+        webhook = fake.new_recording()
+        print(f"Fake Zoom API at {fake.api_uri} ({args.profile} profile)")
+        print(f"OAuth token endpoint {fake.oauth_uri}; access token {ACCESS_TOKEN}")
+        print("Webhook body for the registered recording:")
+        print(json.dumps(webhook, indent=2))
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+        print(json.dumps(fake.stats, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Check `write_faststart` against S3 (moto in-process) with synthetic MP4 files.
+
+For each size, and for 32-bit (`stco`) and 64-bit (`co64`) chunk offset
+tables, a file from `tools/synthetic_mp4.py` is stored in S3 and rewritten
+by `write_faststart` with the ETag and size that `faststart_recording` would
+pass.  The default sizes cover the ways the new object is written: a
+single `PutObject` below the 5 MiB part minimum, and a multipart upload
+whose first part is the new `moov` topped up to 5 MiB with ranged reads of
+the media, followed by the rest of the media copied server-side with
+`UploadPartCopy`, as a last part smaller (6 MiB) or larger (13 MiB) than
+the minimum.  The rewritten object must:
+
+* have `moov` before `mdat`, and be the size `write_faststart` returned
+* keep the `ContentType` and every byte of the media
+* have every chunk offset pointing at the start of its chunk
+* be left alone by a second `write_faststart`
+
+    python -m tools.faststart_check --sizes 1K,6M,13M
+
+Exits with status 1 if any check fails.
+"""
+import argparse
+import sys
+
+import boto3
+
+from serverless_zoom_recordings.util.mp4_faststart import (
+    read_top_level_atoms,
+    write_faststart,
+)
+from tools._common import in_process_aws
+from tools.synthetic_mp4 import (
+    MARKER,
+    chunk_marker,
+    parse_size,
+    read_chunk_offsets,
+    synthetic_mp4,
+)
+
+BUCKET = "faststart-check"
+CONTENT_TYPE = "video/mp4"
+
+
+def media(data):
+    """The payload of the `mdat` atom of an MP4 file."""
+    for atom_type, offset, size in read_top_level_atoms(
+        lambda start, end: data[start:end], len(data)
+    ):
+        if atom_type == b"mdat":
+            return data[offset + 8 : offset + size]
+    return None
+
+
+def check(s3_client, size, wide):
+    """Rewrite one synthetic file and check the result.
+
+    :returns: tuple, Parts uploaded and parts copied by the multipart upload
+        (both 0 for a single put), and a list of failures
+    """
+    original, _ = synthetic_mp4(size, wide=wide, free=4096 if size > 8192 else 0)
+    key = f"{size}-{'co64' if wide else 'stco'}.mp4"
+    stored = s3_client.put_object(
+        Bucket=BUCKET, Key=key, Body=original, ContentType=CONTENT_TYPE
+    )
+    calls = []
+
+    def count(model, **_):
+        calls.append(model.name)
+
+    s3_client.meta.events.register("before-call.s3.*", count)
+    try:
+        result = write_faststart(
+            s3_client,
+            BUCKET,
+            key,
+            etag=stored["ETag"],
+            file_size=len(original),
+            extra_args={"ContentType": CONTENT_TYPE},
+        )
+    finally:
+        s3_client.meta.events.unregister("before-call.s3.*", count)
+    failures = []
+    if result is None:
+        return (0, 0), ["write_faststart left the file as it was"]
+    response = s3_client.get_object(Bucket=BUCKET, Key=key)
+    rewritten = response["Body"].read()
+    parts = (calls.count("UploadPart"), calls.count("UploadPartCopy"))
+
+    order = [
+        atom[0]
+        for atom in read_top_level_atoms(
+            lambda start, end: rewritten[start:end], len(rewritten)
+        )
+    ]
+    if order.index(b"moov") > order.index(b"mdat"):
+        failures.append(f"moov still after mdat: {order}")
+    if len(rewritten) != result["Size"] or response["ETag"] != result["ETag"]:
+        failures.append(
+            f"stored {len(rewritten)} bytes, {response['ETag']}; "
+            f"write_faststart returned {result}"
+        )
+    if response["ContentType"] != CONTENT_TYPE:
+        failures.append(f"ContentType is {response['ContentType']}")
+    if media(rewritten) != media(original):
+        failures.append("media differs")
+    for track, offsets in enumerate(read_chunk_offsets(rewritten)):
+        for index, offset in enumerate(offsets):
+            if rewritten[offset : offset + MARKER.size] != chunk_marker(track, index):
+                failures.append(f"track {track} chunk {index} offset {offset} is off")
+                break
+    again = write_faststart(
+        s3_client,
+        BUCKET,
+        key,
+        etag=response["ETag"],
+        file_size=len(rewritten),
+    )
+    if again is not None:
+        failures.append("second write_faststart rewrote the file")
+    return parts, failures
+
+
+def run(args):
+    s3_client = boto3.client("s3", region_name="us-east-1")
+    s3_client.create_bucket(Bucket=BUCKET)
+    print(f"{'size':>10}  {'table':<6}{'parts':>6}{'copies':>7}  result")
+    failed = False
+    for size in args.sizes:
+        for wide in (False, True):
+            parts, failures = check(s3_client, size, wide)
+            failed = failed or bool(failures)
+            print(
+                f"{size:>10}  {'co64' if wide else 'stco':<6}"
+                f"{parts[0]:>6}{parts[1]:>7}  " + ("; ".join(failures) or "ok")
+            )
+    if failed:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check write_faststart against moto with synthetic MP4 files"
+    )
+    parser.add_argument(
+        "--sizes",
+        default="1K,6M,13M",
+        type=lambda value: [parse_size(size) for size in value.split(",")],
+        help="Comma-separated file sizes, e.g. 1K,6M,13M",
+    )
+    args = parser.parse_args()
+    with in_process_aws(parser, "install moto to run against an in-process S3"):
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Simulate many `retrieve_recording` workers sharing the download governor.
+
+Each worker thread repeatedly leases a download slot from a
+`DownloadGovernor`, holds it for a simulated download, and releases it.
+Some workers can be made to crash while holding a slot, leaving it for the
+lease to expire.  The lease table lives in DynamoDB Local given with
+`--endpoint-url`, or in moto in-process when no endpoint is given and moto
+is installed.  moto doesn't apply a conditional `UpdateItem` atomically
+when threads call it at once (a moto server doesn't either), so in-process
+requests are made one at a time; only DynamoDB Local tests the conditions
+under real concurrency.
+
+    python -m tools.lease_simulation --workers 40 --capacity 10 --download-time 0.5
+
+Reports the highest number of slots held at once (which must not exceed the
+capacity), queue wait percentiles, and how many downloads gave up waiting.
+"""
+import argparse
+import os
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+import boto3
+
+from serverless_zoom_recordings.util.download_governor import (
+    DownloadGovernor,
+    LeaseUnavailable,
+)
+from tools._common import in_process_aws, percentile
+
+
+def lease_table(endpoint_url):
+    """Create the lease table in the DynamoDB stand-in."""
+    dynamodb = boto3.resource(
+        "dynamodb",
+        endpoint_url=endpoint_url,
+        region_name=os.environ.get("AWS_DEFAULT_REGION", "us-east-1"),
+    )
+    table = dynamodb.create_table(
+        TableName=f"download-leases-{uuid.uuid4().hex[:8]}",
+        KeySchema=[{"AttributeName": "lease_id", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "lease_id", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    table.wait_until_exists()
+    return table
+
+
+class SerializedTable:
+    """
+    Table proxy that makes one `UpdateItem` request at a time.
+
+    :param table: boto3 DynamoDB `Table` resource
+    """
+
+    def __init__(self, table):
+        self._table = table
+        self._lock = threading.Lock()
+
+    def update_item(self, **kwargs):
+        with self._lock:
+            return self._table.update_item(**kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._table, name)
+
+
+def run(args):
+    table = lease_table(args.endpoint_url)
+    if not args.endpoint_url:
+        table = SerializedTable(table)
+    governor = DownloadGovernor(
+        table,
+        args.capacity,
+        lease_seconds=args.lease_seconds,
+        max_wait=args.max_wait,
+        base_delay=args.base_delay,
+    )
+
+    lock = threading.Lock()
+    held = 0
+    peak = 0
+    waits = []
+    outcomes = Counter()
+
+    def download(n):
+        nonlocal held, peak
+        holder = f"worker-{n}"
+        try:
+            lease = governor.acquire(holder)
+        except LeaseUnavailable:
+            with lock:
+                outcomes["gave up waiting"] += 1
+            return
+        with lock:
+            held += 1
+            peak = max(peak, held)
+            waits.append(lease.waited)
+        time.sleep(random.expovariate(1 / args.download_time))
+        with lock:
+            held -= 1
+        if random.random() < args.crash_fraction:
+            # Stop the heartbeat without releasing, as a timed-out Lambda would
+            lease.stop_heartbeat()
+            outcome = "crashed holding a lease"
+        else:
+            lease.release()
+            outcome = "lost lease" if lease.lost else "completed"
+        with lock:
+            outcomes[outcome] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        list(executor.map(download, range(args.downloads)))
+    duration = time.perf_counter() - started
+
+    waits.sort()
+    print(f"downloads:         {args.downloads} in {duration:.2f}s")
+    print(f"capacity:          {args.capacity}")
+    print(f"peak held:         {peak}")
+    print(f"wait p50:          {percentile(waits, 0.50):.3f} s")
+    print(f"wait p95:          {percentile(waits, 0.95):.3f} s")
+    print(f"wait max:          {waits[-1] if waits else float('nan'):.3f} s")
+    for outcome, count in outcomes.most_common():
+        print(f"{outcome + ':':<19}{count}")
+    if peak > args.capacity:
+        raise SystemExit("More slots were held at once than the capacity allows")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Simulate workers sharing the Zoom download governor"
+    )
+    parser.add_argument("--workers", type=int, default=40, help="Worker threads")
+    parser.add_argument("--downloads", type=int, default=200, help="Total downloads")
+    parser.add_argument("--capacity", type=int, default=10, help="Download slots")
+    parser.add_argument(
+        "--download-time", type=float, default=0.5, help="Mean download time (s)"
+    )
+    parser.add_argument(
+        "--lease-seconds", type=int, default=3, help="Lease lifetime (s)"
+    )
+    parser.add_argument(
+        "--max-wait", type=float, default=60, help="Longest wait for a slot (s)"
+    )
+    parser.add_argument(
+        "--base-delay", type=float, default=0.05, help="First backoff delay (s)"
+    )
+    parser.add_argument(
+        "--crash-fraction",
+        type=float,
+        default=0.0,
+        help="Fraction of downloads that never release their slot",
+    )
+    parser.add_argument(
+        "--endpoint-url", help="DynamoDB stand-in, e.g. http://localhost:8000"
+    )
+    args = parser.parse_args()
+
+    context = nullcontext()
+    if not args.endpoint_url:
+        context = in_process_aws(
+            parser, "give --endpoint-url, or install moto to run in-process"
+        )
+    with context:
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Dry-run a rendition policy over the recordings already in the archive.
+
+Reads the Zoom webhook stored by `ingest_metadata` for every recording in
+the recordings bucket, applies the policy, and reports how many bytes the
+policy would not have transferred.
+
+    python -m tools.rendition_report --profile olf --bucket BUCKET --policy policy.json
+"""
+import argparse
+from collections import defaultdict
+
+import boto3
+
+from serverless_zoom_recordings.util.identifiers import parse_organization
+from serverless_zoom_recordings.util.metadata_store import MetadataReader
+from serverless_zoom_recordings.util.rendition_policy import (
+    load_policy,
+    resolve_rule,
+    select_renditions,
+)
+
+
+def recording_webhooks(s3_client, bucket):
+    """Yield the stored webhook of every recording in the bucket."""
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Delimiter="/"):
+        for prefix in page.get("CommonPrefixes", []):
+            recording_id = prefix["Prefix"].rstrip("/")
+            reader = MetadataReader(s3_client, bucket, recording_id)
+            webhook = reader.get("recording.json")
+            if webhook:
+                yield webhook
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--bucket", required=True, help="Recordings bucket")
+    parser.add_argument("--policy", required=True, help="Rendition policy JSON file")
+    parser.add_argument("--profile", help="AWS profile")
+    args = parser.parse_args()
+
+    with open(args.policy, encoding="utf-8") as policy_file:
+        policy = load_policy(policy_file.read())
+    s3_client = boto3.Session(profile_name=args.profile).client("s3")
+
+    totals = defaultdict(lambda: {"recordings": 0, "bytes": 0, "skipped_bytes": 0})
+    skipped_types = defaultdict(int)
+    for webhook in recording_webhooks(s3_client, args.bucket):
+        meeting = webhook["payload"]["object"]
+        organization = parse_organization(meeting["topic"])
+        rule = resolve_rule(policy, organization, meeting["topic"])
+        _, skipped = select_renditions(meeting["recording_files"], rule)
+
+        total = totals[organization]
+        total["recordings"] += 1
+        total["bytes"] += sum(f.get("file_size", 0) for f in meeting["recording_files"])
+        for file in skipped:
+            total["skipped_bytes"] += file["zoom_file_size"]
+            skipped_types[file["recording_type"]] += file["zoom_file_size"]
+
+    print(f"{'organization':<16}{'recordings':>12}{'GiB':>12}{'GiB saved':>12}{'%':>8}")
+    for organization, total in sorted(totals.items()):
+        percent = 100 * total["skipped_bytes"] / total["bytes"] if total["bytes"] else 0
+        print(
+            f"{organization:<16}{total['recordings']:>12}"
+            f"{total['bytes'] / 2**30:>12.2f}{total['skipped_bytes'] / 2**30:>12.2f}"
+            f"{percent:>8.1f}"
+        )
+    print()
+    for recording_type, skipped_bytes in sorted(skipped_types.items()):
+        print(f"skipped {recording_type}: {skipped_bytes / 2**30:.2f} GiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Check that `stream_to_s3` holds a fixed amount of memory whatever the file size.
+
+Streams synthetic files of several sizes into S3 (moto in-process) and
+measures, with `tracemalloc`, the peak memory of the transfer up to the
+`CompleteMultipartUpload` call, and the memory allocated by the streaming
+adapter itself.  moto keeps its parts in temporary files, and tracing stops
+before it assembles the object, so the stand-in's storage isn't counted.
+The peak does include the copies of each in-flight part that botocore and
+moto make when a request is handled in-process rather than sent over HTTP,
+and the reference cycles that hold on to those copies are collected after
+every part, as they would otherwise pile up until the next collection.
+`upload_fileobj`, which `retrieve_recording` used before, is measured the
+same way for comparison.
+
+    python -m tools.streaming_memory_check --sizes 16,48,96 --part-size 5
+
+Fails if the adapter holds more than `buffer_count * part_size`, or if the
+peak grows with the file size.  Pass `--part-size` and `--buffer-count`
+matching `TRANSFER_PART_SIZE_MB` and `TRANSFER_BUFFER_COUNT` to check a
+deployment's settings.
+"""
+import argparse
+import gc
+import io
+import os
+import sys
+import tracemalloc
+
+import boto3
+
+from serverless_zoom_recordings.util import streaming
+from serverless_zoom_recordings.util.streaming import stream_to_s3
+from serverless_zoom_recordings.util.transport import s3_transfer_config
+from tools._common import in_process_aws
+
+BUCKET = "streaming-memory-check"
+MIB = 1024 * 1024
+# Allowance for the peak to vary between file sizes, and for the adapter's
+# own bookkeeping on top of its buffers
+PEAK_TOLERANCE = 1.25
+ADAPTER_OVERHEAD = 64 * 1024
+
+
+class PatternSource(io.RawIOBase):
+    """
+    Readable stream of `size` bytes that repeats a small pattern, so the
+    source itself allocates nothing while it is read.
+    """
+
+    def __init__(self, size, pattern):
+        super().__init__()
+        self._remaining = size
+        self._pattern = pattern
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        count = min(len(b), self._remaining)
+        view = memoryview(b)
+        for start in range(0, count, len(self._pattern)):
+            end = min(count, start + len(self._pattern))
+            view[start:end] = self._pattern[: end - start]
+        self._remaining -= count
+        return count
+
+
+def traced_peak(s3_client, upload):
+    """Run an upload and measure memory until it completes the object.
+
+    :returns: tuple, Peak traced bytes, and bytes allocated by the
+        streaming adapter, both as of the `CompleteMultipartUpload` call
+    """
+    measured = {}
+
+    def measure(**_):
+        if not tracemalloc.is_tracing():
+            return
+        measured["peak"] = tracemalloc.get_traced_memory()[1]
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(True, streaming.__file__)]
+        )
+        measured["adapter"] = sum(stat.size for stat in snapshot.statistics("filename"))
+        tracemalloc.stop()
+
+    def collect(**_):
+        gc.collect()
+
+    events = {
+        "before-call.s3.CompleteMultipartUpload": measure,
+        "after-call.s3.UploadPart": collect,
+    }
+    for event, hook in events.items():
+        s3_client.meta.events.register(event, hook)
+    tracemalloc.start()
+    try:
+        upload()
+    finally:
+        tracemalloc.stop()
+        for event, hook in events.items():
+            s3_client.meta.events.unregister(event, hook)
+    return measured["peak"], measured["adapter"]
+
+
+def run(args):
+    s3_client = boto3.client(
+        "s3", region_name="us-east-1", config=s3_transfer_config(args.buffer_count)
+    )
+    s3_client.create_bucket(Bucket=BUCKET)
+    part_size = args.part_size * MIB
+    bound = args.buffer_count * part_size
+    pattern = bytes(range(256)) * 4096
+
+    print(
+        f"buffer pool: {args.buffer_count} x {args.part_size} MiB = {bound / MIB:.0f} MiB"
+    )
+    print(f"{'upload':<16}{'file MiB':>10}{'peak MiB':>10}{'adapter MiB':>13}")
+    peaks = []
+    failures = []
+    for size in args.sizes:
+        key = f"stream-{size}"
+
+        def upload():
+            transfer = stream_to_s3(
+                PatternSource(size * MIB, pattern),
+                s3_client,
+                BUCKET,
+                key,
+                part_size=part_size,
+                buffer_count=args.buffer_count,
+                expected_size=size * MIB,
+            )
+            assert transfer["Size"] == size * MIB
+
+        peak, adapter = traced_peak(s3_client, upload)
+        peaks.append(peak)
+        print(
+            f"{'stream_to_s3':<16}{size:>10}{peak / MIB:>10.1f}{adapter / MIB:>13.1f}"
+        )
+        if adapter > bound + ADAPTER_OVERHEAD:
+            failures.append(f"adapter held {adapter} bytes of a {size} MiB file")
+
+        if args.compare:
+            peak, _ = traced_peak(
+                s3_client,
+                lambda: s3_client.upload_fileobj(
+                    PatternSource(size * MIB, pattern), BUCKET, f"fileobj-{size}"
+                ),
+            )
+            print(f"{'upload_fileobj':<16}{size:>10}{peak / MIB:>10.1f}{'':>13}")
+
+    if max(peaks) > min(peaks) * PEAK_TOLERANCE:
+        failures.append("peak memory grew with the file size")
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    if failures:
+        sys.exit(1)
+    print("memory stayed within the buffer pool bound")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check the memory bound of the Zoom to S3 streaming adapter"
+    )
+    parser.add_argument(
+        "--sizes",
+        default="16,48,96",
+        type=lambda value: [int(size) for size in value.split(",")],
+        help="Comma-separated file sizes in MiB, each larger than one part",
+    )
+    parser.add_argument("--part-size", type=int, default=5, help="Part size in MiB")
+    parser.add_argument("--buffer-count", type=int, default=3, help="Buffers")
+    parser.add_argument(
+        "--no-compare",
+        dest="compare",
+        action="store_false",
+        help="Skip measuring upload_fileobj",
+    )
+    args = parser.parse_args()
+    # Spool moto's copies of the parts to disk rather than memory
+    os.environ["MOTO_S3_DEFAULT_KEY_BUFFER_SIZE"] = str(64 * 1024)
+    with in_process_aws(parser, "install moto to run against an in-process S3"):
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
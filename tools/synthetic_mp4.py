@@ -0,0 +1,137 @@
+"""
+Generate synthetic MP4 files laid out the way Zoom writes them.
+
+The file is `ftyp`, then `mdat` with the media, then `moov`, whose sample
+tables point at the media with `stco` (or `co64`) chunk offsets.  The media
+is made of fixed-size chunks of interleaved tracks, and each chunk starts
+with a marker naming its track and index, so a reader can check that every
+chunk offset still lands on the right chunk after the file is rewritten.
+Nothing else in the file is valid media: the other atoms have zeroed
+payloads of plausible sizes.
+
+    python -m tools.synthetic_mp4 --size 13M --output recording.mp4
+
+See `tools/faststart_check.py` for the check of `write_faststart` that uses
+these files.
+"""
+import argparse
+import struct
+
+from serverless_zoom_recordings.util.mp4_faststart import (
+    parse_atoms,
+    serialize_atoms,
+)
+
+MARKER = struct.Struct(">8sII")
+MARKER_PREFIX = b"chunk-at"
+FTYP = [b"ftyp", b"isom\x00\x00\x02\x00isomiso2avc1mp41"]
+
+
+def parse_size(value):
+    """Parse a size such as `1024`, `1K` or `13M` into bytes."""
+    units = {"K": 1024, "M": 1024 * 1024, "G": 1024 * 1024 * 1024}
+    value = value.strip().upper()
+    if value[-1:] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def chunk_marker(track, index):
+    """Bytes that start chunk `index` of `track`."""
+    return MARKER.pack(MARKER_PREFIX, track, index)
+
+
+def _moov(chunk_offsets, wide):
+    table_type = b"co64" if wide else b"stco"
+    entry_format = "Q" if wide else "I"
+    traks = []
+    for offsets in chunk_offsets:
+        table = struct.pack(f">4xI{len(offsets)}{entry_format}", len(offsets), *offsets)
+        stbl = [[b"stsd", bytes(64)], [b"stsc", bytes(20)], [table_type, table]]
+        minf = [[b"vmhd", bytes(12)], [b"stbl", stbl]]
+        mdia = [[b"mdhd", bytes(24)], [b"hdlr", bytes(33)], [b"minf", minf]]
+        traks.append([b"trak", [[b"tkhd", bytes(84)], [b"mdia", mdia]]])
+    return serialize_atoms([[b"moov", [[b"mvhd", bytes(100)], *traks]]])
+
+
+def synthetic_mp4(size, tracks=2, chunk_size=None, wide=False, free=0):
+    """Build an MP4 file with `moov` after `mdat`.
+
+    :param size: int, Approximate file size; the media fills what the other
+        atoms leave
+    :param tracks: int, Number of tracks, whose chunks are interleaved
+    :param chunk_size: int, Bytes per chunk; by default the media is split
+        into about 64 chunks per track
+    :param wide: bool, Use 64-bit `co64` chunk offset tables
+    :param free: int, Size of a `free` atom between `mdat` and `moov`, or 0
+        for none
+
+    :returns: tuple, The file as bytes, and the chunk offsets per track
+    """
+    ftyp = serialize_atoms([FTYP])
+    # The size of `moov` depends only on the number of chunks
+    chunk_count = 64
+    moov_size = len(_moov([[0] * chunk_count] * tracks, wide))
+    media_size = max(size - len(ftyp) - 8 - free - moov_size, MARKER.size * tracks)
+    if chunk_size is None:
+        chunk_size = max(media_size // (chunk_count * tracks), MARKER.size)
+    chunk_size = max(chunk_size, MARKER.size)
+    chunk_count = max(media_size // (chunk_size * tracks), 1)
+
+    media_start = len(ftyp) + 8
+    chunk_offsets = [[] for _ in range(tracks)]
+    media = bytearray(media_size)
+    for index in range(chunk_count):
+        for track in range(tracks):
+            start = (index * tracks + track) * chunk_size
+            media[start : start + MARKER.size] = chunk_marker(track, index)
+            chunk_offsets[track].append(media_start + start)
+    atoms = [FTYP, [b"mdat", bytes(media)]]
+    if free:
+        atoms.append([b"free", bytes(free - 8)])
+    data = serialize_atoms(atoms) + _moov(chunk_offsets, wide)
+    return data, chunk_offsets
+
+
+def read_chunk_offsets(data):
+    """Chunk offsets per track of an MP4 file, in track order.
+
+    :param data: bytes, The whole file
+
+    :returns: list, Offsets of each track
+    """
+    offsets = []
+
+    def walk(atoms):
+        for atom_type, payload in atoms:
+            if isinstance(payload, list):
+                walk(payload)
+            elif atom_type in (b"stco", b"co64"):
+                count = struct.unpack_from(">I", payload, 4)[0]
+                entry_format = "I" if atom_type == b"stco" else "Q"
+                offsets.append(
+                    list(struct.unpack_from(f">{count}{entry_format}", payload, 8))
+                )
+
+    walk(parse_atoms(data))
+    return offsets
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", type=parse_size, default="6M", help="e.g. 13M")
+    parser.add_argument("--tracks", type=int, default=2, help="Interleaved tracks")
+    parser.add_argument("--co64", action="store_true", help="64-bit chunk offsets")
+    parser.add_argument("--output", required=True, help="File to write")
+    args = parser.parse_args()
+    data, chunk_offsets = synthetic_mp4(args.size, tracks=args.tracks, wide=args.co64)
+    with open(args.output, "wb") as output:
+        output.write(data)
+    print(
+        f"wrote {len(data)} bytes, {len(chunk_offsets)} tracks of "
+        f"{len(chunk_offsets[0])} chunks, to {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Rebuild per-recording ingest timelines from "Trace span" log lines.
+
+Reads the span lines logged by `@traced` handlers (see
+`serverless_zoom_recordings/util/tracing.py`) from files of log lines,
+such as a CloudWatch Logs export or saved `sls logs` output, or straight
+from the functions' CloudWatch log groups, and prints the critical path of
+each trace: the chain of spans, working back from the last one to finish,
+in which each span is the latest to finish before the next one starts.
+Time on the path between spans is reported as queueing.
+
+    python -m tools.trace_report logs/*.log
+    python -m tools.trace_report --profile olf --hours 24 \\
+        --log-group /aws/lambda/zoom-recordings-prod-zoom_webhook ...
+
+Finishes with percentiles across traces of the time spent in each kind of
+work on the critical path.
+"""
+import argparse
+import json
+import time
+from collections import defaultdict
+
+import boto3
+
+from tools._common import percentile
+
+SPAN_EVENT = "Trace span"
+
+# Kind of work done by each hop; other hops (e.g. a web builder logging its
+# own spans) are reported under their own name.
+HOP_CATEGORIES = {
+    "zoom_webhook": "receipt",
+    "invoke_stepfunction": "receipt",
+    "ingest_metadata": "metadata",
+    "retrieve_recording": "transfer",
+    "faststart_recording": "transfer",
+    "finish_ingest": "finish",
+    "reindex_recording": "finish",
+}
+
+
+def parse_span(line):
+    """The span in a log line, or None if the line isn't a span."""
+    if SPAN_EVENT not in line:
+        return None
+    start = line.find("{")
+    if start < 0:
+        return None
+    try:
+        record, _ = json.JSONDecoder().raw_decode(line[start:])
+    except ValueError:
+        return None
+    if record.get("event") != SPAN_EVENT or "trace_id" not in record:
+        return None
+    return record
+
+
+def spans_from_files(paths):
+    for path in paths:
+        with open(path, encoding="utf-8", errors="replace") as log_file:
+            for line in log_file:
+                span = parse_span(line)
+                if span:
+                    yield span
+
+
+def spans_from_log_groups(logs_client, log_groups, hours):
+    start_time = int((time.time() - hours * 3600) * 1000)
+    paginator = logs_client.get_paginator("filter_log_events")
+    for log_group in log_groups:
+        for page in paginator.paginate(
+            logGroupName=log_group,
+            startTime=start_time,
+            filterPattern=f'"{SPAN_EVENT}"',
+        ):
+            for event in page["events"]:
+                span = parse_span(event["message"])
+                if span:
+                    yield span
+
+
+def critical_path(spans):
+    """The spans on the critical path of a trace, earliest first.
+
+    Works back from the span that finished last.  The predecessor of a span
+    is the latest span to finish before it started or, when none did (a
+    synchronous call), its caller.
+    """
+    by_id = {span["span_id"]: span for span in spans}
+    current = max(spans, key=lambda span: span["end"])
+    path = [current]
+    while True:
+        earlier = [
+            span
+            for span in spans
+            if span["end"] <= current["start"] and span is not current
+        ]
+        if earlier:
+            current = max(earlier, key=lambda span: span["end"])
+        elif current.get("parent_span_id") in by_id:
+            current = by_id[current["parent_span_id"]]
+            if current in path:
+                break
+        else:
+            break
+        path.append(current)
+    return list(reversed(path))
+
+
+def timeline(spans):
+    """Critical path segments of a trace: (label, offset, seconds) tuples."""
+    path = critical_path(spans)
+    origin = min(span["start"] for span in spans)
+    segments = []
+    for span, following in zip(path, path[1:] + [None]):
+        offset = span["start"] - origin
+        if following is not None and following["start"] < span["end"]:
+            # `following` was called synchronously; the rest of this span
+            # waits on it
+            segments.append(
+                (span["reason"], offset, following["start"] - span["start"])
+            )
+            continue
+        segments.append((span["reason"], offset, span["end"] - span["start"]))
+        if following is not None:
+            gap = following["start"] - span["end"]
+            segments.append(("queued", span["end"] - origin, gap))
+    return segments
+
+
+def report(spans_by_trace, show_traces):
+    category_totals = defaultdict(list)
+    totals = []
+    for trace_id, spans in sorted(
+        spans_by_trace.items(), key=lambda item: min(s["start"] for s in item[1])
+    ):
+        segments = timeline(spans)
+        total = max(s["end"] for s in spans) - min(s["start"] for s in spans)
+        totals.append(total)
+        recording_ids = {s["recording_id"] for s in spans if s.get("recording_id")}
+        errors = sum(1 for s in spans if s.get("outcome") != "ok")
+
+        categories = defaultdict(float)
+        for label, _, seconds in segments:
+            categories[HOP_CATEGORIES.get(label, label)] += seconds
+        for category, seconds in categories.items():
+            category_totals[category].append(seconds)
+
+        if not show_traces:
+            continue
+        print(
+            f"trace {trace_id}  recording {', '.join(sorted(recording_ids)) or '?'}"
+            f"  {len(spans)} spans  {errors} failed  total {total:.3f}s"
+        )
+        for label, offset, seconds in segments:
+            print(f"  +{offset:9.3f}s  {label:<24}{seconds:9.3f}s")
+        print()
+
+    if not totals:
+        print("No trace spans found")
+        return
+    print(f"{len(totals)} traces; critical path seconds by kind of work")
+    print(f"{'':<16}{'p50':>10}{'p95':>10}{'max':>10}")
+    rows = sorted(category_totals.items()) + [("total", totals)]
+    for category, values in rows:
+        values = sorted(values)
+        print(
+            f"{category:<16}{percentile(values, 0.50):>10.3f}"
+            f"{percentile(values, 0.95):>10.3f}{values[-1]:>10.3f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("files", nargs="*", help="Files of log lines")
+    parser.add_argument(
+        "--log-group", action="append", default=[], help="CloudWatch log group"
+    )
+    parser.add_argument(
+        "--hours", type=float, default=24, help="Log groups: hours back"
+    )
+    parser.add_argument("--profile", help="AWS profile")
+    parser.add_argument("--trace", help="Only this trace id")
+    parser.add_argument(
+        "--summary", action="store_true", help="Only print the percentiles"
+    )
+    args = parser.parse_args()
+    if not args.files and not args.log_group:
+        parser.error("give log files or --log-group")
+
+    spans_by_trace = defaultdict(list)
+    sources = [spans_from_files(args.files)]
+    if args.log_group:
+        logs_client = boto3.Session(profile_name=args.profile).client("logs")
+        sources.append(spans_from_log_groups(logs_client, args.log_group, args.hours))
+    for source in sources:
+        for span in source:
+            if args.trace and span["trace_id"] != args.trace:
+                continue
+            spans_by_trace[span["trace_id"]].append(span)
+    report(spans_by_trace, show_traces=not args.summary)
+
+
+if __name__ == "__main__":
+    main()
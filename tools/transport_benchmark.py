@@ -0,0 +1,105 @@
+"""
+Measure connection set-up overhead across many small sequential downloads.
+
+Downloads the same small file `--count` times, first with a new
+`requests.Session` per download (as `retrieve_recording` used to), then
+with the container-wide `pooled_session`, and reports the time per download
+and how many connections were opened.  By default the file is served by a
+local keep-alive HTTP server; pass `--url` to measure against a real HTTPS
+endpoint, where the TLS handshake makes the difference larger.
+
+    python -m tools.transport_benchmark --count 200 --size 4096
+"""
+import argparse
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from serverless_zoom_recordings.util.transport import pooled_session
+from tools._common import percentile
+
+
+class SmallFileHandler(BaseHTTPRequestHandler):
+    """Serve a fixed body over HTTP/1.1 keep-alive connections."""
+
+    protocol_version = "HTTP/1.1"
+    # Otherwise delayed ACKs stall the body of every response after the first
+    disable_nagle_algorithm = True
+    body = b""
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with self.lock:
+            SmallFileHandler.connections += 1
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+def time_downloads(url, count, new_session):
+    """Download `url` `count` times; returns the per-download seconds."""
+    timings = []
+    for _ in range(count):
+        started = time.perf_counter()
+        session = requests.Session() if new_session else pooled_session()
+        with session.get(url, stream=True, timeout=10) as response:
+            response.raise_for_status()
+            for _ in response.iter_content(64 * 1024):
+                pass
+        if new_session:
+            session.close()
+        timings.append(time.perf_counter() - started)
+    return sorted(timings)
+
+
+def report(label, timings, connections):
+    print(
+        f"{label:<16}mean {statistics.mean(timings) * 1000:7.2f} ms"
+        f"  p50 {percentile(timings, 0.50) * 1000:7.2f} ms"
+        f"  p95 {percentile(timings, 0.95) * 1000:7.2f} ms"
+        f"  connections {connections}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare per-invocation and pooled HTTP sessions"
+    )
+    parser.add_argument("--count", type=int, default=200, help="Downloads per run")
+    parser.add_argument("--size", type=int, default=4096, help="File size in bytes")
+    parser.add_argument("--url", help="Download this URL instead of a local file")
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if not url:
+        SmallFileHandler.body = b"\0" * args.size
+        server = ThreadingHTTPServer(("127.0.0.1", 0), SmallFileHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}/recording.bin"
+
+    try:
+        for label, new_session in (("new session", True), ("pooled session", False)):
+            opened = SmallFileHandler.connections
+            timings = time_downloads(url, args.count, new_session)
+            connections = SmallFileHandler.connections - opened if server else "n/a"
+            report(label, timings, connections)
+    finally:
+        if server:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
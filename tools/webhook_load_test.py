@@ -0,0 +1,317 @@
+"""
+Load-test the `zoom_webhook` → `invoke_stepfunction` path in-process.
+
+Generates correctly signed `recording.completed` webhooks from
+`sample-messages/zoom-recording-complete.json`, each with a unique meeting
+UUID, and drives them through the two handlers at a fixed rate and
+concurrency.  The Lambda `invoke` between the handlers and the Step
+Functions `start_execution` call are replaced by local stand-ins that can
+add latency (for example to imitate cold starts).
+
+    python -m tools.webhook_load_test --count 50 --rate 25 --concurrency 10
+
+Reports latency percentiles, the error rate, and how many recordings
+started more than one execution (use `--replay-fraction` to resend some
+webhooks the way Zoom does when it doesn't get a timely response).  The
+handler's rate limit of rejected requests defaults to the production
+setting; `--forged-fraction` mixes in requests with forged signatures from
+one flooding address, whose responses are counted separately.
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from tools._common import (
+    SAMPLE_MESSAGE,
+    SECRET_TOKEN,
+    lambda_context,
+    percentile,
+    sign_event,
+    silence_logging,
+)
+
+FLOOD_SOURCE = "203.0.113.66"
+
+
+class StandInZoomClient:
+    """Replaces `zoomus.ZoomClient`, which fetches an OAuth token when built."""
+
+    def __init__(self, *args, **kwargs):
+        self.config = {"token": "load-test-token"}
+
+
+class Latency:
+    """
+    Simulated service latency.
+
+    :param mean: Mean latency in seconds
+    :param cold_start: Extra latency in seconds for a cold start
+    :param cold_start_rate: Fraction of calls that are cold starts
+    """
+
+    def __init__(self, mean=0.0, cold_start=0.0, cold_start_rate=0.0):
+        self.mean = mean
+        self.cold_start = cold_start
+        self.cold_start_rate = cold_start_rate
+
+    def sleep(self):
+        delay = random.expovariate(1 / self.mean) if self.mean else 0.0
+        if random.random() < self.cold_start_rate:
+            delay += self.cold_start
+        if delay:
+            time.sleep(delay)
+
+
+class StandInLambda:
+    """Lambda client whose `invoke` runs the `invoke_stepfunction` handler."""
+
+    def __init__(self, handler, latency):
+        self._handler = handler
+        self._latency = latency
+        self._local = threading.local()
+
+    def invoke(self, FunctionName, Payload, **kwargs):
+        self._latency.sleep()
+        self._local.result = None
+        result = self._handler(json.loads(Payload), lambda_context())
+        self._local.result = result
+        return {
+            "StatusCode": 200,
+            "Payload": io.BytesIO(json.dumps(result).encode("utf-8")),
+        }
+
+    def last_result(self):
+        """The handler's result for the last `invoke` on this thread, or None."""
+        return getattr(self._local, "result", None)
+
+
+class StandInStepFunctions:
+    """Step Functions client that records the executions it is asked to start."""
+
+    def __init__(self, latency):
+        self._latency = latency
+        self._lock = threading.Lock()
+        self.names = set()
+        self.recordings = Counter()
+
+    def start_execution(self, stateMachineArn, name, input, **kwargs):
+        self._latency.sleep()
+        with self._lock:
+            if name in self.names:
+                raise _client_error("ExecutionAlreadyExists", "StartExecution")
+            self.names.add(name)
+            self.recordings[json.loads(input)["_recording_id"]] += 1
+        return {
+            "executionArn": f"{stateMachineArn}:{name}",
+            "ResponseMetadata": {"RequestId": str(uuid.uuid4())},
+        }
+
+
+def _client_error(code, operation):
+    return ClientError({"Error": {"Code": code, "Message": code}}, operation)
+
+
+def load_handlers(lambda_latency, stepfunctions_latency, rate_limit=10, rate_burst=20):
+    """Import the handlers with stand-in configuration and clients.
+
+    :param rate_limit: float, Rejected requests per second allowed per source
+    :param rate_burst: int, Rejected requests allowed per source at once
+
+    :returns: tuple, The `zoom_webhook` handler, and the stand-in Step
+        Functions and Lambda clients
+    """
+    os.environ.update(
+        {
+            "AWS_DEFAULT_REGION": os.environ.get("AWS_DEFAULT_REGION", "us-east-1"),
+            "DEPLOYMENT_STAGE": "loadtest",
+            "BASE_PATH": "loadtest",
+            "ZOOM_WEBHOOK_SECRET_TOKEN": SECRET_TOKEN,
+            "ZOOM_WEBHOOK_RATE_LIMIT": str(rate_limit),
+            "ZOOM_WEBHOOK_RATE_BURST": str(rate_burst),
+            "INVOKE_STEPFUNCTION_ARN": "arn:aws:lambda:loadtest:invoke_stepfunction",
+            "MINIMUM_MEETING_DURATION": "0",
+            "ZOOM_API_KEY": "loadtest",
+            "ZOOM_API_SECRET": "loadtest",
+            "ZOOM_ACCOUNT_ID": "loadtest",
+            "INGEST_ZOOM_RECORDING_STEP_MACHINE": "arn:aws:states:loadtest",
+        }
+    )
+    import zoomus
+
+    zoomus.ZoomClient = StandInZoomClient
+
+    from serverless_zoom_recordings import invoke_stepfunction, zoom_webhook
+
+    # The handlers log every request in detail
+    silence_logging(zoom_webhook, invoke_stepfunction)
+
+    stepfunctions = StandInStepFunctions(stepfunctions_latency)
+    invoke_stepfunction.stepfunction_client = stepfunctions
+    invoked = StandInLambda(invoke_stepfunction.handler, lambda_latency)
+    zoom_webhook.lambda_client = invoked
+    return zoom_webhook.handler, stepfunctions, invoked
+
+
+def signed_webhook(template, source_ip):
+    """Build an HTTP API event carrying a signed webhook for a new meeting."""
+    body = json.loads(json.dumps(template))
+    meeting_uuid = base64.b64encode(uuid.uuid4().bytes).decode("ascii")
+    body["payload"]["object"]["uuid"] = meeting_uuid
+    for recording in body["payload"]["object"]["recording_files"]:
+        recording["meeting_id"] = meeting_uuid
+        recording["id"] = str(uuid.uuid4())
+    body["event_ts"] = int(time.time() * 1000)
+    return sign_event(json.dumps(body), source_ip)
+
+
+def run(args):
+    handler, stepfunctions, invoked = load_handlers(
+        Latency(args.lambda_latency, args.cold_start, args.cold_start_rate),
+        Latency(args.stepfunctions_latency),
+        args.rate_limit,
+        args.rate_burst,
+    )
+    with open(SAMPLE_MESSAGE, encoding="utf-8") as sample:
+        template = json.load(sample)
+    sources = [f"198.51.100.{n}" for n in range(1, args.sources + 1)]
+
+    latencies = []
+    errors = Counter()
+    forged_responses = Counter()
+    lock = threading.Lock()
+    sent_bodies = []
+
+    def send(event, scheduled, forged=False):
+        try:
+            response = handler(event, lambda_context())
+            if response is None:
+                # zoom_webhook returns nothing once it has invoked
+                # invoke_stepfunction, whose response tells how it went
+                response = invoked.last_result()
+            status = int(response["statusCode"]) if response else None
+            if status is None:
+                error = "no response"
+            elif status >= 300:
+                error = f"HTTP {status}"
+            else:
+                error = None
+        except Exception as ex:  # pylint: disable=broad-except
+            error = type(ex).__name__
+        elapsed = time.perf_counter() - scheduled
+        with lock:
+            if forged:
+                forged_responses[error or "accepted"] += 1
+                return
+            latencies.append(elapsed)
+            if error:
+                errors[error] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for n in range(args.count):
+            scheduled = started + n / args.rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            source_ip = random.choice(sources)
+            if random.random() < args.forged_fraction:
+                event = signed_webhook(template, FLOOD_SOURCE)
+                event["headers"]["x-zm-signature"] = "v0=" + "0" * 64
+                executor.submit(send, event, scheduled, True)
+                continue
+            if sent_bodies and random.random() < args.replay_fraction:
+                event = sign_event(random.choice(sent_bodies), source_ip)
+            else:
+                event = signed_webhook(template, source_ip)
+                sent_bodies.append(event["body"])
+            executor.submit(send, event, scheduled)
+    duration = time.perf_counter() - started
+
+    latencies.sort()
+    if not latencies:
+        return
+    duplicates = sum(1 for count in stepfunctions.recordings.values() if count > 1)
+    print(f"requests:          {len(latencies)} in {duration:.2f}s")
+    print(f"throughput:        {len(latencies) / duration:.1f}/s")
+    print(f"latency p50:       {percentile(latencies, 0.50) * 1000:.1f} ms")
+    print(f"latency p95:       {percentile(latencies, 0.95) * 1000:.1f} ms")
+    print(f"latency p99:       {percentile(latencies, 0.99) * 1000:.1f} ms")
+    print(f"latency max:       {latencies[-1] * 1000:.1f} ms")
+    print(f"error rate:        {sum(errors.values()) / max(1, len(latencies)):.2%}")
+    for error, count in errors.most_common():
+        print(f"  {error}: {count}")
+    print(f"executions:        {len(stepfunctions.names)}")
+    print(f"duplicate starts:  {duplicates} recordings")
+    if forged_responses:
+        print(f"forged requests:   {sum(forged_responses.values())}")
+        for response, count in forged_responses.most_common():
+            print(f"  {response}: {count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Load-test zoom_webhook and invoke_stepfunction in-process"
+    )
+    parser.add_argument("--count", type=int, default=50, help="Webhooks to send")
+    parser.add_argument("--rate", type=float, default=50, help="Webhooks per second")
+    parser.add_argument("--concurrency", type=int, default=10, help="Worker threads")
+    parser.add_argument(
+        "--sources", type=int, default=8, help="Distinct source IP addresses"
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=float,
+        default=10,
+        help="Rejected requests per second allowed per source by the handler",
+    )
+    parser.add_argument(
+        "--rate-burst",
+        type=int,
+        default=20,
+        help="Rejected requests allowed per source at once by the handler",
+    )
+    parser.add_argument(
+        "--forged-fraction",
+        type=float,
+        default=0.0,
+        help="Fraction of requests with forged signatures, from one address",
+    )
+    parser.add_argument(
+        "--replay-fraction",
+        type=float,
+        default=0.0,
+        help="Fraction of webhooks that resend an earlier body",
+    )
+    parser.add_argument(
+        "--lambda-latency", type=float, default=0.0, help="Mean invoke latency (s)"
+    )
+    parser.add_argument(
+        "--stepfunctions-latency",
+        type=float,
+        default=0.0,
+        help="Mean start_execution latency (s)",
+    )
+    parser.add_argument(
+        "--cold-start", type=float, default=0.0, help="Cold start latency (s)"
+    )
+    parser.add_argument(
+        "--cold-start-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of invokes that are cold starts",
+    )
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Measure how the Zoom-facing handlers cope with slow and flaky responses.
+
+Runs `ingest_metadata` and `retrieve_recording` in-process against
+`tools.fake_zoom` under each fault profile, with S3 in moto.  Each
+recording's metadata is fetched, and each of its files downloaded, as one
+step function task; a failed task is retried `--task-attempts` times,
+`--retry-interval` seconds apart, as a Step Functions `Retry` would (the
+deployed state machine doesn't retry these tasks, hence the default of 1).
+
+    python -m tools.zoom_fault_report --recordings 5 --file-size 1048576
+    python -m tools.zoom_fault_report --profiles reset,truncate --task-attempts 3
+
+For each profile, reports tasks that succeeded, failed, or stored a file
+that doesn't match what Zoom served; time-to-success percentiles; and the
+download bytes served in total and re-fetched (served beyond the size of
+each file).
+"""
+import argparse
+import functools
+import hashlib
+import os
+import time
+import uuid
+from contextlib import nullcontext
+
+import boto3
+
+from tools.fake_zoom import PROFILES, FakeZoom
+from tools._common import in_process_aws, lambda_context, percentile, silence_logging
+
+BUCKET = "zoom-fault-report"
+
+
+def load_handlers(fake):
+    """Import the handlers, configured to use the fake Zoom and moto S3."""
+    os.environ.update(
+        {
+            "AWS_DEFAULT_REGION": os.environ.get("AWS_DEFAULT_REGION", "us-east-1"),
+            "AWS_ACCESS_KEY_ID": "fault-report",
+            "AWS_SECRET_ACCESS_KEY": "fault-report",
+            "DEPLOYMENT_STAGE": "faultreport",
+            "RECORDINGS_BUCKET": BUCKET,
+            "ZOOM_API_KEY": "fault-report",
+            "ZOOM_API_SECRET": "fault-report",
+            "ZOOM_ACCOUNT_ID": "fault-report",
+        }
+    )
+    import zoomus
+
+    zoomus.ZoomClient = functools.partial(
+        zoomus.ZoomClient, base_uri=fake.api_uri, oauth_uri=fake.oauth_uri
+    )
+
+    from serverless_zoom_recordings import ingest_metadata, retrieve_recording
+
+    # Silence the logging, along with the wire logging of the transfer
+    silence_logging(ingest_metadata, retrieve_recording)
+    retrieve_recording.wire_debug = nullcontext
+    return ingest_metadata, retrieve_recording
+
+
+def run_task(handler, task_input, attempts, retry_interval):
+    """Run a handler as a step function task with retries.
+
+    :returns: tuple, Output (None if every attempt failed), seconds until
+        success or the last failure, and the errors raised
+    """
+    started = time.monotonic()
+    errors = []
+    for attempt in range(1, attempts + 1):
+        try:
+            output = handler(dict(task_input), lambda_context())
+        except Exception as error:  # pylint: disable=broad-except
+            errors.append(type(error).__name__)
+            if attempt < attempts:
+                time.sleep(retry_interval)
+            continue
+        return output, time.monotonic() - started, errors
+    return None, time.monotonic() - started, errors
+
+
+def measure(fake, handlers, recordings, attempts, retry_interval):
+    """Ingest `recordings` new recordings under the fake's current profile."""
+    from serverless_zoom_recordings.util.recording_files import (  # pylint: disable=import-outside-toplevel
+        recordings_map_input,
+    )
+
+    ingest_metadata, retrieve_recording = handlers
+    s3_client = boto3.client("s3")
+    fake.reset_stats()
+    results = {
+        "metadata": {"ok": 0, "failed": 0, "times": [], "errors": []},
+        "download": {"ok": 0, "failed": 0, "corrupt": 0, "times": [], "errors": []},
+    }
+    for _ in range(recordings):
+        webhook = fake.new_recording()
+        recording_id = str(uuid.uuid4())
+        webhook["_recording_id"] = recording_id
+
+        output, seconds, errors = run_task(
+            ingest_metadata.handler, webhook, attempts, retry_interval
+        )
+        result = results["metadata"]
+        result["errors"].extend(errors)
+        if output is None:
+            result["failed"] += 1
+        else:
+            result["ok"] += 1
+            result["times"].append(seconds)
+
+        meeting = webhook["payload"]["object"]
+        map_input = recordings_map_input(
+            meeting["recording_files"], recording_id, webhook["download_token"]
+        )
+        for file_input in map_input:
+            output, seconds, errors = run_task(
+                retrieve_recording.handler, file_input, attempts, retry_interval
+            )
+            result = results["download"]
+            result["errors"].extend(errors)
+            if output is None:
+                result["failed"] += 1
+                continue
+            key = f"{recording_id}/{file_input['recording_type']}"
+            if "extension" in file_input:
+                key += f".{file_input['extension']}"
+            stored = s3_client.get_object(Bucket=BUCKET, Key=key)["Body"].read()
+            expected = fake.file_body(file_input["zoom_file_id"])
+            if hashlib.md5(stored).digest() != hashlib.md5(expected).digest():
+                result["corrupt"] += 1
+                continue
+            result["ok"] += 1
+            result["times"].append(seconds)
+
+    bytes_sent = fake.stats["bytes_sent"]
+    results["download"]["served"] = sum(bytes_sent.values())
+    results["download"]["refetched"] = sum(
+        max(0, sent - fake.files[file_id]) for file_id, sent in bytes_sent.items()
+    )
+    results["faults"] = dict(fake.stats["faults"])
+    return results
+
+
+def report(profile_name, results):
+    print(f"{profile_name}  faults injected: {results['faults'] or 'none'}")
+    for task in ("metadata", "download"):
+        result = results[task]
+        times = sorted(result["times"])
+        line = f"  {task:<9} ok {result['ok']:>3}  failed {result['failed']:>3}"
+        if task == "download":
+            line += f"  corrupt {result['corrupt']:>3}"
+        line += (
+            f"  time-to-success p50 {percentile(times, 0.50):7.2f}s"
+            f"  p95 {percentile(times, 0.95):7.2f}s"
+        )
+        if task == "download":
+            line += (
+                f"  MiB served {result['served'] / 2**20:7.2f}"
+                f"  re-fetched {result['refetched'] / 2**20:7.2f}"
+            )
+        print(line)
+        if result["errors"]:
+            counts = {name: result["errors"].count(name) for name in result["errors"]}
+            print(f"  {'':<9} errors {counts}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--profiles",
+        default="clean,latency,throttle,reset,truncate,drip",
+        help=f"Comma-separated fault profiles, from: {', '.join(sorted(PROFILES))}",
+    )
+    parser.add_argument(
+        "--recordings", type=int, default=5, help="Recordings per profile"
+    )
+    parser.add_argument(
+        "--file-size", type=int, default=1024 * 1024, help="Recording file size (bytes)"
+    )
+    parser.add_argument(
+        "--task-attempts", type=int, default=1, help="Attempts per task"
+    )
+    parser.add_argument(
+        "--retry-interval", type=float, default=1, help="Seconds between attempts"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the faults")
+    args = parser.parse_args()
+    profiles = args.profiles.split(",")
+    unknown = [name for name in profiles if name not in PROFILES]
+    if unknown:
+        parser.error(f"unknown profiles: {', '.join(unknown)}")
+    aws = in_process_aws(
+        parser, "install moto to run the handlers against an in-process S3"
+    )
+    with aws, FakeZoom(file_size=args.file_size, seed=args.seed) as fake:
+        handlers = load_handlers(fake)
+        boto3.client("s3").create_bucket(Bucket=BUCKET)
+        for name in profiles:
+            fake.profile = PROFILES[name]
+            results = measure(
+                fake, handlers, args.recordings, args.task_attempts, args.retry_interval
+            )
+            report(name, results)
+
+
+if __name__ == "__main__":
+    main()